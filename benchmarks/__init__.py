@@ -0,0 +1 @@
+"""Performance benchmarks and load harnesses for the KU Polls project."""
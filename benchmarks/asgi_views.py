@@ -0,0 +1,236 @@
+"""
+Sync versus async views under uvicorn at high concurrency.
+
+Seeds a throwaway database with one open question and a set of logged-in
+voters, then serves `mysite.asgi` with uvicorn twice: once with the sync
+views (ASYNC_VIEWS=False) and once with the native async views. Each run
+drives the detail page, the results page and the vote endpoint with many
+concurrent authenticated clients and reports requests/sec and latency
+percentiles per endpoint as JSON.
+
+Requires uvicorn and httpx (`pip install uvicorn httpx`).
+
+Usage:
+    python -m benchmarks.asgi_views --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .common import BASE_DIR, create_sessions, latency_summary, setup_django
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+def seed(database, users, choices, results):
+    """Create a question, its choices and one session per voter."""
+    setup_django(database, collect_static=True)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    call_command('migrate', verbosity=0)
+    question = Question.objects.create(
+        question_text="Benchmark question",
+        pub_date=timezone.now() - timezone.timedelta(days=1),
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for i in range(choices)
+    )
+    User.objects.bulk_create(
+        User(username=f'bench{i}', password='!') for i in range(users)
+    )
+    session_keys = create_sessions(
+        User.objects.filter(username__startswith='bench')
+    )
+    results.put((
+        str(question.pk),
+        [str(pk) for pk in question.choice_set.values_list('pk', flat=True)],
+        session_keys,
+    ))
+
+
+def free_port():
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, port, async_views, workers=1, **environ):
+    """
+    Start uvicorn serving mysite.asgi and wait until it accepts requests.
+
+    Args:
+        database: Path of the SQLite database to serve.
+        port: Port to listen on.
+        async_views: Serve the native async views.
+        workers: Number of uvicorn worker processes.
+        **environ: Extra environment variables read by mysite.settings.
+    """
+    env = {
+        **os.environ,
+        'DATABASE_NAME': str(database),
+        'ASYNC_VIEWS': str(async_views),
+        'ALLOWED_HOSTS': '127.0.0.1',
+        'LOG_FILE': os.devnull,
+        **{name: str(value) for name, value in environ.items()},
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'mysite.asgi:application',
+         '--port', str(port), '--workers', str(workers),
+         '--log-level', 'warning', '--no-access-log'],
+        cwd=BASE_DIR, env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def drive(port, requests, concurrency, build):
+    """
+    Send `requests` requests, at most `concurrency` at a time.
+
+    Args:
+        port: Port of the server.
+        requests: Total number of requests to send.
+        concurrency: Number of requests in flight at once.
+        build: Callable returning (method, path, cookies, headers, data)
+            for the i-th request.
+
+    Returns:
+        dict: Throughput, latency percentiles and error count. Failed
+        requests and redirects to the login page count as errors.
+    """
+    limits = httpx.Limits(max_connections=concurrency)
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60
+    ) as client:
+        async def one(i):
+            nonlocal errors
+            method, path, cookies, headers, data = build(i)
+            headers = {**(headers or {}), 'Cookie': '; '.join(
+                f'{name}={value}' for name, value in cookies.items()
+            )}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(
+                        method, path, headers=headers, data=data,
+                    )
+                    if response.status_code >= 400 or 'login' in (
+                        response.headers.get('location', '')
+                    ):
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_s': round(requests / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+def run(async_views, args):
+    """Seed a fresh database, start uvicorn and benchmark every endpoint."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / 'asgi.sqlite3'
+        results = multiprocessing.Queue()
+        seeder = multiprocessing.Process(
+            target=seed, args=(database, args.users, args.choices, results)
+        )
+        seeder.start()
+        question_id, choice_ids, session_keys = results.get()
+        seeder.join()
+
+        rng = random.Random(args.seed)
+        csrf_token = secrets.token_hex(16)
+
+        def session(i):
+            return {'sessionid': session_keys[i % len(session_keys)]}
+
+        endpoints = {
+            'detail': lambda i: (
+                'GET', f'/polls/{question_id}/', session(i), None, None
+            ),
+            'results': lambda i: (
+                'GET', f'/polls/{question_id}/results/', session(i),
+                None, None,
+            ),
+            'vote': lambda i: (
+                'POST', f'/polls/{question_id}/vote/',
+                {**session(i), 'csrftoken': csrf_token},
+                {'X-CSRFToken': csrf_token},
+                {'choice': rng.choice(choice_ids)},
+            ),
+        }
+
+        port = free_port()
+        server = start_server(database, port, async_views)
+        try:
+            return {
+                'async_views': async_views,
+                'concurrency': args.concurrency,
+                **{
+                    name: asyncio.run(drive(
+                        port, args.requests, args.concurrency, build
+                    ))
+                    for name, build in endpoints.items()
+                },
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main(argv=None):
+    """Benchmark the sync and async views and print JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000,
+                        help="Requests sent to each endpoint.")
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if httpx is None:
+        parser.error("this benchmark requires: pip install uvicorn httpx")
+    multiprocessing.set_start_method('spawn')
+    report = {'sync': run(False, args), 'async': run(True, args)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
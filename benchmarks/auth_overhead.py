@@ -0,0 +1,106 @@
+"""
+Per-request cost of sessions and user loading.
+
+Sends authenticated requests to a light page (the user management page)
+with database sessions and the plain ModelBackend, then with cached_db
+sessions and mysite.auth.CachedModelBackend, and prints the latency and
+queries per request of both as JSON.
+
+Usage:
+    python -m benchmarks.auth_overhead --users 200 --requests 5000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from .common import create_sessions, latency_summary, setup_django
+
+CONFIGS = {
+    'db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': [
+            'axes.backends.AxesBackend',
+            'django.contrib.auth.backends.ModelBackend',
+        ],
+    },
+    'cached': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': [
+            'axes.backends.AxesBackend',
+            'mysite.auth.CachedModelBackend',
+        ],
+    },
+}
+
+
+def run_config(name, users, args):
+    """
+    Send `args.requests` requests as random users with one configuration.
+
+    Returns:
+        dict: Latency percentiles, query counts and errors.
+    """
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from django.urls import reverse
+
+    rng = random.Random(args.seed)
+    url = reverse('polls:user_manage')
+    latencies, queries = [], []
+    errors = 0
+    with override_settings(**CONFIGS[name]):
+        caches['sessions'].clear()
+        sessions = create_sessions(users)
+        client = Client()
+        for _ in range(args.requests):
+            client.cookies['sessionid'] = rng.choice(sessions)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            if response.status_code != 200:
+                errors += 1
+    return {
+        'requests': args.requests,
+        'errors': errors,
+        **latency_summary(latencies),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+    }
+
+
+def main(argv=None):
+    """Create users, measure both configurations and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(
+            Path(tmp) / 'auth.sqlite3', collect_static=True,
+            ALLOWED_HOSTS='testserver',
+        )
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+
+        call_command('migrate', verbosity=0)
+        User.objects.bulk_create(
+            User(username=f'auth{i}', password='!') for i in range(args.users)
+        )
+        users = list(User.objects.all())
+        report = {name: run_config(name, users, args) for name in CONFIGS}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Helpers shared by the benchmarks."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database=None, collect_static=False, **environ):
+    """
+    Configure Django for the benchmark process.
+
+    Benchmarks run the production profile, so those that render pages
+    need the static files collected into STATIC_ROOT (by default a
+    directory under the system temporary directory that later runs
+    reuse). Collect them once, from a single process: concurrent runs
+    race in the manifest storage's post-processing.
+
+    Args:
+        database: Path of the SQLite database to use instead of db.sqlite3.
+        collect_static: Run collectstatic after setting Django up.
+        **environ: Extra environment variables read by mysite.settings.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'mysite.settings'
+    if database is not None:
+        os.environ['DATABASE_NAME'] = str(database)
+    os.environ.update({name: str(value) for name, value in environ.items()})
+    os.environ.setdefault('LOG_FILE', os.devnull)
+    os.environ.setdefault('DJANGO_ENV', 'production')
+    os.environ.setdefault(
+        'STATIC_ROOT', str(Path(tempfile.gettempdir()) / 'polls-bench-static')
+    )
+    import django
+    from django.core.management import call_command
+    django.setup()
+    if collect_static:
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+
+def create_sessions(users):
+    """
+    Log users in without their password by creating sessions directly.
+
+    Args:
+        users: The User instances to log in.
+
+    Returns:
+        list: One session key per user, usable as the sessionid cookie.
+    """
+    from importlib import import_module
+
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY
+    from django.contrib.auth import SESSION_KEY
+
+    engine = import_module(settings.SESSION_ENGINE)
+    session_keys = []
+    for user in users:
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[-1]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        session_keys.append(session.session_key)
+    return session_keys
+
+
+def percentile(samples, pct):
+    """Return the `pct` percentile of `samples` (nearest-rank)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_summary(samples):
+    """Summarize latencies given in seconds as milliseconds."""
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
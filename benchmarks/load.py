@@ -0,0 +1,252 @@
+r"""
+Synthetic load generator and latency benchmark for the poll pages.
+
+Seeds a database with a configurable number of users, questions, choices
+and votes, then drives the index, detail, results and vote views with the
+Django test client from several threads. For every endpoint it reports
+throughput, p50/p95/p99 latency and the number of queries per request as
+JSON, so that runs of two releases can be diffed. Given a previous report
+with --baseline, it exits with status 1 when an endpoint's p95 latency or
+query count regressed by more than --tolerance.
+
+Seeding runs at roughly 10k votes per second; pass --database to keep
+the seeded database and reuse it in later runs.
+
+Usage:
+    python -m benchmarks.load --users 100000 --questions 100 \\
+        --votes 10000000 --database /tmp/polls-load.sqlite3
+    python -m benchmarks.load --requests 2000 --concurrency 16 \\
+        --output after.json --baseline before.json
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .common import create_sessions, latency_summary, setup_django
+
+ENDPOINTS = ('index', 'detail', 'results', 'vote')
+BATCH_SIZE = 10000
+
+
+def seed(users, questions, choices, votes, seed_value):
+    """
+    Fill an empty database with synthetic polls and votes.
+
+    Each user votes at most once per question, so `votes` is capped at
+    users * questions. Rows are generated and inserted in batches.
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question, Vote
+
+    rng = random.Random(seed_value)
+    now = timezone.now()
+    for start in range(0, users, BATCH_SIZE):
+        User.objects.bulk_create(
+            User(username=f'load{i}', password='!')
+            for i in range(start, min(start + BATCH_SIZE, users))
+        )
+    Question.objects.bulk_create(
+        Question(
+            question_text=f"Load question {i}",
+            pub_date=now - timezone.timedelta(days=1, minutes=i),
+        )
+        for i in range(questions)
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for question in Question.objects.all()
+        for i in range(choices)
+    )
+
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    choice_ids = {}
+    for choice_id, question_id in Choice.objects.values_list(
+        'pk', 'question_id'
+    ):
+        choice_ids.setdefault(question_id, []).append(choice_id)
+    question_ids = list(choice_ids)
+    votes = min(votes, len(user_ids) * len(question_ids))
+    batch = []
+    for i in range(votes):
+        # Walk users first so no (user, question) pair repeats.
+        question_id = question_ids[i // len(user_ids)]
+        batch.append(Vote(
+            user_id=user_ids[i % len(user_ids)],
+            choice_id=rng.choice(choice_ids[question_id]),
+            choice_question_id=question_id,
+        ))
+        if len(batch) == BATCH_SIZE:
+            Vote.objects.bulk_create(batch)
+            batch = []
+    Vote.objects.bulk_create(batch)
+    Vote.objects.rebuild_counts()
+
+
+def run_endpoint(name, targets, args):
+    """
+    Send `args.requests` requests to one endpoint from several threads.
+
+    Returns:
+        dict: Throughput, latency percentiles, query counts and errors.
+    """
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    local = threading.local()
+    lock = threading.Lock()
+    latencies, queries = [], []
+    errors = 0
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.rng = random.Random(args.seed + i)
+        client, rng = local.client, local.rng
+        question_id, choice_ids = rng.choice(targets['questions'])
+        data = None
+        method = client.get
+        if name == 'index':
+            # The index is measured as seen by anonymous visitors.
+            client.cookies.pop('sessionid', None)
+            url = reverse('polls:index')
+        else:
+            client.cookies['sessionid'] = rng.choice(targets['sessions'])
+            url = reverse(f'polls:{name}', args=(question_id,))
+        if name == 'vote':
+            method, data = client.post, {'choice': rng.choice(choice_ids)}
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = method(url, data)
+            elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': args.requests,
+        'errors': errors,
+        'throughput_rps': round(args.requests / elapsed, 1),
+        **latency_summary(latencies),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Return the regressions of `report` against a baseline report.
+
+    An endpoint regresses when its p95 latency or its maximum number of
+    queries per request grew by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p95_ms', 'queries_max'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {metric}: {previous[metric]} -> {current[metric]}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    """Seed, run the load and print the JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--choices', type=int, default=4,
+                        help="Choices per question.")
+    parser.add_argument('--votes', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500,
+                        help="Requests sent to each endpoint.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS,
+                        default=list(ENDPOINTS))
+    parser.add_argument('--sessions', type=int, default=200,
+                        help="Number of logged-in users to send requests as.")
+    parser.add_argument('--database',
+                        help="SQLite file to seed once and reuse.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Also write the report here.")
+    parser.add_argument('--baseline',
+                        help="Previous report to check for regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(args.database or Path(tmp) / 'load.sqlite3')
+        setup_django(
+            database, collect_static=True, ALLOWED_HOSTS='testserver'
+        )
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from polls.models import Choice, Question, Vote
+
+        call_command('migrate', verbosity=0)
+        seed_start = time.perf_counter()
+        if not Question.objects.exists():
+            seed(args.users, args.questions, args.choices, args.votes,
+                 args.seed)
+        seed_seconds = time.perf_counter() - seed_start
+
+        questions = {}
+        for choice_id, question_id in Choice.objects.values_list(
+            'pk', 'question_id'
+        ):
+            questions.setdefault(question_id, []).append(choice_id)
+        sessions = create_sessions(
+            User.objects.order_by('?')[:args.sessions]
+        )
+        targets = {'questions': list(questions.items()), 'sessions': sessions}
+        report = {
+            'config': {
+                key: getattr(args, key)
+                for key in ('requests', 'concurrency', 'sessions')
+            },
+            'data': {
+                'users': User.objects.count(),
+                'questions': Question.objects.count(),
+                'choices': Choice.objects.count(),
+                'votes': Vote.objects.count(),
+            },
+            'seed_s': round(seed_seconds, 1),
+            'endpoints': {
+                name: run_endpoint(name, targets, args)
+                for name in args.endpoints
+            },
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
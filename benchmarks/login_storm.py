@@ -0,0 +1,152 @@
+r"""
+Login throughput and vote latency during a login storm.
+
+Seeds a throwaway database with voters who all share one password, then
+serves `mysite.asgi` with uvicorn, first hashing passwords inline in the
+server workers (PASSWORD_HASHER_WORKERS=0) and then in the process pool
+of mysite.hashers. Each run measures the vote endpoint alone, then sends
+a storm of concurrent logins while the votes keep coming, and reports
+logins per second and the vote latency percentiles as JSON.
+
+Requires uvicorn and httpx (`pip install uvicorn httpx`).
+
+Usage:
+    python -m benchmarks.login_storm --logins 200 --workers 4 \\
+        --hasher-workers 2
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import secrets
+import tempfile
+from pathlib import Path
+
+from .asgi_views import drive, free_port, httpx, start_server
+from .common import create_sessions, setup_django
+
+PASSWORD = 'Storm-Password-42!'
+
+
+def seed(database, users, choices, iterations, results):
+    """Create a question, voters sharing PASSWORD and their sessions."""
+    setup_django(
+        database, collect_static=True,
+        PASSWORD_PBKDF2_ITERATIONS=iterations,
+        PASSWORD_HASHER_WORKERS=0,
+    )
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    call_command('migrate', verbosity=0)
+    question = Question.objects.create(
+        question_text="Benchmark question",
+        pub_date=timezone.now() - timezone.timedelta(days=1),
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for i in range(choices)
+    )
+    encoded = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(username=f'storm{i}', password=encoded) for i in range(users)
+    )
+    results.put((
+        str(question.pk),
+        [str(pk) for pk in question.choice_set.values_list('pk', flat=True)],
+        create_sessions(User.objects.all()),
+    ))
+
+
+async def storm(port, args, login, vote):
+    """Run the logins and the votes at the same time."""
+    logins, votes = await asyncio.gather(
+        drive(port, args.logins, args.login_concurrency, login),
+        drive(port, args.votes, args.vote_concurrency, vote),
+    )
+    return {'logins': logins, 'votes': votes}
+
+
+def run(hasher_workers, args):
+    """Seed a database, start uvicorn and measure votes and logins."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / 'storm.sqlite3'
+        results = multiprocessing.Queue()
+        seeder = multiprocessing.Process(target=seed, args=(
+            database, args.users, 4, args.iterations, results,
+        ))
+        seeder.start()
+        question_id, choice_ids, session_keys = results.get()
+        seeder.join()
+
+        rng = random.Random(args.seed)
+        csrf_token = secrets.token_hex(16)
+        csrf = {'X-CSRFToken': csrf_token}
+
+        def vote(i):
+            return (
+                'POST', f'/polls/{question_id}/vote/',
+                {'sessionid': session_keys[i % len(session_keys)],
+                 'csrftoken': csrf_token},
+                csrf, {'choice': rng.choice(choice_ids)},
+            )
+
+        def login(i):
+            return (
+                'POST', '/accounts/login/', {'csrftoken': csrf_token}, csrf,
+                {'username': f'storm{i % args.users}', 'password': PASSWORD},
+            )
+
+        port = free_port()
+        server = start_server(
+            database, port, False, workers=args.workers,
+            PASSWORD_HASHER_WORKERS=hasher_workers,
+            PASSWORD_PBKDF2_ITERATIONS=args.iterations,
+        )
+        try:
+            quiet = asyncio.run(
+                drive(port, args.votes, args.vote_concurrency, vote)
+            )
+            return {
+                'hasher_workers': hasher_workers,
+                'votes_alone': quiet,
+                **asyncio.run(storm(port, args, login, vote)),
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main(argv=None):
+    """Measure inline and pooled hashing and print JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--login-concurrency', type=int, default=50)
+    parser.add_argument('--votes', type=int, default=500)
+    parser.add_argument('--vote-concurrency', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2,
+                        help="uvicorn worker processes.")
+    parser.add_argument('--hasher-workers', type=int, default=1,
+                        help="Hashing processes of the pooled run.")
+    parser.add_argument('--iterations', type=int, default=870000,
+                        help="PBKDF2 iterations of the stored hashes "
+                             "(at least mysite.hashers.MIN_ITERATIONS).")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if httpx is None:
+        parser.error("this benchmark requires: pip install uvicorn httpx")
+    multiprocessing.set_start_method('spawn')
+    report = {
+        'inline': run(0, args),
+        'pooled': run(args.hasher_workers, args),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
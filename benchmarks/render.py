@@ -0,0 +1,190 @@
+r"""
+Template render time of the index, detail and results pages.
+
+Seeds a throwaway database with a few questions and logged-in users, then
+requests each page as regular users and as staff members through the
+Django test client with the production profile (cached template loader,
+hashed static files), once with the fragment cache disabled and once with
+it enabled. For every page it reports how long rendering the page
+template took, next to the latency of the whole request, as JSON. Run it
+on two revisions to compare their templates.
+
+Usage:
+    python -m benchmarks.render --requests 2000 --users 50
+    python -m benchmarks.render --output after.json
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from .common import create_sessions, latency_summary, setup_django
+
+PAGES = ('index', 'detail', 'results')
+CONFIGS = ('uncached', 'cached')
+
+
+class RenderTimer:
+    """Adds up the time spent in Django template renders per request."""
+
+    def __init__(self):
+        """Create a timer that has not measured anything yet."""
+        self.elapsed = 0.0
+
+    def install(self):
+        """Wrap the Django backend's Template.render to time it."""
+        from django.template.backends.django import Template
+
+        render = Template.render
+        timer = self
+
+        def timed_render(template, context=None, request=None):
+            start = time.perf_counter()
+            try:
+                return render(template, context, request)
+            finally:
+                timer.elapsed += time.perf_counter() - start
+
+        Template.render = timed_render
+
+    def take(self):
+        """Return the time measured since the last call and reset it."""
+        elapsed, self.elapsed = self.elapsed, 0.0
+        return elapsed
+
+
+def seed(questions, choices, users):
+    """
+    Create open questions with choices, and users half of whom are staff.
+
+    Returns:
+        tuple: (question ids, {'user': session keys, 'staff': session keys})
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    pub_date = timezone.now() - timezone.timedelta(days=1)
+    created = Question.objects.bulk_create(
+        Question(question_text=f"Question {i}", pub_date=pub_date)
+        for i in range(questions)
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for question in created for i in range(choices)
+    )
+    User.objects.bulk_create(
+        User(username=f'render{i}', password='!', is_staff=i % 2 == 1)
+        for i in range(users)
+    )
+    users = User.objects.filter(username__startswith='render')
+    sessions = {
+        'user': create_sessions(users.filter(is_staff=False)),
+        'staff': create_sessions(users.filter(is_staff=True)),
+    }
+    return list(Question.objects.values_list('pk', flat=True)), sessions
+
+
+def run(name, question_ids, sessions, timer, args):
+    """
+    Request every page as every role and time the renders.
+
+    Args:
+        name: 'cached', or 'uncached' to replace the fragment cache (if
+            this revision has one) with a dummy cache.
+
+    Returns:
+        dict: Per page and role, render and request latency percentiles.
+    """
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    caches_setting = dict(settings.CACHES)
+    if name == 'uncached' and 'fragments' in caches_setting:
+        caches_setting['fragments'] = {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    with override_settings(CACHES=caches_setting):
+        return _run_pages(question_ids, sessions, timer, args)
+
+
+def _run_pages(question_ids, sessions, timer, args):
+    """Time `args.requests` renders per page and role."""
+    from django.test import Client
+    from django.urls import reverse
+
+    rng = random.Random(args.seed)
+    report = {}
+    for page in PAGES:
+        for role, keys in sessions.items():
+            client = Client()
+            renders, requests = [], []
+            errors = 0
+            for _ in range(args.requests):
+                client.cookies['sessionid'] = rng.choice(keys)
+                if page == 'index':
+                    url = reverse('polls:index')
+                else:
+                    url = reverse(
+                        f'polls:{page}', args=(rng.choice(question_ids),)
+                    )
+                timer.take()
+                start = time.perf_counter()
+                response = client.get(url)
+                requests.append(time.perf_counter() - start)
+                renders.append(timer.take())
+                if response.status_code != 200:
+                    errors += 1
+            report[f'{page}/{role}'] = {
+                'requests': args.requests,
+                'errors': errors,
+                'render': {
+                    **latency_summary(renders),
+                    'mean_ms': round(1000 * sum(renders) / len(renders), 3),
+                },
+                'request': latency_summary(requests),
+            }
+    return report
+
+
+def main(argv=None):
+    """Seed, time the page renders and print the JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help="Requests per page and role.")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--choices', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Also write the report here.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(
+            Path(tmp) / 'render.sqlite3', collect_static=True,
+            DJANGO_ENV='production',
+            ALLOWED_HOSTS='testserver', STATIC_ROOT=Path(tmp) / 'static',
+        )
+        from django.core.management import call_command
+
+        call_command('migrate', verbosity=0)
+        question_ids, sessions = seed(
+            args.questions, args.choices, max(args.users, 2)
+        )
+        timer = RenderTimer()
+        timer.install()
+        report = {
+            name: run(name, question_ids, sessions, timer, args)
+            for name in CONFIGS
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
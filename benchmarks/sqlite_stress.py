@@ -0,0 +1,168 @@
+"""
+Multi-process SQLite stress harness for the vote write path.
+
+Seeds a throwaway database, then runs several worker processes that each
+cast votes as fast as they can, once with the default SQLite configuration
+and once with the production pragmas from `mysite.settings`. Every vote is
+treated as a separate request: without tuning the connection is closed
+after each vote, as it is with CONN_MAX_AGE=0.
+
+Usage:
+    python -m benchmarks.sqlite_stress --workers 8 --votes 500
+"""
+import argparse
+import json
+import multiprocessing
+import queue
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from .common import setup_django as _setup_django
+
+# Seconds to wait for a worker's report before giving up on the run.
+WORKER_TIMEOUT = 600
+
+
+def setup_django(database, tuned):
+    """Configure Django for `database` with or without the SQLite tuning."""
+    _setup_django(database, SQLITE_TUNING='True' if tuned else 'False')
+
+
+def seed(database, users, choices):
+    """Create the schema, a question, its choices and the voters."""
+    setup_django(database, tuned=False)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from polls.models import Choice, Question
+
+    call_command('migrate', verbosity=0)
+    question = Question.objects.create(question_text="Stress question")
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {i}")
+        for i in range(choices)
+    )
+    User.objects.bulk_create(
+        User(username=f'stress{i}', password='!') for i in range(users)
+    )
+
+
+def worker(database, tuned, votes, seed_value, results):
+    """Cast `votes` random votes and report throughput and lock errors."""
+    setup_django(database, tuned)
+    from django.db import OperationalError, connection
+    from polls.models import Choice, Vote
+    from django.contrib.auth.models import User
+
+    rng = random.Random(seed_value)
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    choices = list(Choice.objects.all())
+    connection.close()
+    ok = locked = 0
+    start = time.perf_counter()
+    for _ in range(votes):
+        user = User(pk=rng.choice(user_ids))
+        try:
+            Vote.objects.cast(user, rng.choice(choices))
+            ok += 1
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            locked += 1
+        if not tuned:
+            connection.close()
+    results.put((ok, locked, time.perf_counter() - start))
+
+
+def collect(workers, results):
+    """
+    Wait for one report per worker, failing the run if any worker dies.
+
+    Args:
+        workers: The started worker processes.
+        results: The queue the workers put their reports on.
+
+    Returns:
+        list: The reports, once every worker exited cleanly.
+    """
+    reports = []
+    deadline = time.monotonic() + WORKER_TIMEOUT
+    try:
+        while len(reports) < len(workers):
+            try:
+                reports.append(results.get(timeout=1))
+            except queue.Empty:
+                if any(process.exitcode for process in workers):
+                    break
+                if time.monotonic() > deadline:
+                    break
+    finally:
+        for process in workers:
+            if len(reports) < len(workers):
+                process.terminate()
+            process.join()
+    failed = [process.exitcode for process in workers if process.exitcode]
+    if failed or len(reports) < len(workers):
+        raise SystemExit(
+            f"{len(workers) - len(reports)} of {len(workers)} workers did "
+            f"not report (exit codes: {failed or 'none'})"
+        )
+    return reports
+
+
+def run(tuned, args):
+    """Seed a fresh database and run all workers against it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / 'stress.sqlite3'
+        seeder = multiprocessing.Process(
+            target=seed, args=(database, args.users, args.choices)
+        )
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode:
+            raise SystemExit(f"seeding failed (exit code {seeder.exitcode})")
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(
+                target=worker,
+                args=(database, tuned, args.votes, args.seed + i, results),
+            )
+            for i in range(args.workers)
+        ]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        reports = collect(workers, results)
+        elapsed = time.perf_counter() - start
+    ok = sum(report[0] for report in reports)
+    locked = sum(report[1] for report in reports)
+    attempts = ok + locked
+    return {
+        'tuned': tuned,
+        'workers': args.workers,
+        'votes': ok,
+        'lock_errors': locked,
+        'lock_error_rate': round(locked / attempts, 4) if attempts else 0.0,
+        'elapsed_s': round(elapsed, 3),
+        'votes_per_s': round(ok / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    """Run the harness before and after tuning and print JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--votes', type=int, default=500,
+                        help="Votes cast by each worker.")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    multiprocessing.set_start_method('spawn')
+    report = {'before': run(False, args), 'after': run(True, args)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
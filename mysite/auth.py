@@ -0,0 +1,158 @@
+"""
+Cached user loading for the mysite project.
+
+With the cached_db session engine, a request reads its session from the
+cache. `CachedModelBackend` then also serves the logged-in user from the
+cache, so authenticated pages run no queries for sessions or users. The
+cached user is deleted when the user is saved or deleted (which covers
+username and password changes) and on logout.
+
+Session auth hashes are still checked against the cached user, so a
+password change logs out the user's other sessions as soon as its entry
+is deleted. This needs a cache shared by all processes for
+SESSION_CACHE_ALIAS: a per-process cache only expires the stale copies in
+other processes after AUTH_USER_CACHE_TIMEOUT seconds, so the settings
+fall back to database sessions and PooledModelBackend with one.
+
+`aauthenticate()` is the async counterpart of Django's authenticate(): with
+PooledModelBackend (and CachedModelBackend) the user is loaded with the
+async ORM and the password is verified in the hasher pool without holding
+a thread (see mysite.hashers). The async login and signup views use it.
+"""
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import (
+    _clean_credentials, _get_backends, get_user_model,
+)
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_logged_out, user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from mysite import hashers
+
+_missing = object()
+
+
+def _cache():
+    """Return the cache backend holding sessions and users."""
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _user_key(user_id):
+    """Return the cache key of a user."""
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    """Delete the cached copy of a user."""
+    _cache().delete(_user_key(user_id))
+
+
+async def aset_password(user, raw_password):
+    """Async User.set_password() that hashes in the pool."""
+    user.password = await hashers.amake_password(raw_password)
+    # Tells the password validators about the change on save().
+    user._password = raw_password
+
+
+async def aauthenticate(request=None, **credentials):
+    """
+    Async version of django.contrib.auth.authenticate().
+
+    Backends with an `aauthenticate()` method are awaited; the others run
+    in a thread. As in authenticate(), a PermissionDenied (raised by axes
+    for locked out users) stops the search, and user_login_failed is sent
+    when no backend accepted the credentials.
+    """
+    for backend, backend_path in _get_backends(return_tuples=True):
+        try:
+            inspect.signature(backend.authenticate).bind(request, **credentials)
+        except TypeError:
+            continue
+        try:
+            if hasattr(backend, 'aauthenticate'):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await sync_to_async(backend.authenticate)(
+                    request, **credentials
+                )
+        except PermissionDenied:
+            break
+        if user is None:
+            continue
+        user.backend = backend_path
+        return user
+
+    await user_login_failed.asend(
+        sender=__name__, credentials=_clean_credentials(credentials),
+        request=request,
+    )
+    return None
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend that also authenticates asynchronously."""
+
+    async def aauthenticate(self, request, username=None, password=None,
+                            **kwargs):
+        """Async authenticate() that awaits the hasher pool."""
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget(
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        except UserModel.DoesNotExist:
+            # Hash once anyway, like ModelBackend, so a missing user takes
+            # as long as a wrong password.
+            await hashers.amake_password(password)
+            return None
+
+        async def setter(raw_password):
+            await aset_password(user, raw_password)
+            user._password = None  # An upgrade is not a password change
+            await user.asave(update_fields=['password'])
+
+        if (
+            await hashers.acheck_password(password, user.password, setter)
+            and self.user_can_authenticate(user)
+        ):
+            return user
+        return None
+
+
+class CachedModelBackend(PooledModelBackend):
+    """ModelBackend that loads the users of sessions from the cache."""
+
+    def get_user(self, user_id):
+        """Return the user with `user_id`, from the cache when possible."""
+        cache = _cache()
+        key = _user_key(user_id)
+        user = cache.get(key, _missing)
+        if user is _missing:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_changed_user(sender, instance, **kwargs):
+    """Drop the cached copy of a user that was changed or deleted."""
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    """Drop the cached copy of a user who logged out."""
+    if user is not None:
+        forget_user(user.pk)
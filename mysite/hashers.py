@@ -0,0 +1,226 @@
+"""
+PBKDF2 password hashing in a bounded process pool.
+
+`PooledPBKDF2PasswordHasher` computes the PBKDF2 key of every hash and
+verify in a pool of PASSWORD_HASHER_WORKERS processes instead of the
+request's worker, so a storm of logins and signups uses at most that many
+cores and leaves the rest to the other views. At most
+PASSWORD_HASHER_QUEUE hashes wait for the pool; further callers block
+until a slot frees up (async callers await a slot on their event loop).
+Async code awaits `acheck_password()` and `amake_password()`, which do
+not hold a thread while the key is computed; the async login and signup
+views authenticate through them (see mysite.auth.aauthenticate).
+
+Hashes are ordinary `pbkdf2_sha256` hashes, compatible with Django's
+PBKDF2PasswordHasher. PASSWORD_PBKDF2_ITERATIONS overrides the iteration
+count (see the `calibrate_password_hasher` command), but never below
+MIN_ITERATIONS; stored hashes with fewer iterations are upgraded on the
+next successful login, and hashes with more are kept as they are.
+"""
+import asyncio
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher, get_hasher, identify_hasher, make_password,
+    verify_password,
+)
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import force_bytes
+
+# OWASP's minimum for PBKDF2-HMAC-SHA256 (2023)
+MIN_ITERATIONS = 600000
+
+_pool = None
+_slots = None
+_loop_slots = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+
+
+def _pbkdf2(password, salt, iterations):
+    """Return the PBKDF2-SHA256 key of a password; runs in the pool."""
+    return hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+
+
+def _reset_pool():
+    """Forget the pool inherited from a parent process."""
+    global _pool, _slots
+    _pool = _slots = None
+    _loop_slots.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _get_pool():
+    """
+    Return the process pool and its admission semaphore.
+
+    Returns:
+        tuple: (ProcessPoolExecutor, BoundedSemaphore), or (None, None)
+        when PASSWORD_HASHER_WORKERS is 0 and hashing runs inline.
+    """
+    global _pool, _slots
+    workers = settings.PASSWORD_HASHER_WORKERS
+    if not workers:
+        return None, None
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers do not inherit the threads and locks of
+            # the server process.
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'),
+            )
+            _slots = threading.BoundedSemaphore(
+                workers + settings.PASSWORD_HASHER_QUEUE
+            )
+        return _pool, _slots
+
+
+def _get_loop_slots():
+    """
+    Return the admission semaphore of the running event loop.
+
+    Async callers wait for a slot on their own loop rather than on the
+    threading semaphore, which they could only poll without blocking it.
+    Each loop admits as many callers as the threading semaphore does.
+    """
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        if loop not in _loop_slots:
+            _loop_slots[loop] = asyncio.Semaphore(
+                settings.PASSWORD_HASHER_WORKERS
+                + settings.PASSWORD_HASHER_QUEUE
+            )
+        return _loop_slots[loop]
+
+
+def pbkdf2(password, salt, iterations):
+    """
+    Compute a PBKDF2-SHA256 key in the pool, waiting for the result.
+
+    Args:
+        password: The password, as str or bytes.
+        salt: The salt, as str or bytes.
+        iterations: The iteration count.
+
+    Returns:
+        bytes: The derived key.
+    """
+    args = (force_bytes(password), force_bytes(salt), iterations)
+    pool, slots = _get_pool()
+    if pool is None:
+        return _pbkdf2(*args)
+    with slots:
+        return pool.submit(_pbkdf2, *args).result()
+
+
+async def apbkdf2(password, salt, iterations):
+    """Async version of pbkdf2() that does not block the event loop."""
+    args = (force_bytes(password), force_bytes(salt), iterations)
+    pool, _ = _get_pool()
+    if pool is None:
+        return _pbkdf2(*args)
+    async with _get_loop_slots():
+        return await asyncio.wrap_future(pool.submit(_pbkdf2, *args))
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2PasswordHasher that derives its keys in a process pool."""
+
+    @property
+    def iterations(self):
+        """Return the configured iteration count, at least MIN_ITERATIONS."""
+        iterations = (
+            getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None)
+            or PBKDF2PasswordHasher.iterations
+        )
+        return max(iterations, MIN_ITERATIONS)
+
+    def must_update(self, encoded):
+        """Upgrade hashes with fewer iterations; never lower the count."""
+        return self.decode(encoded)['iterations'] < self.iterations
+
+    def encode(self, password, salt, iterations=None):
+        """Hash a password with the key derived in the pool."""
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        key = pbkdf2(password, salt, iterations)
+        return self._format(key, salt, iterations)
+
+    async def aencode(self, password, salt, iterations=None):
+        """Async version of encode()."""
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        key = await apbkdf2(password, salt, iterations)
+        return self._format(key, salt, iterations)
+
+    async def averify(self, password, encoded):
+        """Async version of verify()."""
+        decoded = self.decode(encoded)
+        encoded_2 = await self.aencode(
+            password, decoded['salt'], decoded['iterations']
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def _format(self, key, salt, iterations):
+        """Return the stored form of a derived key."""
+        key = base64.b64encode(key).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, key)
+
+
+async def amake_password(password):
+    """
+    Hash a password for storage without blocking the event loop.
+
+    The default hasher hashes in the pool; any other falls back to
+    Django's make_password() in a thread.
+    """
+    hasher = get_hasher()
+    if not isinstance(hasher, PooledPBKDF2PasswordHasher):
+        return await sync_to_async(make_password)(password)
+    return await hasher.aencode(password, hasher.salt())
+
+
+async def acheck_password(password, encoded, setter=None):
+    """
+    Check a password against a hash without blocking the event loop.
+
+    Hashes of the pooled hasher are verified in the pool; other hashes
+    fall back to Django's check in a thread.
+
+    Args:
+        password: The raw password.
+        encoded: The stored hash.
+        setter: Optional coroutine function called with the password when
+            the hash must be upgraded.
+
+    Returns:
+        bool: Whether the password matches.
+    """
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    if not isinstance(hasher, PooledPBKDF2PasswordHasher) or password is None:
+        is_correct, must_update = await sync_to_async(verify_password)(
+            password, encoded
+        )
+    else:
+        is_correct = await hasher.averify(password, encoded)
+        preferred = get_hasher()
+        must_update = (
+            hasher.algorithm != preferred.algorithm
+            or preferred.must_update(encoded)
+        )
+    if setter and is_correct and must_update:
+        await setter(password)
+    return is_correct
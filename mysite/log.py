@@ -0,0 +1,180 @@
+"""
+Non-blocking, structured logging for the mysite project.
+
+`QueueFileHandler` hands records to a bounded in-memory queue and returns;
+a background `QueueListener` thread formats them as compact JSON lines
+(`JsonFormatter`) and writes them to a size-rotated file whose old
+generations are gzip-compressed. Request threads therefore never wait on
+disk I/O for logs. When the queue is full, records are dropped and
+counted rather than blocking the request.
+
+`SamplingFilter` keeps only a fraction of the records of high-volume
+loggers, such as one line per vote. All of them are configured through
+`LOGGING` in the settings.
+"""
+import copy
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes every LogRecord has; anything else was passed with `extra`.
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord(
+    '', logging.INFO, '', 0, '', None, None,
+))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one compact JSON object per line."""
+
+    def format(self, record):
+        """Return the record as JSON, with its `extra` fields included."""
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a random fraction of the records of some loggers.
+
+    Args:
+        rates: Map of logger name to the fraction of its records to keep,
+            from 0 to 1. Child loggers use the rate of their closest
+            configured ancestor; other loggers are not sampled.
+        min_level: Records at this level or above are always kept.
+    """
+
+    def __init__(self, rates=None, min_level=logging.WARNING):
+        """Init the filter."""
+        super().__init__()
+        self.rates = {
+            name: float(rate) for name, rate in (rates or {}).items()
+        }
+        self.min_level = logging._checkLevel(min_level)
+
+    def filter(self, record):
+        """Return whether to keep the record."""
+        if record.levelno >= self.min_level:
+            return True
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition('.')[0]
+        return True
+
+
+def _gzip_rotator(source, dest):
+    """Compress a rotated log file."""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.chmod(dest, 0o600)
+    os.remove(source)
+
+
+def _gzip_namer(name):
+    """Name rotated log files with a .gz suffix."""
+    return name + '.gz'
+
+
+class _PrivateRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler whose files only their owner can read."""
+
+    def _open(self):
+        """Open the log file, creating it with mode 0600."""
+        fd = os.open(
+            self.baseFilename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+        )
+        return open(fd, self.mode, encoding=self.encoding, errors=self.errors)
+
+
+class QueueFileHandler(QueueHandler):
+    """
+    Log to a rotating file from a background thread.
+
+    Records are prepared on the calling thread: the message is formatted
+    and any traceback rendered, so the listener never touches objects the
+    request may still change. Only records that pass the level and
+    filters of this handler are formatted at all.
+
+    Args:
+        filename: The log file, created readable by its owner only.
+        max_bytes: Size at which the file is rotated; 0 never rotates.
+        backup_count: Number of compressed rotated files to keep.
+        queue_size: Records buffered before new ones are dropped.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 queue_size=10000):
+        """Start the listener thread; the file is opened on first write."""
+        super().__init__(queue.Queue(queue_size))
+        self.target = _PrivateRotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True,
+        )
+        self.target.rotator = _gzip_rotator
+        self.target.namer = _gzip_namer
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread does not survive a fork (e.g. gunicorn's
+            # --preload); restart it in the child.
+            os.register_at_fork(after_in_child=self._restart)
+
+    def setFormatter(self, fmt):
+        """Format records with `fmt` on the listener thread."""
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Return a copy of the record that is safe to format later."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        """Queue a record, dropping it if the listener is behind."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _restart(self):
+        """Start a fresh listener after a fork."""
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def close(self):
+        """Flush the queued records and close the file."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
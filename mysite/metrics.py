@@ -0,0 +1,161 @@
+"""
+Per-request metrics for the mysite project.
+
+`RequestMetricsMiddleware` opens a RequestMetrics for every request in a
+context variable. Every database connection gets an execute wrapper that
+adds its queries and their duration to the current request, and the
+result caches report their hits and misses through `record_cache()`.
+Context variables follow the request into `sync_to_async` threads, so
+async views are measured the same way as sync ones.
+
+Finished requests are aggregated per URL name in this process; see
+`summary()`.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Statements kept per request for the slow request log.
+MAX_STATEMENTS = 100
+
+_current = ContextVar('request_metrics', default=None)
+_totals_lock = threading.Lock()
+_totals = {}
+
+
+@dataclass
+class RequestMetrics:
+    """What a single request spent its time on."""
+
+    start: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    statements: list = field(default_factory=list)
+
+    def slowest_statements(self, limit):
+        """Return up to `limit` (seconds, sql) pairs, slowest first."""
+        ordered = sorted(self.statements, key=lambda s: s[0], reverse=True)
+        return ordered[:limit]
+
+
+def begin():
+    """
+    Start measuring the current request.
+
+    Returns:
+        A token to pass to end().
+    """
+    return _current.set(RequestMetrics())
+
+
+def end(token):
+    """
+    Stop measuring the current request.
+
+    Returns:
+        RequestMetrics: What the request recorded.
+    """
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+def current():
+    """Return the metrics of the request being served, or None."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper timing every query of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_time += duration
+        if len(metrics.statements) < MAX_STATEMENTS:
+            metrics.statements.append((duration, sql))
+
+
+def record_cache(hit):
+    """Count a cache lookup of the current request as a hit or a miss."""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Time the queries of every new database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def aggregate(name, metrics, elapsed, size):
+    """
+    Add a finished request to the totals of its URL name.
+
+    Args:
+        name: The URL name of the request.
+        metrics: The RequestMetrics of the request.
+        elapsed: Wall time in seconds.
+        size: Response size in bytes, or None for streaming responses.
+    """
+    with _totals_lock:
+        totals = _totals.setdefault(name, {
+            'requests': 0, 'time': 0.0, 'max_time': 0.0, 'queries': 0,
+            'db_time': 0.0, 'cache_hits': 0, 'cache_misses': 0, 'bytes': 0,
+        })
+        totals['requests'] += 1
+        totals['time'] += elapsed
+        totals['max_time'] = max(totals['max_time'], elapsed)
+        totals['queries'] += metrics.queries
+        totals['db_time'] += metrics.db_time
+        totals['cache_hits'] += metrics.cache_hits
+        totals['cache_misses'] += metrics.cache_misses
+        totals['bytes'] += size or 0
+
+
+def summary():
+    """
+    Return the per URL name averages of this process.
+
+    Returns:
+        dict: For each URL name, the request count, mean and max wall time
+        and mean DB time in milliseconds, mean queries, cache hits and
+        misses and mean response size.
+    """
+    with _totals_lock:
+        totals = {name: dict(values) for name, values in _totals.items()}
+    return {
+        name: {
+            'requests': t['requests'],
+            'mean_ms': round(1000 * t['time'] / t['requests'], 2),
+            'max_ms': round(1000 * t['max_time'], 2),
+            'queries_mean': round(t['queries'] / t['requests'], 2),
+            'db_mean_ms': round(1000 * t['db_time'] / t['requests'], 2),
+            'cache_hits': t['cache_hits'],
+            'cache_misses': t['cache_misses'],
+            'bytes_mean': round(t['bytes'] / t['requests']),
+        }
+        for name, t in sorted(totals.items())
+    }
+
+
+def reset():
+    """Clear the aggregated totals."""
+    with _totals_lock:
+        _totals.clear()
@@ -6,6 +6,22 @@ along with stack traces to a logging system.
 """
 
 import logging
+import mimetypes
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+from django.views.static import was_modified_since
+
+from . import metrics
+from .storage import ENCODINGS
+from .routers import pin_primary, replica_aliases
 
 # Set up logger
 logger = logging.getLogger('polls')
@@ -18,15 +34,298 @@ class LogErrorMiddleware:
     Logs the exception details along with stack trace to a logging system.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         """Init the middleware."""
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
         """Call the request and response cycle."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
         return response
 
+    async def __acall__(self, request):
+        """Call the request and response cycle of an async request."""
+        response = await self.get_response(request)
+        return response
+
     def process_exception(self, request, exception):
         """Log the exception if an error occurs during the request/response cycle."""
-        logger.error(f"Unhandled exception: {exception}", exc_info=True)
+        logger.error("Unhandled exception: %s", exception, exc_info=True)
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware that measures where the time of every request goes.
+
+    Records the wall time, the number and duration of database queries,
+    the cache hits and misses and the response size of each request, and
+    aggregates them per URL name (see `mysite.metrics.summary()`).
+    Requests slower than REQUEST_METRICS_SLOW_MS or running more than
+    REQUEST_METRICS_MAX_QUERIES queries are logged with their slowest SQL.
+    Install it first so that it also measures the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Init the middleware."""
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Measure the request and response cycle."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorded = metrics.end(token)
+        self.record(request, response, recorded)
+        return response
+
+    async def __acall__(self, request):
+        """Measure the request and response cycle of an async request."""
+        token = metrics.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            recorded = metrics.end(token)
+        self.record(request, response, recorded)
+        return response
+
+    def record(self, request, response, recorded):
+        """Aggregate a finished request and log it if it is over budget."""
+        elapsed = time.perf_counter() - recorded.start
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        metrics.aggregate(name, recorded, elapsed, size)
+
+        slow = elapsed * 1000 > settings.REQUEST_METRICS_SLOW_MS
+        chatty = recorded.queries > settings.REQUEST_METRICS_MAX_QUERIES
+        if not (slow or chatty):
+            return
+        statements = ''.join(
+            '\n  %.1f ms: %s' % (duration * 1000, sql)
+            for duration, sql in recorded.slowest_statements(
+                settings.REQUEST_METRICS_LOG_SQL
+            )
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, "
+            "cache %d hits/%d misses, %s bytes%s",
+            request.method, request.path, name, elapsed * 1000,
+            recorded.queries, recorded.db_time * 1000,
+            recorded.cache_hits, recorded.cache_misses,
+            'streamed' if size is None else size, statements,
+        )
+
+
+class ReplicaPinningMiddleware:
+    """
+    Middleware that pins a client's reads to the primary after a write.
+
+    Unsafe requests are served from the primary and set a short-lived cookie
+    so that the pages a client loads right after voting, signing up or
+    changing their account do not come from a replica that lags behind.
+    """
+
+    cookie_name = 'pin_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Init the middleware."""
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Pin the request to the primary if it writes or follows a write."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = request.method not in self.safe_methods
+        with pin_primary(writes or self.cookie_name in request.COOKIES):
+            response = self.get_response(request)
+        return self.pin_cookie(response, writes)
+
+    async def __acall__(self, request):
+        """Pin an async request like __call__ pins a sync one."""
+        writes = request.method not in self.safe_methods
+        with pin_primary(writes or self.cookie_name in request.COOKIES):
+            response = await self.get_response(request)
+        return self.pin_cookie(response, writes)
+
+    def pin_cookie(self, response, writes):
+        """Set the pinning cookie on the response to a write."""
+        if writes and replica_aliases():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class StaticFilesMiddleware:
+    """
+    Middleware that serves the files collected into STATIC_ROOT.
+
+    Sends the brotli or gzip variant written by collectstatic (see
+    `mysite.storage`) when the browser accepts it, with `Vary:
+    Accept-Encoding`. Files whose names carry a content hash are cached by
+    browsers for a year as immutable; other files, such as the unhashed
+    copies, are revalidated after STATIC_MAX_AGE seconds. Files are indexed
+    once per process, so run collectstatic before starting the server.
+    Install it right after SecurityMiddleware.
+    """
+
+    immutable_cache_control = 'public, max-age=31536000, immutable'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Init the middleware, unless static files are served elsewhere."""
+        self.get_response = get_response
+        if not settings.STATIC_ROOT or '//' in settings.STATIC_URL:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.strip('/') + '/'
+        self._files = None
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        """Serve static files, pass anything else on."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        entry = self.lookup(request)
+        if entry is not None:
+            return self.serve(request, entry)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        """Serve static files, pass any other async request on."""
+        entry = self.lookup(request)
+        if entry is not None:
+            return self.serve(request, entry)
+        return await self.get_response(request)
+
+    def lookup(self, request):
+        """Return the index entry of the static file requested, if any."""
+        if request.method in ('GET', 'HEAD') and (
+            request.path_info.startswith(self.prefix)
+        ):
+            return self.files().get(request.path_info[len(self.prefix):])
+        return None
+
+    def files(self):
+        """Return the index of the collected files, building it once."""
+        if self._files is None:
+            with self._lock:
+                if self._files is None:
+                    self._files = self.scan()
+        return self._files
+
+    def scan(self):
+        """
+        Index the files under STATIC_ROOT.
+
+        Returns:
+            dict: URL path below STATIC_URL to a dict with the file's path,
+            size, mtime, content type, Cache-Control header and compressed
+            variants as {encoding: (path, size)}.
+        """
+        root = str(settings.STATIC_ROOT)
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        max_age = 'public, max-age=%d' % settings.STATIC_MAX_AGE
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(suffixes):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                content_type, _ = mimetypes.guess_type(filename)
+                files[name] = {
+                    'path': path,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'content_type': content_type or 'application/octet-stream',
+                    'cache_control': (
+                        self.immutable_cache_control if name in hashed
+                        else max_age
+                    ),
+                    'variants': {
+                        encoding: (
+                            path + suffix, os.path.getsize(path + suffix)
+                        )
+                        for encoding, suffix in ENCODINGS
+                        if os.path.exists(path + suffix)
+                    },
+                }
+        return files
+
+    def serve(self, request, entry):
+        """Send a file, or its best variant the client accepts."""
+        accepted = {
+            token.split(';')[0].strip()
+            for token in request.headers.get('Accept-Encoding', '').split(',')
+            if not token.replace(' ', '').endswith(';q=0')
+        }
+        encoding = next(
+            (name for name in entry['variants'] if name in accepted), None
+        )
+        if encoding:
+            path, size = entry['variants'][encoding]
+        else:
+            path, size = entry['path'], entry['size']
+        etag = '"%x-%x%s"' % (
+            int(entry['mtime']), entry['size'],
+            '-' + encoding if encoding else '',
+        )
+        headers = {
+            'Cache-Control': entry['cache_control'],
+            'ETag': etag,
+            'Last-Modified': http_date(entry['mtime']),
+        }
+        if entry['variants']:
+            headers['Vary'] = 'Accept-Encoding'
+        if 'If-None-Match' in request.headers:
+            not_modified = etag in parse_etags(
+                request.headers['If-None-Match']
+            )
+        else:
+            not_modified = not was_modified_since(
+                request.headers.get('If-Modified-Since'), entry['mtime']
+            )
+        if not_modified:
+            response = HttpResponseNotModified()
+        else:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=entry['content_type'])
+            else:
+                response = FileResponse(
+                    open(path, 'rb'), content_type=entry['content_type']
+                )
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        for header, value in headers.items():
+            response[header] = value
+        return response
@@ -0,0 +1,68 @@
+"""
+Database router that sends poll page reads to SQLite read replicas.
+
+Reads are only routed to a replica inside `replica_reads()`, which the
+index, detail and results views enter, and only for models of the polls
+app; sessions and users always come from the primary. Requests that write,
+and the requests that follow them for `DATABASE_REPLICA_PIN_SECONDS`, are
+pinned to the primary with `pin_primary()`.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+REPLICA_APPS = {'polls'}
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads of poll data to go to a replica within the block."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pin_primary(pinned=True):
+    """Keep every read within the block on the primary database."""
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def replica_aliases():
+    """Return the aliases of the configured read replicas."""
+    return getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+
+
+class ReplicaRouter:
+    """Route poll reads to replicas and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        """Pick a random replica for poll reads outside pinned requests."""
+        replicas = replica_aliases()
+        if (replicas and _replica_reads.get() and not _pinned.get()
+                and model._meta.app_label in REPLICA_APPS):
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        """Send every write to the primary."""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations, all aliases hold the same data."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only migrate the primary; replicas are copied from it."""
+        return db == 'default'
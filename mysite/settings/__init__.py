@@ -0,0 +1,22 @@
+"""
+Django settings for mysite project.
+
+DJANGO_ENV picks the profile: 'production' (the default) or
+'development'. Both start from `mysite.settings.base`; see the profile
+modules for what they change.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+DJANGO_ENV = os.environ.get('DJANGO_ENV', 'production').strip().lower()
+
+if DJANGO_ENV == 'production':
+    from .production import *  # noqa: F401,F403
+elif DJANGO_ENV == 'development':
+    from .development import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(
+        "DJANGO_ENV must be 'production' or 'development', "
+        f"not {DJANGO_ENV!r}."
+    )
@@ -0,0 +1,488 @@
+"""
+Django settings shared by the development and production profiles.
+
+Generated by 'django-admin startproject' using Django 4.2. Every value can
+be overridden from the environment; `mysite.settings` picks the profile.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/4.2/ref/settings/
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+_TRUE = {'1', 'true', 'yes', 'on'}
+_FALSE = {'0', 'false', 'no', 'off'}
+
+
+def env_bool(name, default):
+    """
+    Read a boolean from the environment.
+
+    Accepts 1/0, true/false, yes/no and on/off in any case; an unset or
+    empty variable gives `default`.
+
+    Raises:
+        ImproperlyConfigured: If the value is anything else.
+    """
+    value = os.environ.get(name, '').strip().lower()
+    if not value:
+        return default
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ImproperlyConfigured(
+        f"{name} must be true or false, not {os.environ[name]!r}."
+    )
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.environ.get('SECRET_KEY', 'missing-secret-key')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = env_bool('DEBUG', False)
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# Logging: records are written as JSON lines by a background thread, to a
+# file rotated at LOG_MAX_BYTES and gzip-compressed. LOG_VOTE_SAMPLE_RATE
+# is the fraction of per-vote info lines that are kept.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '{asctime} {levelname} {module} {message}',
+            'style': '{',
+            'datefmt': '%Y-%m-%d %H:%M:%S',
+        },
+        'json': {
+            '()': 'mysite.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'mysite.log.SamplingFilter',
+            'rates': {
+                'polls.votes': float(os.environ.get('LOG_VOTE_SAMPLE_RATE', 1)),
+            },
+        },
+    },
+    'handlers': {
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+        'file': {
+            '()': 'mysite.log.QueueFileHandler',
+            'level': LOG_LEVEL,
+            'filename': BASE_DIR / os.environ.get('LOG_FILE', 'debug.log'),
+            'max_bytes': int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+            'backup_count': int(os.environ.get('LOG_BACKUP_COUNT', 5)),
+            'formatter': 'json',
+            'filters': ['sample'],
+        },
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['console', 'file'],
+            'level': LOG_LEVEL,
+            'propagate': True,
+        },
+        'polls': {
+            'handlers': ['console', 'file'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# Application definition
+INSTALLED_APPS = [
+    'polls.apps.PollsConfig',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django_password_validators',  # Ensure this package is installed
+    'axes',  # For rate-limiting authentication attempts
+    'captcha',
+    'sslserver',
+]
+
+MIDDLEWARE = [
+    'mysite.middleware.RequestMetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'mysite.middleware.StaticFilesMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Rate-limiting middleware. Sync-only, so async views still pay one
+    # thread hop for it; the rest of the stack runs natively async.
+    'axes.middleware.AxesMiddleware',
+    'mysite.middleware.ReplicaPinningMiddleware',
+    'mysite.middleware.LogErrorMiddleware',
+]
+
+# Secure headers
+SECURE_HSTS_SECONDS = 31536000  # Enforce HSTS for 1 year
+SECURE_HSTS_INCLUDE_SUBDOMAINS = True
+SECURE_HSTS_PRELOAD = True
+
+SECURE_SSL_REDIRECT = False  # Redirect HTTP to HTTPS
+SECURE_CONTENT_TYPE_NOSNIFF = True  # Prevent MIME sniffing
+SECURE_BROWSER_XSS_FILTER = True  # Enable XSS filter
+SECURE_REFERRER_POLICY = 'strict-origin-when-cross-origin'
+SESSION_COOKIE_SECURE = True  # Secure cookies with HTTPS
+CSRF_COOKIE_SECURE = True
+SESSION_COOKIE_HTTPONLY = True
+CSRF_COOKIE_HTTPONLY = True
+
+X_FRAME_OPTIONS = 'DENY'  # Prevent clickjacking
+
+ROOT_URLCONF = 'mysite.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [BASE_DIR / 'templates'],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'polls.context_processors.fragment_cache',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'mysite.wsgi.application'
+
+# Database
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+    }
+}
+
+# SQLite production mode: WAL lets readers run alongside the single writer,
+# IMMEDIATE transactions take the write lock up front instead of failing on
+# upgrade, and persistent connections skip the per-request connect.
+SQLITE_TUNING = env_bool('SQLITE_TUNING', True)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -20000)),  # KiB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 134217728)),
+    'temp_store': 'MEMORY',
+}
+
+if SQLITE_TUNING:
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    })
+
+# Read replicas: local SQLite copies of the primary refreshed with
+# `manage.py refresh_replicas`. Poll page reads are spread over them.
+DATABASE_REPLICA_ALIASES = [
+    f'replica{i}' for i in range(1, int(os.environ.get('DATABASE_REPLICAS', 0)) + 1)
+]
+for alias in DATABASE_REPLICA_ALIASES:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db-{alias}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['mysite.routers.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 10))
+
+# Caches
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DEFAULT_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('DEFAULT_CACHE_LOCATION', 'polls-default'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DEFAULT_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+    'results': {
+        'BACKEND': os.environ.get(
+            'RESULTS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('RESULTS_CACHE_LOCATION', 'polls-results'),
+        'TIMEOUT': int(os.environ.get('RESULTS_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            # locmem evicts least recently used entries once full
+            'MAX_ENTRIES': int(os.environ.get('RESULTS_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+POLLS_RESULTS_CACHE = 'results'
+
+# Full-page cache of the index and results pages for anonymous visitors.
+# Votes purge pages by bumping generation numbers in this cache, so it must
+# be shared by all processes, such as Redis or Memcached: in a per-process
+# cache a vote would only purge the pages of the process that handled it,
+# so with one the page cache is off (see polls.E003).
+CACHES['pages'] = {
+    'BACKEND': os.environ.get(
+        'PAGE_CACHE_BACKEND',
+        'django.core.cache.backends.locmem.LocMemCache',
+    ),
+    'LOCATION': os.environ.get('PAGE_CACHE_LOCATION', 'polls-pages'),
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1000)),
+    },
+}
+if CACHES['pages']['BACKEND'].endswith(('LocMemCache', 'DummyCache')):
+    POLLS_PAGE_CACHE = None
+else:
+    POLLS_PAGE_CACHE = 'pages'
+
+# Rendered template fragments: the navigation bar of each user (see
+# templates/base.html) and the stylesheet links of each page
+CACHES['fragments'] = {
+    'BACKEND': os.environ.get(
+        'FRAGMENT_CACHE_BACKEND',
+        'django.core.cache.backends.locmem.LocMemCache',
+    ),
+    'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', 'polls-fragments'),
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)),
+    },
+}
+POLLS_FRAGMENT_CACHE_TIMEOUT = int(
+    os.environ.get('FRAGMENT_CACHE_TIMEOUT', 600)
+)
+
+# With a shared backend such as Redis or Memcached, sessions are read from
+# this cache and written through to the database, and the logged-in user is
+# cached next to them (see mysite.auth). A per-process cache would keep
+# logged-out sessions and replaced passwords valid in the other workers, so
+# with one sessions and users are read from the database (see polls.E002).
+CACHES['sessions'] = {
+    'BACKEND': os.environ.get(
+        'SESSION_CACHE_BACKEND',
+        'django.core.cache.backends.locmem.LocMemCache',
+    ),
+    'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'polls-sessions'),
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 10000)),
+    },
+}
+if CACHES['sessions']['BACKEND'].endswith(('LocMemCache', 'DummyCache')):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    _USER_BACKEND = 'mysite.auth.PooledModelBackend'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    _USER_BACKEND = 'mysite.auth.CachedModelBackend'
+SESSION_CACHE_ALIAS = 'sessions'
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))
+POLLS_PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60))
+
+# Serve the detail, results and vote views natively async (set by asgi.py)
+POLLS_ASYNC_VIEWS = env_bool('ASYNC_VIEWS', False)
+
+# Live results stream: pushes per second, keepalive and idle timeout in
+# seconds, and open streams per process
+POLLS_LIVE_MAX_RATE = float(os.environ.get('LIVE_MAX_RATE', 2))
+POLLS_LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+POLLS_LIVE_IDLE_TIMEOUT = float(os.environ.get('LIVE_IDLE_TIMEOUT', 300))
+POLLS_LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 1000))
+
+# Vote ingestion: 'direct' commits every vote, 'buffered' batches them
+POLLS_VOTE_INGESTION = os.environ.get('VOTE_INGESTION', 'direct')
+POLLS_VOTE_BUFFER_SIZE = int(os.environ.get('VOTE_BUFFER_SIZE', 500))
+POLLS_VOTE_BUFFER_DELAY = float(os.environ.get('VOTE_BUFFER_DELAY', 0.5))
+POLLS_VOTE_BUFFER_RETRIES = int(os.environ.get('VOTE_BUFFER_RETRIES', 3))
+
+# Request metrics: requests slower than this many milliseconds or running
+# more queries than this are logged with their slowest SQL statements
+REQUEST_METRICS_SLOW_MS = float(os.environ.get('REQUEST_METRICS_SLOW_MS', 500))
+REQUEST_METRICS_MAX_QUERIES = int(os.environ.get('REQUEST_METRICS_MAX_QUERIES', 30))
+REQUEST_METRICS_LOG_SQL = int(os.environ.get('REQUEST_METRICS_LOG_SQL', 10))
+
+# Password validation
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+        'OPTIONS': {
+            'min_length': 12,
+        },
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'polls.validators.CustomPasswordValidator',
+    },
+]
+
+# Compromised password check: 'api' (Have I Been Pwned), 'offline' (the
+# local corpus built by build_pwned_corpus) or 'off'
+PWNED_PASSWORDS_CHECK = os.environ.get('PWNED_PASSWORDS_CHECK', 'api')
+PWNED_PASSWORDS_FILE = BASE_DIR / os.environ.get(
+    'PWNED_PASSWORDS_FILE', 'pwned-passwords.bin'
+)
+# Range API lookups: timeout in seconds, ranges cached in memory and for
+# how many seconds, and failures in a row that stop lookups for
+# PWNED_PASSWORDS_BREAKER_RESET seconds
+PWNED_PASSWORDS_API_URL = os.environ.get(
+    'PWNED_PASSWORDS_API_URL', 'https://api.pwnedpasswords.com/range/'
+)
+PWNED_PASSWORDS_API_TIMEOUT = float(os.environ.get('PWNED_PASSWORDS_API_TIMEOUT', 2))
+PWNED_PASSWORDS_CACHE_SIZE = int(os.environ.get('PWNED_PASSWORDS_CACHE_SIZE', 4096))
+PWNED_PASSWORDS_CACHE_TTL = int(os.environ.get('PWNED_PASSWORDS_CACHE_TTL', 86400))
+PWNED_PASSWORDS_BREAKER_THRESHOLD = int(os.environ.get('PWNED_PASSWORDS_BREAKER_THRESHOLD', 5))
+PWNED_PASSWORDS_BREAKER_RESET = float(os.environ.get('PWNED_PASSWORDS_BREAKER_RESET', 30))
+
+# Signup CAPTCHAs: keep this many challenges and their images ready per
+# process, refilling below CAPTCHA_POOL_LOW_WATER and at least every
+# CAPTCHA_POOL_INTERVAL seconds (see polls.captchas); 0 creates each
+# challenge on demand. Challenges live CAPTCHA_TIMEOUT minutes and are not
+# handed out in their last CAPTCHA_GET_FROM_POOL_TIMEOUT minutes.
+CAPTCHA_POOL_SIZE = int(os.environ.get('CAPTCHA_POOL_SIZE', 0))
+CAPTCHA_POOL_LOW_WATER = int(os.environ.get('CAPTCHA_POOL_LOW_WATER', CAPTCHA_POOL_SIZE // 4))
+CAPTCHA_POOL_INTERVAL = float(os.environ.get('CAPTCHA_POOL_INTERVAL', 60))
+CAPTCHA_TIMEOUT = int(os.environ.get('CAPTCHA_TIMEOUT', 15))
+CAPTCHA_GET_FROM_POOL_TIMEOUT = 5
+# Expired challenges are then deleted by the pool, not on every validation
+CAPTCHA_GET_FROM_POOL = CAPTCHA_POOL_SIZE > 0
+CACHES['captchas'] = {
+    'BACKEND': os.environ.get(
+        'CAPTCHA_CACHE_BACKEND',
+        'django.core.cache.backends.locmem.LocMemCache',
+    ),
+    'LOCATION': os.environ.get('CAPTCHA_CACHE_LOCATION', 'polls-captchas'),
+    'OPTIONS': {
+        # Images of challenges handed out stay until they expire
+        'MAX_ENTRIES': 8 * CAPTCHA_POOL_SIZE + 100,
+    },
+}
+# Per-process by default: with several processes, share it so that images
+# are found whichever process serves them (checked by polls.W011).
+CAPTCHA_IMAGE_CACHE = 'captchas'
+
+# Authentication backends
+AUTHENTICATION_BACKENDS = [
+    'axes.backends.AxesBackend',
+    _USER_BACKEND,
+]
+
+LOGIN_REDIRECT_URL = '/polls/'
+LOGOUT_REDIRECT_URL = '/polls/'
+
+# Internationalization
+LANGUAGE_CODE = 'en-us'
+TIME_ZONE = os.environ.get('TIME_ZONE', 'UTC')
+USE_I18N = True
+USE_TZ = True
+
+# Security related
+SECURE_BROWSER_XSS_FILTER = True
+SECURE_CONTENT_TYPE_NOSNIFF = True
+SESSION_COOKIE_SECURE = env_bool('SESSION_COOKIE_SECURE', True)
+CSRF_COOKIE_SECURE = env_bool('CSRF_COOKIE_SECURE', True)
+SESSION_COOKIE_AGE = 1800  # 30 minutes
+SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+SESSION_COOKIE_HTTPONLY = True
+
+# Static files (CSS, JavaScript, Images)
+STATIC_URL = '/static/'
+STATICFILES_DIRS = [
+    BASE_DIR / "polls/static",
+]
+# collectstatic copies the files here under content-hashed names with
+# gzip and brotli variants (see mysite.storage), and StaticFilesMiddleware
+# serves them; unhashed names are cached for STATIC_MAX_AGE seconds
+STATIC_ROOT = BASE_DIR / os.environ.get('STATIC_ROOT', 'staticfiles')
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 3600))
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'mysite.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Axes settings for rate-limiting
+AXES_FAILURE_LIMIT = 5
+AXES_COOLOFF_TIME = 1  # Lockout time in hours
+AXES_ONLY_USER_FAILURES = True
+
+if 'test' in sys.argv:
+    AXES_ENABLED = False
+    # Page cache tests enable it explicitly; elsewhere it would leak pages
+    # between test cases.
+    POLLS_PAGE_CACHE = None
+    # Tests run without collectstatic, so there is no manifest to read.
+    STORAGES['staticfiles']['BACKEND'] = (
+        'django.contrib.staticfiles.storage.StaticFilesStorage'
+    )
+
+# PBKDF2 keys are derived in this many worker processes (0 hashes inline),
+# with at most PASSWORD_HASHER_QUEUE more hashes waiting for them; see
+# mysite.hashers. Set the iteration count with calibrate_password_hasher;
+# counts below mysite.hashers.MIN_ITERATIONS are raised to it.
+PASSWORD_HASHER_WORKERS = int(os.environ.get(
+    'PASSWORD_HASHER_WORKERS', max((os.cpu_count() or 2) // 2, 1)
+))
+PASSWORD_HASHER_QUEUE = int(os.environ.get('PASSWORD_HASHER_QUEUE', 32))
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0)
+) or None
+
+PASSWORD_HISTORY_COUNT = 5  # Prevent reuse of last 5 passwords
+
+PASSWORD_HASHERS = [
+    'mysite.hashers.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
@@ -0,0 +1,12 @@
+"""
+Development profile: DEBUG on unless DEBUG=false is set.
+
+Templates are re-read on every request and every SQL query is kept for
+the debug pages, so do not serve real traffic with this profile.
+"""
+from .base import *  # noqa: F401,F403
+from .base import env_bool
+
+DEBUG = env_bool('DEBUG', True)
+
+INTERNAL_IPS = ['127.0.0.1', '::1']
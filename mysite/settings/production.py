@@ -0,0 +1,43 @@
+"""
+Production profile: DEBUG off, whatever the environment says.
+
+Templates are compiled once per process by the cached loader, the debug
+context processor is dropped and database connections are kept open
+between requests. `manage.py check --deploy` and the ASGI/WSGI entry
+points report settings that would still slow the site down (see
+polls.checks).
+"""
+import os
+
+from .base import *  # noqa: F401,F403
+from .base import DATABASES, TEMPLATES
+
+DEBUG = False
+
+TEMPLATES = [
+    {
+        **backend,
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **backend['OPTIONS'],
+            'context_processors': [
+                processor
+                for processor in backend['OPTIONS']['context_processors']
+                if processor != 'django.template.context_processors.debug'
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    }
+    for backend in TEMPLATES
+]
+
+for database in DATABASES.values():
+    database.setdefault(
+        'CONN_MAX_AGE', int(os.environ.get('CONN_MAX_AGE', 600))
+    )
+    database.setdefault('CONN_HEALTH_CHECKS', True)
@@ -0,0 +1,91 @@
+"""
+Static files storage that precompresses what collectstatic collects.
+
+`CompressedManifestStaticFilesStorage` stores every static file under a
+name containing a hash of its content (see ManifestStaticFilesStorage), so
+a changed file gets a new URL and browsers can cache the old one forever.
+It also writes a gzip (`.gz`) and, when the `brotli` package is installed,
+a brotli (`.br`) variant next to each compressible file, which
+`mysite.middleware.StaticFilesMiddleware` serves to browsers that accept
+them without compressing anything per request.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Formats that are already compressed (images, woff2) gain nothing.
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml',
+    '.html', '.ico', '.ttf', '.otf', '.eot',
+}
+MIN_COMPRESS_SIZE = 256
+
+# Preferred encoding first: (Content-Encoding, file suffix).
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli else [('gzip', '.gz')]
+
+
+def compress(data, encoding):
+    """Return `data` compressed with `encoding` at its best level."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical across runs.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def write_variants(path):
+    """
+    Write the compressed variants of a file that are worth keeping.
+
+    A variant is kept only if it saves at least 5% of the file's size.
+
+    Args:
+        path: Filesystem path of the file.
+
+    Returns:
+        list: The encodings written.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for encoding, suffix in ENCODINGS:
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(encoding)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz and .br variants."""
+
+    def stored_name(self, name):
+        """
+        Return the hashed name of a collected file.
+
+        Before collectstatic has written a manifest, the plain name is
+        returned instead of raising, so pages still render (polls.W010
+        reports the missing manifest).
+        """
+        if not self.hashed_files and not self.manifest_hash:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        """Hash the collected files, then compress the hashed copies."""
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            extension = os.path.splitext(name)[1].lower()
+            if extension not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = self.path(name)
+            if os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                write_variants(path)
@@ -0,0 +1,35 @@
+"""Test helpers shared by the test suites of the mysite project."""
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that fails a test when code runs too many queries."""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        """
+        Fail if the block runs more than `budget` queries.
+
+        Unlike assertNumQueries(), using fewer queries passes, so budgets do
+        not have to be updated when a view gets cheaper. The failure message
+        lists every query that ran.
+
+        Args:
+            budget: The maximum number of queries allowed.
+            using: The database alias to count queries on.
+        """
+        with CaptureQueriesContext(connections[using]) as captured:
+            yield captured
+        executed = len(captured)
+        if executed > budget:
+            queries = '\n'.join(
+                f"{i}. {query['sql']}"
+                for i, query in enumerate(captured.captured_queries, start=1)
+            )
+            self.fail(
+                f"{executed} queries executed, budget is {budget}\n"
+                f"Captured queries were:\n{queries}"
+            )
@@ -14,19 +14,33 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic.base import RedirectView
 from django.contrib.auth import views as auth_views
 
-from polls import views
+from polls import async_views, captchas, views
+
+# Under ASGI the login page awaits the password hasher pool
+login_view = (
+    async_views.login if settings.POLLS_ASYNC_VIEWS
+    else auth_views.LoginView.as_view()
+)
 
 urlpatterns = [
     path('', RedirectView.as_view(url='/polls/', permanent=False)),
     path('polls/', include('polls.urls')),
     path('admin/', admin.site.urls),
+    path('accounts/login/', login_view, name='login'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
+    # Served from the CAPTCHA pool before django-simple-captcha's views.
+    re_path(r'^captcha/image/(?P<key>\w+)/$', captchas.image,
+            kwargs={'scale': 1}),
+    re_path(r'^captcha/image/(?P<key>\w+)@2/$', captchas.image,
+            kwargs={'scale': 2}),
+    path('captcha/refresh/', captchas.refresh),
     path('captcha/', include('captcha.urls')),
     path('consent/', views.consent_submission, name='consent_submission'),
 ]
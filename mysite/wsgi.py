@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_wsgi_application()
+
+# Log settings that would slow the site down (see polls.checks).
+from polls.checks import report  # noqa: E402
+
+report()
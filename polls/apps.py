@@ -18,3 +18,16 @@ class PollsConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        """
+        Connect the project's signal receivers and register its checks.
+
+        Queries are timed from the first database connection on, and
+        cached users and pages are forgotten whenever a user or a poll is
+        changed, including from management commands.
+        """
+        import mysite.auth  # noqa: F401
+        import mysite.metrics  # noqa: F401
+        from . import checks  # noqa: F401
+        from . import pagecache  # noqa: F401
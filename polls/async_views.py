@@ -0,0 +1,306 @@
+"""
+Native async versions of the detail, results, vote, login and signup views.
+
+They are routed instead of their synchronous counterparts in
+`polls.views` (and Django's LoginView) when `POLLS_ASYNC_VIEWS` is
+enabled, which is the default under ASGI. Reads use the async ORM; the
+vote write runs its transaction through `sync_to_async`, since
+transactions are not available in async code. Login and signup await the
+password hasher pool instead of holding a thread (see mysite.hashers).
+The user is resolved with `request.auser()` and stored on the request, so
+templates never touch the database from the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import alogin
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import aprefetch_related_objects
+from django.http import (
+    Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404, redirect, render, resolve_url
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views import View
+from django.views.decorators.cache import never_cache
+from django.views.decorators.debug import sensitive_post_parameters
+
+from mysite.auth import aauthenticate
+from mysite.routers import replica_reads
+from . import cache as results_cache
+from . import ingest
+from . import live
+from . import pagecache
+from .forms import AsyncAuthenticationForm, CustomSignupForm
+from .models import Choice, Question, Vote
+from .pagecache import cache_anonymous_page
+from .views import get_client_ip, logger, published_questions, vote_logger
+
+
+async def _aload_user(request):
+    """Resolve the user asynchronously and keep it on the request."""
+    request.user = await request.auser()
+    return request.user
+
+
+async def _not_found(request):
+    """Redirect to the index with a message when a question is missing."""
+    logger.error("Question not found: No question found matching the query")
+    messages.error(request, "The poll you are looking for does not exist.")
+    return redirect('polls:index')
+
+
+class DetailView(View):
+    """Async view of the question page."""
+
+    async def get(self, request, pk):
+        """Handle GET requests."""
+        user = await _aload_user(request)
+        with replica_reads():
+            question = await published_questions(user).filter(pk=pk).afirst()
+            if question is None:
+                return await _not_found(request)
+            if not question.is_published():
+                messages.error(request, "This poll is not published yet.")
+                return redirect('polls:index')
+            if not question.can_vote():
+                messages.error(request, "This poll is not allowed for voting.")
+                return redirect('polls:index')
+            await aprefetch_related_objects([question], 'choice_set')
+
+        user_choice_id = getattr(question, 'user_choice_id', None)
+        if user.is_authenticated and ingest.is_enabled():
+            pending_choice_id = ingest.get_buffer().pending_choice(
+                user.pk, question.pk
+            )
+            if pending_choice_id is not None:
+                user_choice_id = pending_choice_id
+
+        return render(request, 'polls/detail.html', {
+            'object': question,
+            'question': question,
+            'user_choice_id': user_choice_id,
+        })
+
+
+class ResultsView(View):
+    """Async view of the result page."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """Serve anonymous visitors from the page cache."""
+        return cache_anonymous_page(super().as_view(**initkwargs))
+
+    async def get(self, request, pk):
+        """Handle GET requests."""
+        await _aload_user(request)
+        with replica_reads():
+            question = await Question.objects.filter(pk=pk).afirst()
+            if question is None:
+                return await _not_found(request)
+            results = await results_cache.aget_results(question)
+
+        results_table = await results_cache.aget_fragment(
+            question, 'table',
+            lambda: render_to_string(
+                'polls/results_table.html', {'results': results}
+            )
+        )
+        return render(request, 'polls/results.html', {
+            'object': question,
+            'question': question,
+            'results': results,
+            'results_table': results_table,
+        })
+
+
+async def results_stream(request, pk):
+    """
+    Stream the live results of a question as Server-Sent Events.
+
+    Under ASGI the stream stays open and pushes tally deltas as votes come
+    in; under WSGI it sends the current results once and lets the browser
+    reconnect at the advertised retry interval.
+    """
+    question = await Question.objects.filter(pk=pk).afirst()
+    if question is None:
+        raise Http404("No question found matching the query")
+    if not isinstance(request, ASGIRequest):
+        results = await results_cache.aget_results(question)
+        response = HttpResponse(
+            live.poll_response(results), content_type='text/event-stream'
+        )
+    elif live.is_full():
+        return HttpResponse(status=503, headers={'Retry-After': '30'})
+    else:
+        response = StreamingHttpResponse(
+            live.stream_results(question.pk),
+            content_type='text/event-stream',
+        )
+        response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def _render_detail_error(request, question, message):
+    """Render the detail page of `question` with an error message."""
+    await aprefetch_related_objects([question], 'choice_set')
+    messages.error(request, message)
+    return render(request, 'polls/detail.html', {'question': question})
+
+
+@login_required
+async def vote(request, question_id):
+    """Handle the voting process for a given question."""
+    user = await _aload_user(request)
+    ip_addr = get_client_ip(request)
+
+    vote_logger.info(
+        "User %s voted from IP %s on question %s",
+        user.username, ip_addr, question_id,
+        extra={'user': user.username, 'ip': ip_addr, 'question': question_id},
+    )
+
+    choice_id = request.POST.get('choice')
+    selected_choice = None
+    if choice_id:
+        try:
+            selected_choice = await Choice.objects.select_related(
+                'question'
+            ).filter(pk=choice_id, question_id=question_id).afirst()
+        except ValidationError:
+            selected_choice = None
+    if selected_choice is not None:
+        question = selected_choice.question
+    else:
+        question = await aget_object_or_404(Question, pk=question_id)
+
+    if not question.can_vote():
+        vote_logger.warning(
+            "User %s tried to vote on a closed poll %s",
+            user.username, question_id,
+        )
+        return await _render_detail_error(
+            request, question, "This poll is not allowed for voting."
+        )
+    if choice_id is None:
+        vote_logger.warning(
+            "Choice ID not found in POST data for user %s", user.username
+        )
+        return await _render_detail_error(
+            request, question, "You didn't select a valid choice."
+        )
+    if selected_choice is None:
+        vote_logger.warning(
+            "Invalid choice ID for question %s by user %s",
+            question_id, user.username,
+        )
+        return await _render_detail_error(
+            request, question, "Invalid choice selection."
+        )
+
+    # As in views.vote, buffered voters go to the detail page.
+    next_page = 'polls:results'
+    if ingest.is_enabled():
+        previous_choice_id = await sync_to_async(ingest.queue_vote)(
+            user, selected_choice
+        )
+        next_page = 'polls:detail'
+    else:
+        previous_choice_id = await sync_to_async(Vote.objects.cast)(
+            user, selected_choice
+        )
+        await sync_to_async(pagecache.purge)([question.pk])
+        live.publish([question.pk])
+    if previous_choice_id is not None:
+        messages.success(
+            request,
+            f"Your vote was changed to '{selected_choice.choice_text}'"
+        )
+        vote_logger.info(
+            "User %s changed their vote for question %s to '%s'",
+            user.username, question_id, selected_choice.choice_text,
+        )
+    else:
+        messages.success(
+            request, f"Your vote '{selected_choice.choice_text}' was recorded"
+        )
+        vote_logger.info(
+            "User %s voted for the first time on question %s with '%s'",
+            user.username, question_id, selected_choice.choice_text,
+        )
+
+    return HttpResponseRedirect(reverse(next_page, args=(question.id,)))
+
+
+@sensitive_post_parameters()
+@never_cache
+async def login(request):
+    """Log a user in, verifying the password in the hasher pool."""
+    await _aload_user(request)
+    redirect_to = request.POST.get('next', request.GET.get('next', ''))
+    if not url_has_allowed_host_and_scheme(
+        redirect_to, allowed_hosts={request.get_host()},
+        require_https=request.is_secure(),
+    ):
+        redirect_to = ''
+    if request.method == 'POST':
+        form = AsyncAuthenticationForm(request, data=request.POST)
+        if await form.ais_valid():
+            await alogin(request, form.get_user())
+            return HttpResponseRedirect(
+                redirect_to or resolve_url(settings.LOGIN_REDIRECT_URL)
+            )
+    else:
+        form = AsyncAuthenticationForm(request)
+    return render(request, 'registration/login.html', {
+        'form': form,
+        'next': redirect_to,
+    })
+
+
+@sensitive_post_parameters()
+async def signup(request):
+    """Register a new user, hashing the password in the hasher pool."""
+    await _aload_user(request)
+    if request.method == 'POST':
+        form = CustomSignupForm(request.POST)
+        # The CAPTCHA, the username and the password validators query the
+        # database, and possibly the Have I Been Pwned API.
+        if await sync_to_async(form.is_valid)():
+            await form.asave()
+            user = await aauthenticate(
+                request,
+                username=form.cleaned_data['username'],
+                password=form.cleaned_data['password1'],
+            )
+            if user:
+                await alogin(request, user)
+                messages.success(
+                    request,
+                    f"Account created successfully! Welcome, {user.username}!"
+                )
+                logger.info("User %s login.", user.username)
+                return redirect('polls:index')
+
+            messages.error(
+                request, "Authentication failed. Please try logging in."
+            )
+            logger.warning("User authentication failed.")
+        else:
+            messages.error(
+                request,
+                "There was an error with your submission. Please try again."
+            )
+            logger.error("Error with submission.")
+    else:
+        form = CustomSignupForm()
+        logger.warning("Invalid form submission.")
+    # Rendering the CAPTCHA widget stores a new challenge.
+    return await sync_to_async(render)(
+        request, 'registration/signup.html', {'form': form}
+    )
@@ -0,0 +1,129 @@
+"""
+Versioned cache of poll results for the KU Polls application.
+
+Entries are stored under the question's `results_version`, which every
+vote write bumps, so a stale entry is simply never read again and expires
+through the backend's TTL and size bound.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from mysite import metrics
+from . import results
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    """Return the cache backend configured for poll results."""
+    return caches[getattr(settings, 'POLLS_RESULTS_CACHE', 'default')]
+
+
+def _record(hit):
+    """Count a cache lookup as a hit or a miss."""
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+    metrics.record_cache(hit)
+
+
+def _get_or_set(key, question, compute):
+    """
+    Return the cached value of `key` for the question's current version.
+
+    Args:
+        key: The cache key, without version.
+        question: The Question whose results_version tags the entry.
+        compute: Callable producing the value on a miss.
+    """
+    cache = _cache()
+    value = cache.get(key, version=question.results_version)
+    if value is not None:
+        _record(hit=True)
+        return value
+    _record(hit=False)
+    value = compute()
+    cache.set(key, value, version=question.results_version)
+    return value
+
+
+async def _aget_or_set(key, question, compute):
+    """Async version of _get_or_set(); `compute` returns an awaitable."""
+    cache = _cache()
+    value = await cache.aget(key, version=question.results_version)
+    if value is not None:
+        _record(hit=True)
+        return value
+    _record(hit=False)
+    value = await compute()
+    await cache.aset(key, value, version=question.results_version)
+    return value
+
+
+def get_results(question):
+    """
+    Return the tallies of a question, served from the cache when current.
+
+    Args:
+        question: A Question instance with an up-to-date results_version.
+
+    Returns:
+        QuestionResults: The per-choice tallies, total and percentages.
+    """
+    return _get_or_set(
+        f'polls:results:{question.pk}', question,
+        lambda: results.get_results(question),
+    )
+
+
+def get_fragment(question, name, render):
+    """
+    Return a rendered results fragment, served from the cache when current.
+
+    Args:
+        question: A Question instance with an up-to-date results_version.
+        name: The name of the fragment, e.g. 'table'.
+        render: Callable rendering the fragment on a miss.
+
+    Returns:
+        str: The rendered fragment.
+    """
+    return _get_or_set(
+        f'polls:results:{name}:{question.pk}', question, render
+    )
+
+
+async def aget_results(question):
+    """Async version of get_results()."""
+    return await _aget_or_set(
+        f'polls:results:{question.pk}', question,
+        lambda: results.aget_results(question),
+    )
+
+
+async def aget_fragment(question, name, render):
+    """Async version of get_fragment(); `render` must not query the database."""
+    async def compute():
+        return render()
+    return await _aget_or_set(
+        f'polls:results:{name}:{question.pk}', question, compute
+    )
+
+
+def stats():
+    """
+    Return the hit and miss counters of this process.
+
+    Returns:
+        dict: The number of hits, misses and the hit ratio.
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+    }
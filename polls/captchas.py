@@ -0,0 +1,264 @@
+"""
+Pre-generated CAPTCHA challenges for the signup form.
+
+django-simple-captcha inserts a CaptchaStore row whenever the signup form
+is rendered and draws the PNG when the browser fetches the image. With
+CAPTCHA_POOL_SIZE set, a process-wide CaptchaPool does both ahead of time
+in a background thread: it inserts a batch of challenges with one query,
+puts their images in the CAPTCHA_IMAGE_CACHE cache and hands the keys out
+in O(1), refilling once fewer than CAPTCHA_POOL_LOW_WATER are left.
+Expired challenges are deleted with a single query on every refill instead
+of on every form validation.
+"""
+import atexit
+import datetime
+import json
+import logging
+import secrets
+import threading
+from collections import deque
+
+from captcha.conf import settings as captcha_settings
+from captcha.fields import CaptchaTextInput
+from captcha.helpers import captcha_audio_url, captcha_image_url
+from captcha.models import CaptchaStore
+from captcha import views as captcha_views
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+
+logger = logging.getLogger('polls')
+
+
+def image_key(key, scale):
+    """Return the cache key of a challenge's image."""
+    return f'captcha:image:{key}@{scale}'
+
+
+def render_image(store, scale):
+    """
+    Draw the image of a challenge the way django-simple-captcha does.
+
+    Returns:
+        tuple: (content_type, body) of the image.
+    """
+    response = captcha_views._captcha_image(store, scale)
+    return response['Content-Type'], response.content
+
+
+class CaptchaPool:
+    """In-process stock of ready challenges, refilled in the background."""
+
+    def __init__(self, size, low_water=0, interval=60):
+        """
+        Create an empty pool.
+
+        Args:
+            size: Number of challenges a refill tops the pool up to.
+            low_water: Taking a challenge wakes the refill thread once
+                fewer than this many are left.
+            interval: Seconds between background refills and sweeps of
+                expired challenges; a falsy value disables the thread so
+                only explicit refill() calls add challenges.
+        """
+        self.size = size
+        self.low_water = low_water
+        self.interval = interval
+        self.scales = (1, 2) if captcha_settings.CAPTCHA_2X_IMAGE else (1,)
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of challenges ready to be handed out."""
+        with self._lock:
+            return len(self._entries)
+
+    def take(self):
+        """
+        Hand out a challenge that nobody else has been given.
+
+        Returns:
+            The challenge's hashkey, or None if the pool is empty.
+        """
+        with self._lock:
+            self._discard_stale()
+            key = self._entries.popleft()[0] if self._entries else None
+            low = len(self._entries) < self.low_water
+        if low and self.interval:
+            self._ensure_thread()
+            self._wakeup.set()
+        return key
+
+    def refill(self):
+        """
+        Delete expired challenges and top the pool up to its size.
+
+        Returns:
+            int: The number of challenges added.
+        """
+        with self._refill_lock:
+            CaptchaStore.remove_expired()
+            with self._lock:
+                self._discard_stale()
+                missing = self.size - len(self._entries)
+            if missing <= 0:
+                return 0
+            now = timezone.now()
+            expiration = now + datetime.timedelta(
+                minutes=int(captcha_settings.CAPTCHA_TIMEOUT)
+            )
+            challenge = captcha_settings.get_challenge()
+            stores = []
+            for _ in range(missing):
+                text, response = challenge()
+                stores.append(CaptchaStore(
+                    challenge=text, response=response.lower(),
+                    hashkey=secrets.token_hex(20), expiration=expiration,
+                ))
+            caches[settings.CAPTCHA_IMAGE_CACHE].set_many(
+                {
+                    image_key(store.hashkey, scale): render_image(store, scale)
+                    for store in stores for scale in self.scales
+                },
+                (expiration - now).total_seconds(),
+            )
+            CaptchaStore.objects.bulk_create(stores, batch_size=500)
+            with self._lock:
+                self._entries.extend(
+                    (store.hashkey, expiration) for store in stores
+                )
+        logger.debug("Added %d challenges to the CAPTCHA pool.", missing)
+        return missing
+
+    def stop(self):
+        """Stop the background refill thread."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _discard_stale(self):
+        """Drop challenges too close to expiry to be solved in time."""
+        # Entries are appended in batches of increasing expiration.
+        deadline = timezone.now() + datetime.timedelta(
+            minutes=int(captcha_settings.CAPTCHA_GET_FROM_POOL_TIMEOUT)
+        )
+        while self._entries and self._entries[0][1] <= deadline:
+            self._entries.popleft()
+
+    def _ensure_thread(self):
+        """Start the background refill thread on first use."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(
+                    target=self._run, name='polls-captcha-pool', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        """Refill on every low-water wakeup or timer tick until stopped."""
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self.refill()
+                except Exception:
+                    logger.exception("Failed to refill the CAPTCHA pool.")
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+        finally:
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide pool, creating it on first use.
+
+    Returns:
+        CaptchaPool or None: None when CAPTCHA_POOL_SIZE is 0.
+    """
+    global _pool
+    size = getattr(settings, 'CAPTCHA_POOL_SIZE', 0)
+    if not size:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = CaptchaPool(
+                    size,
+                    low_water=getattr(settings, 'CAPTCHA_POOL_LOW_WATER', 0),
+                    interval=getattr(settings, 'CAPTCHA_POOL_INTERVAL', 60),
+                )
+                atexit.register(_pool.stop)
+    return _pool
+
+
+def pick():
+    """
+    Return the hashkey of a fresh challenge.
+
+    Takes one from the pool, or creates one on demand like
+    django-simple-captcha when the pool is disabled or empty.
+    """
+    pool = get_pool()
+    key = pool.take() if pool is not None else None
+    if key is None:
+        if pool is not None:
+            logger.warning("The CAPTCHA pool is empty; drawing a new one.")
+        key = CaptchaStore.generate_key()
+    return key
+
+
+class PooledCaptchaTextInput(CaptchaTextInput):
+    """CaptchaTextInput that renders challenges taken from the pool."""
+
+    def fetch_captcha_store(self, name, value, attrs=None, generator=None):
+        """Pick the challenge to render, from the pool when enabled."""
+        if get_pool() is None or generator is not None:
+            return super().fetch_captcha_store(name, value, attrs, generator)
+        # Mirrors BaseCaptchaTextInput.fetch_captcha_store().
+        self._key = pick()
+        self._value = [self._key, '']
+        self.id_ = self.build_attrs(attrs).get('id', None)
+
+
+def image(request, key, scale=1):
+    """Serve a pre-rendered challenge image, drawing it if not cached."""
+    if scale == 2 and not captcha_settings.CAPTCHA_2X_IMAGE:
+        raise Http404
+    cached = None
+    if get_pool() is not None:
+        cached = caches[settings.CAPTCHA_IMAGE_CACHE].get(
+            image_key(key, scale)
+        )
+    if cached is None:
+        return captcha_views.captcha_image(request, key, scale)
+    content_type, body = cached
+    return HttpResponse(body, content_type=content_type)
+
+
+def refresh(request):
+    """Return a new challenge as JSON for the widget's refresh link."""
+    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
+        raise Http404
+    key = pick()
+    return HttpResponse(json.dumps({
+        'key': key,
+        'image_url': captcha_image_url(key),
+        'audio_url': (
+            captcha_audio_url(key) if captcha_settings.CAPTCHA_FLITE_PATH
+            else None
+        ),
+    }), content_type='application/json')
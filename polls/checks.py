@@ -0,0 +1,264 @@
+"""
+System checks for settings that slow the site down in production.
+
+The checks are deployment checks tagged 'performance': they run with
+`manage.py check --deploy` and, through `report()`, whenever the ASGI or
+WSGI application starts, so a server started with a performance-hostile
+setting says so in its log. Settings that are expected while developing
+(DEBUG, uncached templates, short-lived connections) are only reported
+outside the development profile. The errors polls.E002 and polls.E003
+are about caches that make the site faster but, kept per process, would
+keep logged-out sessions alive or serve purged pages.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import checks
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('polls')
+
+TAG = 'performance'
+
+
+def _in_production():
+    """Return True unless the development profile is active."""
+    return getattr(settings, 'DJANGO_ENV', 'production') != 'development'
+
+
+@checks.register(TAG, deploy=True)
+def check_debug(app_configs, **kwargs):
+    """Check that DEBUG is a real boolean and off in production."""
+    if not isinstance(settings.DEBUG, bool):
+        return [checks.Error(
+            f"DEBUG is {settings.DEBUG!r}, not a boolean; any non-empty "
+            f"string turns debug mode on.",
+            hint="Set DEBUG to True or False.",
+            id='polls.E001',
+        )]
+    if settings.DEBUG and _in_production():
+        return [checks.Warning(
+            "DEBUG is on: every SQL query is kept in memory and templates "
+            "are not cached.",
+            hint="Unset DEBUG or use DJANGO_ENV=development.",
+            id='polls.W001',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_template_loaders(app_configs, **kwargs):
+    """Check that templates are compiled once, by the cached loader."""
+    if not _in_production():
+        return []
+    warnings = []
+    for backend in settings.TEMPLATES:
+        if not backend['BACKEND'].endswith('DjangoTemplates'):
+            continue
+        loaders = backend.get('OPTIONS', {}).get('loaders')
+        if loaders is None:
+            # Django only caches by default when DEBUG is off.
+            cached = not settings.DEBUG
+        else:
+            cached = any(
+                isinstance(loader, (list, tuple))
+                and loader[0].endswith('cached.Loader')
+                for loader in loaders
+            )
+        if not cached:
+            warnings.append(checks.Warning(
+                "Templates are parsed again for every render.",
+                hint="Wrap the loaders in "
+                     "django.template.loaders.cached.Loader.",
+                id='polls.W002',
+            ))
+    return warnings
+
+
+@checks.register(TAG, deploy=True)
+def check_persistent_connections(app_configs, **kwargs):
+    """Check that database connections outlive a request."""
+    if not _in_production():
+        return []
+    return [
+        checks.Warning(
+            f"Database {alias!r} opens a new connection for every request.",
+            hint="Set CONN_MAX_AGE to keep connections open.",
+            id='polls.W003',
+        )
+        for alias, database in settings.DATABASES.items()
+        if not database.get('CONN_MAX_AGE')
+    ]
+
+
+@checks.register(TAG, deploy=True)
+def check_caches(app_configs, **kwargs):
+    """Check that no cache is a dummy cache."""
+    return [
+        checks.Warning(
+            f"Cache {alias!r} is a dummy cache that never stores anything.",
+            hint="Configure a real backend such as LocMemCache or Redis.",
+            id='polls.W004',
+        )
+        for alias, cache in settings.CACHES.items()
+        if cache['BACKEND'].endswith('DummyCache')
+    ]
+
+
+@checks.register(TAG, deploy=True)
+def check_sessions(app_configs, **kwargs):
+    """Check that sessions are read from a cache, not the database."""
+    if settings.SESSION_ENGINE.endswith(('.db', '.file')):
+        return [checks.Warning(
+            f"{settings.SESSION_ENGINE} reads the session on every request.",
+            hint="Set SESSION_CACHE_BACKEND to a cache shared by all "
+                 "processes, such as Redis, to read sessions from it.",
+            id='polls.W005',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_session_cache(app_configs, **kwargs):
+    """Check that cached sessions and users are shared by all processes."""
+    if settings.DEBUG:
+        return []
+    cached = (
+        settings.SESSION_ENGINE.endswith(('.cache', '.cached_db'))
+        or 'mysite.auth.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS
+    )
+    backend = settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND']
+    if cached and backend.endswith('LocMemCache'):
+        return [checks.Error(
+            f"Sessions and users are cached in {backend}, which each "
+            "process keeps for itself: a logout or password change only "
+            "takes effect in the process that handled it.",
+            hint="Set SESSION_CACHE_BACKEND to a cache shared by all "
+                 "processes, or silence polls.E002 if the site runs in "
+                 "a single process.",
+            id='polls.E002',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_page_cache(app_configs, **kwargs):
+    """Check that the anonymous page cache is shared by all processes."""
+    alias = getattr(settings, 'POLLS_PAGE_CACHE', None)
+    if settings.DEBUG or not alias:
+        return []
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend.endswith('LocMemCache'):
+        return [checks.Error(
+            f"Anonymous pages are cached in {backend}, which each process "
+            "keeps for itself: a vote only purges the pages of the process "
+            "that handled it, and the others serve stale results.",
+            hint="Set PAGE_CACHE_BACKEND to a cache shared by all "
+                 "processes, or silence polls.E003 if the site runs in "
+                 "a single process.",
+            id='polls.E003',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_static_files(app_configs, **kwargs):
+    """Check that static files are hashed and served precompressed."""
+    if settings.DEBUG:
+        return []
+    warnings = []
+    storage = import_string(settings.STORAGES['staticfiles']['BACKEND'])
+    if not hasattr(storage, 'manifest_name'):
+        warnings.append(checks.Warning(
+            "Static files are not stored under content-hashed names, so "
+            "browsers cannot cache them for long.",
+            hint="Use mysite.storage.CompressedManifestStaticFilesStorage.",
+            id='polls.W006',
+        ))
+    elif not staticfiles_storage.hashed_files:
+        warnings.append(checks.Warning(
+            f"No static files manifest in {settings.STATIC_ROOT}: pages "
+            "link unhashed files that cannot be cached for long.",
+            hint="Run `manage.py collectstatic`.",
+            id='polls.W010',
+        ))
+    if 'mysite.middleware.StaticFilesMiddleware' not in settings.MIDDLEWARE:
+        warnings.append(checks.Warning(
+            "Nothing in the app serves the precompressed static files.",
+            hint="Add mysite.middleware.StaticFilesMiddleware after "
+                 "SecurityMiddleware, or serve STATIC_ROOT from the web "
+                 "server.",
+            id='polls.W007',
+        ))
+    return warnings
+
+
+@checks.register(TAG, deploy=True)
+def check_log_level(app_configs, **kwargs):
+    """Check that SQL queries are not logged one line each."""
+    if _in_production() and getattr(settings, 'LOG_LEVEL', '') == 'DEBUG':
+        return [checks.Warning(
+            "LOG_LEVEL is DEBUG, which logs every SQL query.",
+            hint="Use INFO or higher.",
+            id='polls.W008',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_captcha_pool(app_configs, **kwargs):
+    """Check that pooled CAPTCHAs outlive the hand-out margin."""
+    if not getattr(settings, 'CAPTCHA_POOL_SIZE', 0):
+        return []
+    timeout = getattr(settings, 'CAPTCHA_TIMEOUT', 5)
+    margin = getattr(settings, 'CAPTCHA_GET_FROM_POOL_TIMEOUT', 5)
+    if timeout <= margin:
+        return [checks.Warning(
+            "Pooled CAPTCHAs expire before they can be handed out, so "
+            "every signup draws a new one.",
+            hint="Make CAPTCHA_TIMEOUT longer than "
+                 "CAPTCHA_GET_FROM_POOL_TIMEOUT.",
+            id='polls.W009',
+        )]
+    return []
+
+
+@checks.register(TAG, deploy=True)
+def check_captcha_cache(app_configs, **kwargs):
+    """Check that pooled CAPTCHA images are shared by all processes."""
+    if settings.DEBUG or not getattr(settings, 'CAPTCHA_POOL_SIZE', 0):
+        return []
+    backend = settings.CACHES[settings.CAPTCHA_IMAGE_CACHE]['BACKEND']
+    if backend.endswith('LocMemCache'):
+        return [checks.Warning(
+            f"Pre-rendered CAPTCHA images are cached in {backend}, which "
+            "each process keeps for itself: an image requested from "
+            "another process than the one that handed out its challenge "
+            "is drawn again.",
+            hint="Set CAPTCHA_CACHE_BACKEND to a cache shared by all "
+                 "processes, or silence polls.W011 if the site runs in "
+                 "a single process.",
+            id='polls.W011',
+        )]
+    return []
+
+
+def report():
+    """
+    Log the result of the performance checks.
+
+    Called by the ASGI and WSGI entry points once the application is set
+    up.
+
+    Returns:
+        list: The messages that were logged.
+    """
+    messages = checks.run_checks(
+        tags=[TAG], include_deployment_checks=True
+    )
+    messages = [message for message in messages if not message.is_silenced()]
+    for message in messages:
+        level = logging.ERROR if message.is_serious() else logging.WARNING
+        logger.log(level, "Startup check: %s", message)
+    return messages
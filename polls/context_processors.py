@@ -0,0 +1,23 @@
+"""Template context shared by every page."""
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+
+def fragment_cache(request):
+    """
+    Expose what templates need to cache fragments with `{% cache %}`.
+
+    The tag's timeout must be given explicitly, and fragments that link
+    static files vary on the static files manifest so that a new
+    collectstatic does not leave them pointing at old file names.
+
+    Returns:
+        dict: FRAGMENT_CACHE_TIMEOUT in seconds and STATIC_VERSION, the
+        hash of the static files manifest ('' without one).
+    """
+    return {
+        'FRAGMENT_CACHE_TIMEOUT': getattr(
+            settings, 'POLLS_FRAGMENT_CACHE_TIMEOUT', 600
+        ),
+        'STATIC_VERSION': getattr(staticfiles_storage, 'manifest_hash', ''),
+    }
@@ -0,0 +1,201 @@
+"""
+Streaming exports of votes and results for the KU Polls application.
+
+Rows are read with `values_list(...).iterator()`, so no model instances
+are built, and are encoded and optionally gzip-compressed as they are
+read. Memory use therefore stays flat however many votes are exported.
+"""
+import csv
+import datetime
+import json
+import uuid
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Choice, Vote
+
+VOTE_COLUMNS = (
+    'id', 'question_id', 'choice_id', 'choice_text', 'user_id', 'username',
+    'voted_at',
+)
+RESULT_COLUMNS = (
+    'question_id', 'question_text', 'choice_id', 'choice_text', 'votes',
+)
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Encoded rows are sent in blocks of about this many characters.
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_filters(question_ids=(), since=None, until=None):
+    """
+    Validate the filters of an export.
+
+    Args:
+        question_ids: Question ids as strings.
+        since: ISO date or datetime of the start of the range, or None.
+        until: ISO date or datetime of the end of the range, or None.
+            Naive values are taken in the current time zone.
+
+    Returns:
+        dict: Keyword arguments for vote_rows() and result_rows().
+
+    Raises:
+        ValueError: If an id or a date is invalid.
+    """
+    return {
+        'question_ids': [uuid.UUID(pk) for pk in question_ids],
+        'since': _parse_bound(since),
+        'until': _parse_bound(until),
+    }
+
+
+def _parse_bound(value):
+    """Parse an ISO date or datetime into an aware datetime."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def vote_rows(question_ids=None, since=None, until=None, chunk_size=2000):
+    """
+    Yield one tuple per vote, in VOTE_COLUMNS order.
+
+    Args:
+        question_ids: Only export the votes of these questions.
+        since: Only export votes cast at or after this datetime.
+        until: Only export votes cast before this datetime.
+        chunk_size: Number of rows fetched from the database at a time.
+    """
+    votes = Vote.objects.order_by()
+    if question_ids:
+        votes = votes.filter(choice_question_id__in=question_ids)
+    if since is not None:
+        votes = votes.filter(voted_at__gte=since)
+    if until is not None:
+        votes = votes.filter(voted_at__lt=until)
+    return votes.values_list(
+        'id', 'choice_question_id', 'choice_id', 'choice__choice_text',
+        'user_id', 'user__username', 'voted_at',
+    ).iterator(chunk_size=chunk_size)
+
+
+def result_rows(question_ids=None, since=None, until=None, chunk_size=2000):
+    """
+    Yield one tuple per choice with its vote count, in RESULT_COLUMNS order.
+
+    Args:
+        question_ids: Only export the results of these questions.
+        since: Only export questions published at or after this datetime.
+        until: Only export questions published before this datetime.
+        chunk_size: Number of rows fetched from the database at a time.
+    """
+    choices = Choice.objects.order_by('question__pub_date', 'question_id')
+    if question_ids:
+        choices = choices.filter(question_id__in=question_ids)
+    if since is not None:
+        choices = choices.filter(question__pub_date__gte=since)
+    if until is not None:
+        choices = choices.filter(question__pub_date__lt=until)
+    return choices.values_list(
+        'question_id', 'question__question_text', 'id', 'choice_text',
+        'vote_count',
+    ).iterator(chunk_size=chunk_size)
+
+
+EXPORTS = {
+    'votes': (VOTE_COLUMNS, vote_rows),
+    'results': (RESULT_COLUMNS, result_rows),
+}
+
+
+class _Echo:
+    """File-like object whose write() returns what it is given."""
+
+    def write(self, value):
+        """Return the written value instead of storing it."""
+        return value
+
+
+def _csv_lines(columns, rows):
+    """Yield a CSV header and one line per row."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(columns, rows):
+    """Yield one JSON object per row."""
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def _blocks(lines):
+    """Join lines into blocks of about BLOCK_SIZE characters."""
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield ''.join(block)
+            block, size = [], 0
+    if block:
+        yield ''.join(block)
+
+
+def _gzip(blocks):
+    """Compress a stream of text blocks into a gzip stream."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode(columns, rows, fmt='csv', compress=False):
+    """
+    Encode rows as a stream of CSV or NDJSON chunks.
+
+    Args:
+        columns: The column names.
+        rows: An iterable of tuples matching `columns`.
+        fmt: 'csv' or 'ndjson'.
+        compress: Gzip-compress the stream.
+
+    Returns:
+        An iterator of str chunks, or of bytes chunks when compressed.
+    """
+    lines = _csv_lines if fmt == 'csv' else _ndjson_lines
+    blocks = _blocks(lines(columns, rows))
+    return _gzip(blocks) if compress else blocks
+
+
+async def aiterate(chunks):
+    """
+    Iterate a synchronous chunk iterator from async code.
+
+    Each chunk is produced in the thread that owns the database
+    connection, so ASGI servers can stream the export without first
+    loading it into memory.
+    """
+    sentinel = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, sentinel)) is not sentinel:
+        yield chunk
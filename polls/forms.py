@@ -4,7 +4,10 @@ import logging
 from django import forms
 from django.core.exceptions import ValidationError
 from captcha.fields import CaptchaField
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+
+from mysite.auth import aauthenticate, aset_password
+from .captchas import PooledCaptchaTextInput
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -29,7 +32,7 @@ class UsernameChangeForm(forms.Form):
         """Validate that the provided password matches the current user's password."""
         password = self.cleaned_data.get('password')
         if not self.user.check_password(password):
-            logger.warning(f"Incorrect password for user {self.user.username}")
+            logger.warning("Incorrect password for user %s", self.user.username)
             raise ValidationError("Incorrect password.")
         return password
 
@@ -41,7 +44,7 @@ class CustomSignupForm(UserCreationForm):
     User creation fields for registration. This is used for preventing automated signups.
     """
 
-    captcha = CaptchaField()
+    captcha = CaptchaField(widget=PooledCaptchaTextInput())
 
     class Meta(UserCreationForm.Meta):
         """
@@ -51,3 +54,41 @@ class CustomSignupForm(UserCreationForm):
         """
 
         fields = UserCreationForm.Meta.fields + ('captcha',)
+
+    async def asave(self):
+        """Create the user, hashing the password without holding a thread."""
+        user = forms.ModelForm.save(self, commit=False)
+        await aset_password(user, self.cleaned_data['password1'])
+        await user.asave()
+        return user
+
+
+class AsyncAuthenticationForm(AuthenticationForm):
+    """
+    AuthenticationForm for async views.
+
+    `ais_valid()` authenticates with mysite.auth.aauthenticate, so the
+    password is verified in the hasher pool without holding a thread.
+    """
+
+    def clean(self):
+        """Leave the authentication to ais_valid()."""
+        return self.cleaned_data
+
+    async def ais_valid(self):
+        """Validate the fields, then authenticate the user."""
+        if not self.is_valid():
+            return False
+        self.user_cache = await aauthenticate(
+            self.request,
+            username=self.cleaned_data['username'],
+            password=self.cleaned_data['password'],
+        )
+        try:
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+        except ValidationError as error:
+            self.add_error(None, error)
+            return False
+        return True
@@ -0,0 +1,334 @@
+"""
+Write-behind vote ingestion for the KU Polls application.
+
+When `POLLS_VOTE_INGESTION` is 'buffered', the vote view hands votes to a
+process-wide VoteBuffer instead of committing each one. The buffer keeps
+only the latest choice per (user, question) and writes whole batches with
+one transaction, either when it holds `POLLS_VOTE_BUFFER_SIZE` votes or
+every `POLLS_VOTE_BUFFER_DELAY` seconds. Pending votes remain visible to
+their voter through `pending_choice()` until they are committed, which is
+why the vote views send buffered voters to the detail page rather than
+to the results.
+
+Votes for choices that no longer exist are dropped. If a batch still
+fails with an IntegrityError, its votes are written one by one and the
+failing ones are dropped. Votes are never dropped for any other error:
+their voters have already been told the vote was recorded. The batch is
+retried with the next flush, with the delay between timed flushes
+doubling after every failure up to MAX_RETRY_DELAY seconds, and after
+`POLLS_VOTE_BUFFER_RETRIES` failed flushes in a row its votes are written
+one by one, so one vote that cannot be written does not hold back others.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import live
+from . import pagecache
+from .models import Choice, Question, Vote
+
+logger = logging.getLogger('polls')
+
+# Longest wait between timed flushes while flushes keep failing
+MAX_RETRY_DELAY = 30
+
+
+class VoteBuffer:
+    """In-process queue of votes flushed to the database in batches."""
+
+    def __init__(self, max_batch=500, max_delay=0.5, max_retries=3):
+        """
+        Create an empty buffer.
+
+        Args:
+            max_batch: Number of pending votes that triggers a flush.
+            max_delay: Seconds between timed flushes; a falsy value disables
+                the background flusher so only size and explicit flushes
+                write to the database.
+            max_retries: Failed flushes in a row after which the votes of
+                the failing batch are written one by one.
+        """
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def submit(self, user_id, question_id, choice_id):
+        """
+        Queue a vote, replacing any pending vote on the same question.
+
+        Once the buffer is drained, the vote is written before returning.
+        """
+        with self._lock:
+            self._pending[(user_id, question_id)] = choice_id
+            full = len(self._pending) >= self.max_batch
+        if self._stopping.is_set():
+            self.flush()
+        elif self.max_delay:
+            self._ensure_thread()
+            if full:
+                self._wakeup.set()
+        elif full:
+            self.flush()
+
+    def pending_choice(self, user_id, question_id):
+        """
+        Return the choice id of a vote not yet committed, if any.
+
+        Returns:
+            The pending choice id, or None if nothing is buffered.
+        """
+        key = (user_id, question_id)
+        with self._lock:
+            return self._pending.get(key, self._inflight.get(key))
+
+    def __len__(self):
+        """Return the number of votes waiting to be flushed."""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write every pending vote in a single transaction.
+
+        Returns:
+            int: The number of votes written or dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            count = len(batch)
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+            else:
+                self._failures = 0
+            finally:
+                with self._lock:
+                    self._inflight = {}
+        return count
+
+    def _write(self, batch):
+        """
+        Write a batch, falling back to one vote at a time.
+
+        Votes are written one by one if the batch breaks a constraint or
+        the last max_retries flushes failed. They are removed from `batch`
+        once written or dropped; the rest stay in it when an error other
+        than IntegrityError is raised.
+        """
+        if self._failures < self.max_retries:
+            try:
+                write_batch(batch)
+                return
+            except IntegrityError as e:
+                logger.warning(
+                    "Writing %d buffered votes one by one: %s", len(batch), e
+                )
+        else:
+            logger.warning(
+                "Writing %d buffered votes one by one after %d failed "
+                "flushes.", len(batch), self._failures,
+            )
+        for key, choice_id in list(batch.items()):
+            try:
+                write_batch({key: choice_id})
+            except IntegrityError as e:
+                logger.error(
+                    "Dropped the buffered vote of user %s on question %s "
+                    "for choice %s: %s", *key, choice_id, e,
+                )
+            with self._lock:
+                # Written or dropped, so it must not be retried.
+                del batch[key]
+
+    def _requeue(self, batch):
+        """Queue the unwritten votes of a failed flush again."""
+        self._failures += 1
+        with self._lock:
+            # Newer votes submitted meanwhile win over the failed batch.
+            self._pending = {**batch, **self._pending}
+
+    def retry_delay(self):
+        """Return the wait before the next timed flush, longer after failures."""
+        if not self._failures:
+            return self.max_delay
+        return min(self.max_delay * 2 ** self._failures, MAX_RETRY_DELAY)
+
+    def drain(self):
+        """
+        Stop the background flusher and write everything still pending.
+
+        A failing flush is retried max_retries times, with the same delays
+        as timed flushes, before the error is raised.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for _ in range(self.max_retries):
+            try:
+                self.flush()
+                return
+            except Exception:
+                logger.exception("Failed to flush buffered votes.")
+                time.sleep(self.retry_delay())
+        self.flush()
+
+    def _ensure_thread(self):
+        """Start the background flusher on first use."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(
+                    target=self._run, name='polls-vote-buffer', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        """Flush on every size trigger or timer tick until drained."""
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(self.retry_delay())
+                self._wakeup.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Failed to flush buffered votes.")
+        finally:
+            connection.close()
+
+
+def write_batch(batch):
+    """
+    Upsert a batch of votes and adjust the counters in one transaction.
+
+    Args:
+        batch: Mapping of (user_id, question_id) to the chosen choice id.
+            Each key appears once, so the last submitted vote wins.
+            Votes for choices that are no longer on their question are
+            dropped.
+    """
+    user_ids = {user_id for user_id, _ in batch}
+    question_ids = {question_id for _, question_id in batch}
+    deltas = Counter()
+    with transaction.atomic():
+        choices = set(Choice.objects.filter(
+            pk__in=set(batch.values()), question_id__in=question_ids
+        ).values_list('pk', 'question_id'))
+        for key, choice_id in batch.items():
+            if (choice_id, key[1]) not in choices:
+                logger.warning(
+                    "Dropped the buffered vote of user %s on question %s "
+                    "for missing choice %s.", *key, choice_id,
+                )
+        batch = {
+            key: choice_id for key, choice_id in batch.items()
+            if (choice_id, key[1]) in choices
+        }
+        existing = Vote.objects.filter(
+            user_id__in=user_ids, choice_question_id__in=question_ids
+        ).values_list('user_id', 'choice_question_id', 'choice_id')
+        previous = {
+            (user_id, question_id): choice_id
+            for user_id, question_id, choice_id in existing
+            if (user_id, question_id) in batch
+        }
+        changed = []
+        for key, choice_id in batch.items():
+            old_choice_id = previous.get(key)
+            if old_choice_id == choice_id:
+                continue
+            if old_choice_id is not None:
+                deltas[old_choice_id] -= 1
+            deltas[choice_id] += 1
+            changed.append(Vote(
+                user_id=key[0], choice_question_id=key[1], choice_id=choice_id
+            ))
+        if not changed:
+            return
+        Vote.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['user', 'choice_question'],
+            update_fields=['choice', 'voted_at'],
+            batch_size=500,
+        )
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if deltas:
+            Choice.objects.filter(pk__in=deltas).update(
+                vote_count=F('vote_count') + Case(
+                    *[When(pk=pk, then=Value(delta))
+                      for pk, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+        question_ids = {vote.choice_question_id for vote in changed}
+        Question.objects.filter(pk__in=question_ids).bump_results()
+    pagecache.purge(question_ids)
+    live.publish(question_ids)
+    logger.info("Flushed %d buffered votes.", len(changed))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def is_enabled():
+    """Return True if votes should go through the write-behind buffer."""
+    return getattr(settings, 'POLLS_VOTE_INGESTION', 'direct') == 'buffered'
+
+
+def get_buffer():
+    """Return the process-wide vote buffer, creating it on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VoteBuffer(
+                    max_batch=getattr(settings, 'POLLS_VOTE_BUFFER_SIZE', 500),
+                    max_delay=getattr(settings, 'POLLS_VOTE_BUFFER_DELAY', 0.5),
+                    max_retries=getattr(
+                        settings, 'POLLS_VOTE_BUFFER_RETRIES', 3
+                    ),
+                )
+                atexit.register(_buffer.drain)
+    return _buffer
+
+
+def queue_vote(user, choice):
+    """
+    Hand a vote to the buffer instead of writing it immediately.
+
+    Returns:
+        The id of the choice the user had selected before, taking pending
+        votes into account, or None if this is the user's first vote.
+    """
+    buffer = get_buffer()
+    previous_choice_id = buffer.pending_choice(user.pk, choice.question_id)
+    if previous_choice_id is None:
+        previous_choice_id = Vote.objects.filter(
+            user=user, choice_question_id=choice.question_id
+        ).values_list('choice_id', flat=True).first()
+    buffer.submit(user.pk, choice.question_id, choice.pk)
+    return previous_choice_id
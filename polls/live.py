@@ -0,0 +1,220 @@
+"""
+Live results stream of the KU Polls application.
+
+Viewers of a results page keep one Server-Sent Events stream open instead
+of reloading the page. Vote writes publish the ids of the questions they
+touched to an in-process hub, which wakes the streams of those questions.
+Each stream then sends the tallies that changed since its previous event,
+at most `POLLS_LIVE_MAX_RATE` times per second, so a burst of votes costs
+one read of the versioned results cache per interval instead of one
+render per vote.
+
+The hub only reaches streams served by the same process: run a single
+ASGI worker, or accept that other workers' viewers see a vote once their
+own process records one.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from . import cache as results_cache
+from .models import Question
+
+
+class Subscription:
+    """A stream waiting for the results of one question to change."""
+
+    def __init__(self, question_id):
+        """
+        Subscribe from the event loop of the stream.
+
+        Args:
+            question_id: The id of the question whose results are streamed.
+        """
+        self.question_id = question_id
+        self.changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def notify(self):
+        """Wake the stream; safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self.changed.set)
+
+
+class ResultsHub:
+    """
+    In-process publish/subscribe of results changes per question.
+
+    A subscription is a single flag rather than a queue: publishing never
+    blocks and never buffers, however slowly a client reads. A stream
+    that falls behind simply finds the flag set and sends the latest
+    tallies once.
+    """
+
+    def __init__(self):
+        """Create a hub without subscribers."""
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, question_id):
+        """
+        Return a new subscription to the results of a question.
+
+        Must be called from the event loop that will wait on it.
+        """
+        subscription = Subscription(question_id)
+        with self._lock:
+            self._subscribers.setdefault(question_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop notifying a subscription."""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.question_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.question_id]
+
+    def publish(self, question_ids):
+        """
+        Notify the streams of questions whose results changed.
+
+        Args:
+            question_ids: Ids of the questions that received votes.
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for question_id in question_ids
+                for subscription in self._subscribers.get(question_id, ())
+            ]
+        for subscription in subscriptions:
+            try:
+                subscription.notify()
+            except RuntimeError:
+                # The event loop of the stream is gone.
+                self.unsubscribe(subscription)
+
+    def __len__(self):
+        """Return the number of open subscriptions."""
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+hub = ResultsHub()
+
+
+def publish(question_ids):
+    """Notify the live streams of questions whose results changed."""
+    hub.publish(question_ids)
+
+
+def is_full():
+    """Return True if this process serves POLLS_LIVE_MAX_STREAMS streams."""
+    return len(hub) >= getattr(settings, 'POLLS_LIVE_MAX_STREAMS', 1000)
+
+
+def _event(name, data):
+    """Format a Server-Sent Event."""
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def _delta(previous, current):
+    """
+    Return the part of `current` that differs from `previous`.
+
+    Both are QuestionResults.as_dict() payloads; a choice is included when
+    its votes or its percentage changed.
+    """
+    before = {choice['id']: choice for choice in previous['choices']}
+    return {
+        'question': current['question'],
+        'total': current['total'],
+        'choices': [
+            {key: choice[key] for key in ('id', 'votes', 'percentage')}
+            for choice in current['choices']
+            if before.get(choice['id']) != choice
+        ],
+    }
+
+
+async def _results(question_id):
+    """Return the current results payload of a question, or None."""
+    question = await Question.objects.only('results_version').filter(
+        pk=question_id
+    ).afirst()
+    if question is None:
+        return None
+    return (await results_cache.aget_results(question)).as_dict()
+
+
+def poll_response(results):
+    """
+    Return the body of a stream that ends after the current results.
+
+    Used under WSGI, where a long-lived stream would hold a worker: the
+    browser reconnects every POLLS_LIVE_HEARTBEAT seconds instead.
+
+    Args:
+        results: The QuestionResults to send.
+    """
+    retry = int(getattr(settings, 'POLLS_LIVE_HEARTBEAT', 15) * 1000)
+    return f'retry: {retry}\n' + _event('results', results.as_dict())
+
+
+async def stream_results(question_id):
+    """
+    Yield the results of a question as Server-Sent Events.
+
+    The first event carries the full results; later `results` events only
+    carry the total and the choices that changed. Comments are sent every
+    POLLS_LIVE_HEARTBEAT seconds to keep proxies from closing the
+    connection, and a `timeout` event ends the stream once the results did
+    not change for POLLS_LIVE_IDLE_TIMEOUT seconds.
+
+    Args:
+        question_id: The id of the question to stream.
+    """
+    max_rate = getattr(settings, 'POLLS_LIVE_MAX_RATE', 2)
+    heartbeat = getattr(settings, 'POLLS_LIVE_HEARTBEAT', 15)
+    idle_timeout = getattr(settings, 'POLLS_LIVE_IDLE_TIMEOUT', 300)
+
+    # Subscribe before the first read so no vote falls in between.
+    subscription = hub.subscribe(question_id)
+    try:
+        snapshot = await _results(question_id)
+        if snapshot is None:
+            return
+        yield f'retry: {int(1000 / max_rate)}\n' + _event('results', snapshot)
+        last_sent = last_change = time.monotonic()
+        while True:
+            idle = idle_timeout - (time.monotonic() - last_change)
+            if idle <= 0:
+                yield _event('timeout', {'question': snapshot['question']})
+                return
+            try:
+                await asyncio.wait_for(
+                    subscription.changed.wait(), min(heartbeat, idle)
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # Coalesce everything published until the next slot.
+            delay = last_sent + 1 / max_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            subscription.changed.clear()
+            current = await _results(question_id)
+            if current is None:
+                return
+            last_change = time.monotonic()
+            delta = _delta(snapshot, current)
+            snapshot = current
+            if delta['choices']:
+                last_sent = time.monotonic()
+                yield _event('results', delta)
+    finally:
+        hub.unsubscribe(subscription)
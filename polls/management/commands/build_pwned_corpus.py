@@ -0,0 +1,83 @@
+"""Management command that builds the offline compromised password corpus."""
+import gzip
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import pwned
+
+
+class Command(BaseCommand):
+    """Build the sorted SHA-1 corpus used by the offline password check."""
+
+    help = (
+        "Build the offline compromised password corpus from Have I Been "
+        "Pwned SHA-1 hash lists. Sources are files of HASH:COUNT lines, "
+        "optionally gzip-compressed (.gz), or directories of range files "
+        "named after their five character prefix."
+    )
+
+    def add_arguments(self, parser):
+        """Accept the hash lists, the output path and the filters."""
+        parser.add_argument(
+            'sources', nargs='+',
+            help="Hash list files or directories of range files.",
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help="Corpus file to write (default: PWNED_PASSWORDS_FILE).",
+        )
+        parser.add_argument(
+            '--min-count', type=int, default=1,
+            help="Skip hashes seen fewer times than this (default: 1).",
+        )
+        parser.add_argument(
+            '--run-size', type=int, default=10_000_000,
+            help="Hashes sorted in memory at a time (default: 10000000).",
+        )
+
+    def handle(self, *args, **options):
+        """Build the corpus and report its size."""
+        output = options['output'] or settings.PWNED_PASSWORDS_FILE
+        if not output:
+            raise CommandError("Give --output or set PWNED_PASSWORDS_FILE.")
+        if options['run_size'] < 1:
+            raise CommandError("The run size must be positive.")
+        start = time.perf_counter()
+        try:
+            written = pwned.build(
+                self._digests(options['sources'], options['min_count']),
+                output, run_size=options['run_size'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not build {output}: {e}")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} hashes to {output} in {elapsed:.1f}s."
+        ))
+
+    def _digests(self, sources, min_count):
+        """Yield the digests of the sources seen at least `min_count` times."""
+        for path in self._files(sources):
+            # Range files are named after the prefix their lines omit.
+            prefix = path.name.split('.')[0].upper()
+            opener = gzip.open if path.suffix == '.gz' else open
+            with opener(path, 'rt', encoding='ascii') as lines:
+                for line in lines:
+                    parsed = pwned.parse_line(line, prefix)
+                    if parsed is None:
+                        continue
+                    digest, count = parsed
+                    if count is None or count >= min_count:
+                        yield digest
+
+    @staticmethod
+    def _files(sources):
+        """Yield the files of the sources, expanding directories."""
+        for source in map(Path, sources):
+            if source.is_dir():
+                yield from sorted(p for p in source.iterdir() if p.is_file())
+            else:
+                yield source
@@ -0,0 +1,62 @@
+"""Management command that picks the PBKDF2 iteration count for this host."""
+import hashlib
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mysite.hashers import MIN_ITERATIONS
+
+
+class Command(BaseCommand):
+    """Time PBKDF2 on this machine and suggest PASSWORD_PBKDF2_ITERATIONS."""
+
+    help = (
+        "Measure PBKDF2-SHA256 on this machine and print the iteration "
+        "count that takes about --target-ms per hash, for the "
+        "PASSWORD_PBKDF2_ITERATIONS setting."
+    )
+
+    def add_arguments(self, parser):
+        """Accept the target latency and the number of samples."""
+        parser.add_argument(
+            '--target-ms', type=float, default=250,
+            help="Time one hash should take (default: 250).",
+        )
+        parser.add_argument(
+            '--samples', type=int, default=5,
+            help="Timed hashes; the fastest is used (default: 5).",
+        )
+        parser.add_argument(
+            '--probe-iterations', type=int, default=100000,
+            help="Iterations of each timed hash (default: 100000).",
+        )
+
+    def handle(self, *args, **options):
+        """Time the probe hashes and print the suggested setting."""
+        if options['target_ms'] <= 0 or options['samples'] < 1:
+            raise CommandError("The target and samples must be positive.")
+        probe = options['probe_iterations']
+        salt = os.urandom(16)
+        timings = []
+        for _ in range(options['samples']):
+            start = time.perf_counter()
+            hashlib.pbkdf2_hmac('sha256', b'calibration', salt, probe)
+            timings.append(time.perf_counter() - start)
+        per_iteration = min(timings) / probe
+        iterations = options['target_ms'] / 1000 / per_iteration
+        iterations = int(round(iterations, -4))
+        if iterations < MIN_ITERATIONS:
+            self.stderr.write(self.style.WARNING(
+                f"{iterations} iterations are below the minimum of "
+                f"{MIN_ITERATIONS}; using the minimum instead."
+            ))
+            iterations = MIN_ITERATIONS
+        self.stdout.write(
+            f"One iteration takes {per_iteration * 1e9:.0f} ns; "
+            f"{iterations} iterations take about "
+            f"{iterations * per_iteration * 1000:.0f} ms."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"PASSWORD_PBKDF2_ITERATIONS={iterations}"
+        ))
@@ -0,0 +1,65 @@
+"""Management command that streams votes or results to a file."""
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import export
+
+
+class Command(BaseCommand):
+    """Export votes or per-choice results as CSV or NDJSON."""
+
+    help = (
+        "Stream all votes or results as CSV or NDJSON without loading "
+        "them into memory."
+    )
+
+    def add_arguments(self, parser):
+        """Accept what to export, the filters and the output options."""
+        parser.add_argument('kind', choices=sorted(export.EXPORTS))
+        parser.add_argument(
+            '--format', choices=sorted(export.FORMATS), default='csv',
+        )
+        parser.add_argument(
+            '--question', action='append', default=[], dest='questions',
+            help="Only export this question; may be repeated.",
+        )
+        parser.add_argument(
+            '--since', help="ISO date or datetime to start from (inclusive).",
+        )
+        parser.add_argument(
+            '--until', help="ISO date or datetime to stop at (exclusive).",
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help="Gzip-compress the output.",
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help="File to write to; defaults to standard output.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Rows fetched from the database at a time (default: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        """Write the export chunk by chunk."""
+        columns, rows = export.EXPORTS[options['kind']]
+        try:
+            filters = export.parse_filters(
+                options['questions'], options['since'], options['until']
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        if options['gzip'] and not options['output']:
+            raise CommandError("--gzip requires --output.")
+
+        chunks = export.encode(
+            columns, rows(chunk_size=options['chunk_size'], **filters),
+            options['format'], options['gzip'],
+        )
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk if options['gzip'] else chunk.encode())
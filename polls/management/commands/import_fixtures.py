@@ -0,0 +1,359 @@
+"""Management command that streams large fixtures into the database."""
+import gzip
+import json
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from polls import pagecache
+from polls.models import Choice, Question, Vote
+
+
+def iter_fixture(stream, read_size=1 << 16):
+    """
+    Yield the objects of a JSON fixture one at a time.
+
+    The fixture is a JSON array of objects, as written by `dumpdata`. It
+    is read `read_size` characters at a time and each element is decoded
+    as soon as it is complete, so memory use does not grow with the file.
+
+    Args:
+        stream: A text file positioned at the start of the fixture.
+        read_size: Number of characters read at a time.
+
+    Raises:
+        ValueError: If the fixture is not a JSON array of objects.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = _next_token(stream, read_size, '', 0, False)
+    if buffer[position] != '[':
+        raise ValueError("A fixture must be a JSON array.")
+    position += 1
+    while True:
+        buffer, position, eof = _next_token(
+            stream, read_size, buffer, position, eof
+        )
+        if buffer[position] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The element continues in the next read.
+            more = stream.read(read_size)
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        if not isinstance(obj, dict):
+            raise ValueError("Fixture elements must be objects.")
+        yield obj
+        position = end
+
+
+def _next_token(stream, read_size, buffer, position, eof):
+    """
+    Skip whitespace and the array punctuation between elements.
+
+    Reads more of the stream while the buffer holds nothing else.
+
+    Returns:
+        tuple: (buffer, position, eof), with `buffer[position]` the first
+        character of the next token.
+
+    Raises:
+        ValueError: If the stream ends first.
+    """
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            return buffer, position, eof
+        if eof:
+            raise ValueError("Unexpected end of fixture.")
+        buffer, position = stream.read(read_size), 0
+        eof = not buffer
+
+
+class Importer:
+    """
+    Turn fixture objects into model instances and insert them in batches.
+
+    Foreign keys between users, questions, choices and votes are checked
+    against in-memory maps of the rows already in the database or seen
+    earlier in the import, so dangling rows are skipped up front instead
+    of failing a whole transaction when it commits.
+    """
+
+    def __init__(self, batch_size):
+        """Load the keys of the existing users, questions and choices."""
+        self.batch_size = batch_size
+        self.usernames = dict(User.objects.values_list('username', 'pk'))
+        self.users = set(self.usernames.values())
+        self.questions = set(Question.objects.values_list('pk', flat=True))
+        self.choices = dict(Choice.objects.values_list('pk', 'question_id'))
+        self.touched = set()
+        self.skipped = Counter()
+        self._pending = {}
+        self._m2m = {}
+        self._fields = {}
+
+    def add(self, data):
+        """
+        Queue one fixture object for insertion.
+
+        Returns:
+            bool: True if the object was queued, False if it was skipped
+            because it references rows that do not exist.
+        """
+        try:
+            model = apps.get_model(data['model'])
+        except (KeyError, LookupError) as e:
+            raise CommandError(f"Invalid fixture object: {e}")
+        instance, m2m = self._build(model, data.get('pk'), data['fields'])
+        if not self._resolve(instance):
+            self.skipped[model._meta.label] += 1
+            return False
+        self._pending.setdefault(model, []).append(instance)
+        for field, values in m2m:
+            self._m2m.setdefault(field, []).extend(
+                (instance.pk, value) for value in values
+            )
+        return True
+
+    def _model_fields(self, model):
+        """Return the fixture fields of a model by name."""
+        if model not in self._fields:
+            opts = model._meta
+            self._fields[model] = {
+                field.name: field
+                for field in opts.concrete_fields + opts.many_to_many
+            }
+        return self._fields[model]
+
+    def _build(self, model, pk, values):
+        """Return an unsaved instance and its many-to-many values."""
+        fields = self._model_fields(model)
+        kwargs = {}
+        m2m = []
+        if pk is not None:
+            kwargs[model._meta.pk.attname] = model._meta.pk.to_python(pk)
+        for name, value in values.items():
+            field = fields.get(name)
+            if field is None:
+                raise CommandError(
+                    f"{model._meta.label} has no field named '{name}'."
+                )
+            if field.many_to_many:
+                m2m.append((field, value))
+            elif field.remote_field and value is not None:
+                kwargs[field.attname] = self._foreign_key(field, value)
+            else:
+                kwargs[field.attname] = field.to_python(value)
+        return model(**kwargs), m2m
+
+    def _foreign_key(self, field, value):
+        """Convert a foreign key value, resolving natural keys of users."""
+        if isinstance(value, list):
+            if field.related_model is not User:
+                raise CommandError(
+                    f"Natural keys are not supported for {field.name}."
+                )
+            return self.usernames.get(value[0])
+        return field.target_field.to_python(value)
+
+    def _resolve(self, instance):
+        """Check the foreign keys of an instance and record its key."""
+        if isinstance(instance, User):
+            self.users.add(instance.pk)
+            self.usernames[instance.username] = instance.pk
+        elif isinstance(instance, Question):
+            self.questions.add(instance.pk)
+        elif isinstance(instance, Choice):
+            if instance.question_id not in self.questions:
+                return False
+            self.choices[instance.pk] = instance.question_id
+            self.touched.add(instance.question_id)
+        elif isinstance(instance, Vote):
+            question_id = self.choices.get(instance.choice_id)
+            if question_id is None or instance.user_id not in self.users:
+                return False
+            if instance.choice_question_id is None:
+                instance.choice_question_id = question_id
+            elif instance.choice_question_id != question_id:
+                return False
+            self.touched.add(question_id)
+        return True
+
+    def flush(self):
+        """
+        Insert every queued instance, in the order models first appeared.
+
+        Rows whose primary key already exists are updated, as loaddata
+        does; fields the application maintains itself are left alone.
+        A user has one vote per question, so votes are matched on the
+        user and question instead and the last one in the fixture wins.
+
+        Returns:
+            int: The number of rows written.
+        """
+        written = 0
+        for model, instances in self._pending.items():
+            if not instances:
+                continue
+            unique_fields = [model._meta.pk.name]
+            if model is Vote:
+                unique_fields = ['user', 'choice_question']
+                instances[:] = {
+                    (vote.user_id, vote.choice_question_id): vote
+                    for vote in instances
+                }.values()
+            update_fields = [
+                field.name for field in model._meta.concrete_fields
+                if field.editable and not field.primary_key
+                and field.name not in unique_fields
+            ]
+            model.objects.bulk_create(
+                instances,
+                batch_size=self.batch_size,
+                update_conflicts=bool(update_fields),
+                ignore_conflicts=not update_fields,
+                unique_fields=unique_fields if update_fields else None,
+                update_fields=update_fields or None,
+            )
+            written += len(instances)
+            instances.clear()
+        for field, pairs in self._m2m.items():
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            through.objects.bulk_create(
+                [through(**{source: a, target: b}) for a, b in pairs],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            pairs.clear()
+        return written
+
+
+class Command(BaseCommand):
+    """Stream JSON fixtures into the database with batched inserts."""
+
+    help = (
+        "Import large JSON fixtures (as written by dumpdata) without loading "
+        "them into memory. Rows are inserted with bulk_create in batches "
+        "and committed in chunks. Give users and questions before votes. "
+        "If an import fails, the chunks committed before the error are "
+        "kept; run it again to finish, as existing rows are updated in "
+        "place."
+    )
+
+    def add_arguments(self, parser):
+        """Accept the fixture paths and the batch sizes."""
+        parser.add_argument(
+            'fixtures', nargs='+',
+            help="Fixture files, optionally gzip-compressed (.gz).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help="Rows per INSERT statement (default: 2000).",
+        )
+        parser.add_argument(
+            '--transaction-size', type=int, default=50000,
+            help="Rows committed per transaction (default: 50000).",
+        )
+
+    def handle(self, *args, **options):
+        """Import every fixture and report the throughput."""
+        transaction_size = options['transaction_size']
+        if options['batch_size'] < 1 or transaction_size < 1:
+            raise CommandError("Batch and transaction sizes must be positive.")
+        importer = Importer(options['batch_size'])
+        total = 0
+        start = time.perf_counter()
+        try:
+            for path in options['fixtures']:
+                total += self._import(
+                    importer, path, transaction_size, options['verbosity']
+                )
+        finally:
+            # Chunks committed before a failure stay, so their counters and
+            # cached pages are brought up to date either way.
+            self._finish(importer)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} rows in {elapsed:.1f}s "
+            f"({self._rate(total, elapsed)} rows/s)."
+        ))
+
+    def _import(self, importer, path, transaction_size, verbosity):
+        """
+        Import one fixture, committing every `transaction_size` rows.
+
+        Returns:
+            int: The number of rows written.
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        start = time.perf_counter()
+        rows = 0
+        try:
+            with opener(path, 'rt', encoding='utf-8') as stream:
+                objects = iter_fixture(stream)
+                more = True
+                while more:
+                    written, more = self._import_chunk(
+                        importer, objects, transaction_size
+                    )
+                    rows += written
+                    if more and verbosity > 1:
+                        self._progress(path, rows, start)
+        except (OSError, ValueError, ValidationError, IntegrityError) as e:
+            raise CommandError(f"Could not import {path}: {e}")
+        self._progress(path, rows, start)
+        return rows
+
+    @staticmethod
+    def _import_chunk(importer, objects, size):
+        """
+        Queue up to `size` objects and write them in one transaction.
+
+        Returns:
+            tuple: (rows written, True if the fixture may hold more objects)
+        """
+        with transaction.atomic():
+            queued = 0
+            for data in objects:
+                queued += importer.add(data)
+                if queued >= size:
+                    break
+            return importer.flush(), queued >= size
+
+    def _finish(self, importer):
+        """Recount the votes of the imported questions and expire them."""
+        touched = importer.touched
+        if touched:
+            questions = Question.objects.filter(pk__in=touched)
+            Vote.objects.rebuild_counts(questions)
+            questions.bump_results()
+            pagecache.purge(touched)
+        for label, count in importer.skipped.items():
+            self.stderr.write(self.style.WARNING(
+                f"Skipped {count} {label} rows with unknown references."
+            ))
+
+    def _progress(self, path, rows, start):
+        """Report the rows imported from a fixture so far."""
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{path}: {rows} rows ({self._rate(rows, elapsed)} rows/s)"
+        )
+
+    @staticmethod
+    def _rate(rows, elapsed):
+        """Return rows per second, rounded."""
+        return round(rows / elapsed) if elapsed else rows
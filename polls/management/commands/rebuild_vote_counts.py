@@ -0,0 +1,27 @@
+"""Management command that rebuilds the stored per-choice vote counters."""
+from django.core.management.base import BaseCommand
+
+from polls.models import Question, Vote
+
+
+class Command(BaseCommand):
+    """Recompute Choice.vote_count from the Vote rows."""
+
+    help = "Rebuild the stored per-choice vote counters from Vote rows."
+
+    def add_arguments(self, parser):
+        """Accept an optional list of question ids to limit the rebuild."""
+        parser.add_argument(
+            'question_ids', nargs='*',
+            help="Only rebuild the choices of these questions.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the rebuild and report how many counters were corrected."""
+        questions = None
+        if options['question_ids']:
+            questions = Question.objects.filter(pk__in=options['question_ids'])
+        fixed = Vote.objects.rebuild_counts(questions)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt vote counters ({fixed} corrected).")
+        )
@@ -0,0 +1,52 @@
+"""Management command that refreshes the SQLite read replicas."""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Copy the primary database into every replica with the backup API."""
+
+    help = "Refresh the SQLite read replicas from the primary database."
+
+    def add_arguments(self, parser):
+        """Accept an optional refresh interval to keep running."""
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep refreshing every INTERVAL seconds instead of once.",
+        )
+
+    def handle(self, *args, **options):
+        """Refresh once, or forever when an interval is given."""
+        replicas = settings.DATABASE_REPLICA_ALIASES
+        if not replicas:
+            raise CommandError("No read replicas configured (DATABASE_REPLICAS).")
+        while True:
+            for alias in replicas:
+                started = time.perf_counter()
+                self.refresh(settings.DATABASES[alias]['NAME'])
+                self.stdout.write(
+                    f"Refreshed {alias} in "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms"
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def refresh(self, replica_name):
+        """
+        Copy the primary into `replica_name` page by page.
+
+        The backup API takes a consistent snapshot of the primary without
+        blocking its writers, and readers of the replica keep seeing the
+        previous copy until the backup commits.
+        """
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        target = sqlite3.connect(replica_name)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
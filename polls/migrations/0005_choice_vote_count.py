@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def populate_vote_count(apps, schema_editor):
+    """Fill the new counter from the existing Vote rows."""
+    Choice = apps.get_model('polls', 'Choice')
+    choices = Choice.objects.annotate(counted=models.Count('vote'))
+    stale = []
+    for choice in choices.iterator():
+        if choice.counted:
+            choice.vote_count = choice.counted
+            stale.append(choice)
+    Choice.objects.bulk_update(stale, ['vote_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_alter_choice_id_alter_question_id_alter_vote_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_vote_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.expressions import RawSQL
+
+
+def deduplicate_votes(apps, schema_editor):
+    """
+    Keep the latest vote per (user, question) and recount touched choices.
+
+    Votes have no timestamp yet, so on SQLite the row inserted last (the
+    highest rowid) is kept. Other databases have no insertion order to go
+    by and keep the vote with the highest id.
+    """
+    Vote = apps.get_model('polls', 'Vote')
+    Choice = apps.get_model('polls', 'Choice')
+    if schema_editor.connection.vendor == 'sqlite':
+        latest = RawSQL('rowid', ()).desc()
+    else:
+        latest = models.F('id').desc()
+    duplicated = (
+        Vote.objects.values('user', 'choice_question')
+        .annotate(rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    touched = set()
+    for group in duplicated.iterator():
+        votes = Vote.objects.filter(
+            user=group['user'], choice_question=group['choice_question']
+        ).order_by(latest)
+        extra = list(votes.values_list('id', 'choice_id')[1:])
+        Vote.objects.filter(pk__in=[vote_id for vote_id, _ in extra]).delete()
+        touched.update(choice_id for _, choice_id in extra)
+    for choice in Choice.objects.filter(pk__in=touched).annotate(
+            counted=models.Count('vote')):
+        choice.vote_count = choice.counted
+        choice.save(update_fields=['vote_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_choice_vote_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'choice_question'), name='unique_vote_per_user_question'),
+        ),
+    ]
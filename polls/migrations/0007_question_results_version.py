@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_vote_unique_user_question'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='results_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_question_results_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='results_updated',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_question_results_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='date voted'),
+        ),
+    ]
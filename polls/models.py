@@ -1,11 +1,33 @@
 """Defines the Question and Choice models for the KU Polls application."""
 import datetime
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+class QuestionQuerySet(models.QuerySet):
+    """QuerySet of questions."""
+
+    def bump_results(self):
+        """
+        Mark the results of the selected questions as changed.
+
+        Increments their results_version, which expires cached tallies and
+        ETags, and stamps results_updated for Last-Modified headers.
+
+        Returns:
+            int: The number of questions updated.
+        """
+        return self.update(
+            results_version=F('results_version') + 1,
+            results_updated=timezone.now(),
+        )
+
+
 class Question(models.Model):
     """Model representing a poll question."""
 
@@ -13,6 +35,10 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published', default=timezone.now)
     end_date = models.DateTimeField('date ended', null=True)
+    results_version = models.PositiveIntegerField(default=0, editable=False)
+    results_updated = models.DateTimeField(null=True, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
 
     def __str__(self):
         """
@@ -63,12 +89,12 @@ class Choice(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
-    # votes = models.IntegerField(default=0)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
 
     @property
     def votes(self):
-        """Returns the votes for this choice."""
-        return self.vote_set.count()
+        """Returns the stored vote counter for this choice."""
+        return self.vote_count
 
     def __str__(self):
         """
@@ -80,6 +106,80 @@ class Choice(models.Model):
         return self.choice_text
 
 
+class VoteManager(models.Manager):
+    """Manager that keeps the per-choice vote counters in step with votes."""
+
+    def cast(self, user, choice):
+        """
+        Record or move the vote of `user` on the question of `choice`.
+
+        The vote is written with a single INSERT ... ON CONFLICT DO UPDATE
+        against the (user, choice_question) unique constraint, and both
+        affected counters are adjusted with a single UPDATE, all inside one
+        transaction so the counters never drift from the votes. Bumping the
+        question's results version first locks the question, so concurrent
+        votes on it read the previous choice one after another.
+
+        Returns:
+            The id of the previously selected choice, or None if this is
+            the user's first vote on the question.
+        """
+        with transaction.atomic():
+            Question.objects.filter(pk=choice.question_id).bump_results()
+            previous_choice_id = self.filter(
+                user=user, choice_question_id=choice.question_id
+            ).values_list('choice_id', flat=True).first()
+            if previous_choice_id == choice.pk:
+                # Nothing changed, so the results keep their version.
+                transaction.set_rollback(True)
+                return previous_choice_id
+            self.bulk_create(
+                [Vote(user=user, choice=choice,
+                      choice_question_id=choice.question_id)],
+                update_conflicts=True,
+                unique_fields=['user', 'choice_question'],
+                update_fields=['choice', 'voted_at'],
+            )
+            Choice.objects.filter(
+                pk__in=[choice.pk, previous_choice_id]
+            ).update(vote_count=Case(
+                When(pk=choice.pk, then=F('vote_count') + 1),
+                default=F('vote_count') - 1,
+            ))
+        return previous_choice_id
+
+    def rebuild_counts(self, questions=None):
+        """
+        Recompute the stored vote counters from the Vote rows.
+
+        Args:
+            questions: Optional queryset or iterable of questions to limit
+                the rebuild to. All choices are rebuilt when omitted.
+
+        Returns:
+            int: The number of choices whose counter was changed.
+        """
+        choices = Choice.objects.annotate(
+            counted=models.Count('vote')
+        ).only('id', 'question_id', 'vote_count')
+        if questions is not None:
+            choices = choices.filter(question__in=questions)
+        stale = []
+        for choice in choices.iterator():
+            if choice.vote_count != choice.counted:
+                choice.vote_count = choice.counted
+                stale.append(choice)
+        question_ids = {choice.question_id for choice in stale}
+        with transaction.atomic():
+            Choice.objects.bulk_update(stale, ['vote_count'], batch_size=500)
+            Question.objects.filter(pk__in=question_ids).bump_results()
+        if question_ids:
+            # Imported here because the page cache builds on these models.
+            from . import pagecache
+            pagecache.purge(question_ids)
+        return len(stale)
+
+
 class Vote(models.Model):
     """Model representing a vote cast by a user for a specific choice."""
 
@@ -87,6 +187,21 @@ class Vote(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     choice_question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    voted_at = models.DateTimeField(
+        'date voted', default=timezone.now, db_index=True
+    )
+
+    objects = VoteManager()
+
+    class Meta:
+        """Allow a single vote per user and question."""
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'choice_question'],
+                name='unique_vote_per_user_question',
+            ),
+        ]
 
     def __str__(self):
         """
@@ -96,3 +211,19 @@ class Vote(models.Model):
             str: The text of the choice associated with the vote.
         """
         return f"{self.user.username} voted for {self.choice.choice_text}"
+
+
+@receiver(post_delete, sender=Vote)
+def release_vote_count(sender, instance, **kwargs):
+    """Decrement the counter of the choice a deleted vote pointed at."""
+    Choice.objects.filter(pk=instance.choice_id, vote_count__gt=0).update(
+        vote_count=F('vote_count') - 1
+    )
+    Question.objects.filter(pk=instance.choice_question_id).bump_results()
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def expire_choice_results(sender, instance, **kwargs):
+    """Expire the results of a question whose choices were edited."""
+    Question.objects.filter(pk=instance.question_id).bump_results()
@@ -0,0 +1,245 @@
+"""
+Full-page cache of the poll pages for anonymous visitors.
+
+Pages are stored per path under a generation number: one for the index
+and one per question for its results page. Vote writes and edits of
+questions or choices bump the generations, which purges the affected
+pages. The generations live in the page cache itself, so it must be
+shared by all processes (see polls.E003). Pages are rendered from the
+primary database, never a lagging replica, before they are stored.
+Entries also expire at the next scheduled pub_date or end_date so that
+polls open and close on time.
+"""
+import functools
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db.models import Min, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from mysite import metrics
+from mysite.routers import pin_primary
+from .models import Choice, Question, Vote
+
+
+def _cache():
+    """Return the cache backend for anonymous pages, or None if disabled."""
+    alias = getattr(settings, 'POLLS_PAGE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _generation_key(question_id=None):
+    """Return the key of the index or of a question's page generation."""
+    if question_id is None:
+        return 'polls:pages:generation'
+    return f'polls:pages:generation:{question_id}'
+
+
+def _generation(cache, key):
+    """
+    Return the current generation stored at `key`.
+
+    A missing generation starts from the clock so that pages cached under
+    an evicted generation can never be served again.
+    """
+    return cache.get_or_set(key, time.time_ns())
+
+
+def purge(question_ids=()):
+    """
+    Drop the cached index page and the results pages of some questions.
+
+    Args:
+        question_ids: Ids of the questions whose pages changed.
+    """
+    cache = _cache()
+    if cache is None:
+        return
+    for key in [_generation_key()] + [_generation_key(pk) for pk in question_ids]:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns())
+
+
+def next_boundary(now):
+    """
+    Return the next moment a poll is published or closed, if any.
+
+    Returns:
+        datetime: The earliest pub_date or end_date after `now`, or None.
+    """
+    boundaries = Question.objects.aggregate(
+        next_pub=Min('pub_date', filter=Q(pub_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gt=now)),
+    ).values()
+    return min((b for b in boundaries if b is not None), default=None)
+
+
+def page_timeout(now=None, boundary=None):
+    """
+    Return how long a page may be cached before a poll opens or closes.
+
+    Args:
+        now: The current time, defaults to timezone.now().
+        boundary: The next publication or closing time, looked up from the
+            questions when omitted.
+
+    Returns:
+        int: Seconds, capped at POLLS_PAGE_CACHE_TIMEOUT.
+    """
+    now = now or timezone.now()
+    if boundary is None:
+        boundary = next_boundary(now)
+    timeout = getattr(settings, 'POLLS_PAGE_CACHE_TIMEOUT', 60)
+    if boundary is not None:
+        timeout = min(timeout, (boundary - now).total_seconds())
+    return max(int(timeout), 0)
+
+
+def _cached_page_timeout(cache, generation):
+    """
+    Return the page timeout, reusing the boundary of this generation.
+
+    The next boundary only changes when a question is edited, which bumps
+    the index generation, so it is looked up once per generation.
+    """
+    now = timezone.now()
+    key = f'polls:pages:boundary:{generation}'
+    boundary = cache.get(key)
+    if boundary is None or boundary <= now:
+        boundary = next_boundary(now) or now + timezone.timedelta(days=365)
+        cache.set(key, boundary, None)
+    return page_timeout(now, boundary)
+
+
+def _cacheable_request(request):
+    """Return True for anonymous GET requests without pending messages."""
+    return (
+        _cache() is not None
+        and request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(messages.get_messages(request))
+    )
+
+
+def _page_key(cache, request, kwargs):
+    """
+    Return the cache key of a page and the index generation it was built in.
+
+    Results pages also carry the generation of their question.
+    """
+    index_generation = _generation(cache, _generation_key())
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = f'polls:page:{url}:{index_generation}'
+    question_id = kwargs.get('pk')
+    if question_id is not None:
+        key += f':{_generation(cache, _generation_key(question_id))}'
+    return key, index_generation
+
+
+def _store(cache, key, response, timeout):
+    """Store a response once it is rendered."""
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.add_post_render_callback(
+            lambda r: cache.set(key, r, timeout)
+        )
+    else:
+        cache.set(key, response, timeout)
+
+
+def _storable(response):
+    """Return True for complete responses that do not set cookies."""
+    return (
+        response.status_code == 200 and not response.streaming
+        and not response.cookies
+    )
+
+
+def _lookup(cache, request, kwargs):
+    """
+    Look a page up in the cache.
+
+    Returns:
+        tuple: (key, index generation, cached response or None)
+    """
+    key, generation = _page_key(cache, request, kwargs)
+    response = cache.get(key)
+    metrics.record_cache(hit=response is not None)
+    return key, generation, response
+
+
+def _save(cache, key, generation, response):
+    """Store a complete response until the next poll opens or closes."""
+    if not _storable(response):
+        return
+    timeout = _cached_page_timeout(cache, generation)
+    if timeout:
+        _store(cache, key, response, timeout)
+
+
+def cache_anonymous_page(view):
+    """
+    Serve the decorated view from the page cache for anonymous visitors.
+
+    Authenticated users, requests carrying messages and responses that set
+    cookies always go through the view. Pages that are missing are rendered
+    from the primary database, so a replica that has not caught up with a
+    purge cannot store its stale page again. Async views are supported;
+    their user is resolved with `request.auser()` before any check.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            request.user = await request.auser()
+            if not _cacheable_request(request):
+                return await view(request, *args, **kwargs)
+            cache = _cache()
+            key, generation, response = await sync_to_async(_lookup)(
+                cache, request, kwargs
+            )
+            if response is None:
+                with pin_primary():
+                    response = await view(request, *args, **kwargs)
+                await sync_to_async(_save)(cache, key, generation, response)
+            return response
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            return view(request, *args, **kwargs)
+        cache = _cache()
+        key, generation, response = _lookup(cache, request, kwargs)
+        if response is None:
+            with pin_primary():
+                response = view(request, *args, **kwargs)
+            _save(cache, key, generation, response)
+        return response
+    return wrapper
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def purge_question_pages(sender, instance, **kwargs):
+    """Purge the pages of a question that was edited or deleted."""
+    purge([instance.pk])
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def purge_choice_pages(sender, instance, **kwargs):
+    """Purge the pages of the question of an edited or deleted choice."""
+    purge([instance.question_id])
+
+
+@receiver(post_delete, sender=Vote)
+def purge_vote_pages(sender, instance, **kwargs):
+    """Purge the pages of the question of a deleted vote."""
+    purge([instance.choice_question_id])
@@ -0,0 +1,326 @@
+"""
+Offline corpus of compromised password hashes for the KU Polls application.
+
+The corpus is a file of raw 20-byte SHA-1 digests in ascending order, with
+no header. It is memory-mapped read-only and searched with a binary
+search, so a lookup reads about 30 digests and takes microseconds. The
+pages of the file live in the operating system's page cache and are
+shared by every worker process instead of being loaded into each one.
+
+`build()` writes the corpus from the Have I Been Pwned hash lists; see
+the `build_pwned_corpus` management command. `RangeClient` looks hashes
+up with the online range API instead.
+"""
+import bisect
+import functools
+import hashlib
+import heapq
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DIGEST_SIZE = 20
+
+
+class _Digests:
+    """Read-only sequence view of the digests in a memory map."""
+
+    def __init__(self, buffer):
+        """Wrap a buffer of concatenated digests."""
+        self._buffer = buffer
+
+    def __len__(self):
+        """Return the number of digests."""
+        return len(self._buffer) // DIGEST_SIZE
+
+    def __getitem__(self, index):
+        """Return the digest at `index` as bytes."""
+        start = index * DIGEST_SIZE
+        return self._buffer[start:start + DIGEST_SIZE]
+
+
+class PwnedCorpus:
+    """A memory-mapped, sorted file of compromised SHA-1 digests."""
+
+    def __init__(self, path):
+        """
+        Map the corpus file at `path`.
+
+        Raises:
+            OSError: If the file cannot be opened.
+            ValueError: If the file is not a whole number of digests.
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % DIGEST_SIZE:
+                raise ValueError(f"{self.path} is not a SHA-1 corpus.")
+            # An empty file cannot be mapped; it simply contains nothing.
+            self._map = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if size else b''
+            )
+        self._digests = _Digests(self._map)
+
+    def __len__(self):
+        """Return the number of digests in the corpus."""
+        return len(self._digests)
+
+    def __contains__(self, digest):
+        """Return whether the 20-byte SHA-1 `digest` is in the corpus."""
+        index = bisect.bisect_left(self._digests, digest)
+        return index < len(self._digests) and self._digests[index] == digest
+
+    def contains_password(self, password):
+        """Return whether `password` is a known compromised password."""
+        return hashlib.sha1(password.encode('utf-8')).digest() in self
+
+
+def open_corpus(path):
+    """
+    Return the corpus at `path`, mapping it once per process.
+
+    A rebuilt file is mapped again on the next lookup, so the corpus can
+    be updated without restarting the site.
+
+    Raises:
+        OSError: If the file cannot be opened.
+        ValueError: If the file is not a whole number of digests.
+    """
+    stat = os.stat(path)
+    return _open_corpus(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=4)
+def _open_corpus(path, mtime_ns, size):
+    """Map a version of a corpus file, identified by its mtime and size."""
+    return PwnedCorpus(path)
+
+
+def parse_line(line, prefix=''):
+    """
+    Parse a line of a hash list.
+
+    Lines are `HASH` or `HASH:COUNT` with the hash in hexadecimal. Range
+    files hold only the last 35 characters of each hash; their five
+    character `prefix` is then prepended.
+
+    Returns:
+        tuple: The 20-byte digest and its count (None if the line has no
+        count), or None for a blank line.
+
+    Raises:
+        ValueError: If the line is not a SHA-1 hash.
+    """
+    text, _, count = line.strip().partition(':')
+    if not text:
+        return None
+    if len(text) == 35:
+        text = prefix + text
+    if len(text) != 40:
+        raise ValueError(f"Not a SHA-1 hash: {text}")
+    return bytes.fromhex(text), int(count) if count else None
+
+
+def _write_run(digests, directory):
+    """Sort digests into a temporary run file and return its path."""
+    digests.sort()
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        f.write(b''.join(digests))
+    return f.name
+
+
+def _read_run(path, read_size=1 << 20):
+    """Yield the digests of a run file in order."""
+    read_size -= read_size % DIGEST_SIZE
+    with open(path, 'rb') as f:
+        while block := f.read(read_size):
+            for start in range(0, len(block), DIGEST_SIZE):
+                yield block[start:start + DIGEST_SIZE]
+
+
+def build(digests, output, run_size=10_000_000):
+    """
+    Write a corpus file from digests in any order.
+
+    Digests are sorted in runs of `run_size` in memory, spilled to
+    temporary files next to `output` and merged, so the hash lists do not
+    have to fit in memory. Duplicates are dropped. The file is written
+    under a temporary name and renamed, so a running site never maps a
+    half-written corpus.
+
+    Args:
+        digests: An iterable of 20-byte SHA-1 digests.
+        output: Path of the corpus file to write.
+        run_size: Number of digests sorted in memory at a time.
+
+    Returns:
+        int: The number of digests written.
+    """
+    output = Path(output)
+    directory = output.parent
+    runs = []
+    written = 0
+    try:
+        run = []
+        for digest in digests:
+            run.append(digest)
+            if len(run) >= run_size:
+                runs.append(_write_run(run, directory))
+                run = []
+        if run or not runs:
+            runs.append(_write_run(run, directory))
+        partial = output.with_name(output.name + '.partial')
+        with open(partial, 'wb') as f:
+            previous = None
+            for digest in heapq.merge(*(_read_run(path) for path in runs)):
+                if digest != previous:
+                    f.write(digest)
+                    written += 1
+                    previous = digest
+        os.replace(partial, output)
+    finally:
+        for path in runs:
+            os.unlink(path)
+    return written
+
+
+class RangeUnavailable(Exception):
+    """Raised when a hash range cannot be fetched from the range API."""
+
+
+class RangeClient:
+    """
+    Client of the Have I Been Pwned range API.
+
+    Requests go through one pooled `requests.Session` with strict connect
+    and read timeouts. Parsed ranges are kept as sets of hash suffixes in
+    a bounded LRU cache with a TTL, so the popular prefixes are looked up
+    in memory. After `failure_threshold` failures in a row, the circuit
+    opens: lookups fail at once for `reset_timeout` seconds instead of
+    every signup waiting for the API to time out, then one request is
+    let through to probe it.
+    """
+
+    def __init__(self, url, timeout=2.0, cache_size=4096, cache_ttl=86400,
+                 failure_threshold=5, reset_timeout=30.0, pool_size=10):
+        """
+        Init the client.
+
+        Args:
+            url: Base URL of the range API; the prefix is appended to it.
+            timeout: Connect and read timeout in seconds.
+            cache_size: Maximum number of ranges kept in memory.
+            cache_ttl: Seconds a range is kept.
+            failure_threshold: Failures in a row that open the circuit.
+            reset_timeout: Seconds the circuit stays open.
+            pool_size: Connections kept open to the API.
+        """
+        self.url = url
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=0,
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._ranges = OrderedDict()
+        self._failures = 0
+        self._open_until = 0.0
+
+    def is_compromised(self, password):
+        """
+        Return whether `password` is in the range API's hash lists.
+
+        Raises:
+            RangeUnavailable: If its range could not be fetched.
+        """
+        sha1 = hashlib.sha1(password.encode('utf-8')).hexdigest().upper()
+        return sha1[5:] in self.suffixes(sha1[:5])
+
+    def suffixes(self, prefix):
+        """
+        Return the hash suffixes of the range of a five character prefix.
+
+        Raises:
+            RangeUnavailable: If the range is not cached and could not be
+                fetched.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._ranges.get(prefix)
+            if cached is not None and cached[0] > now:
+                self._ranges.move_to_end(prefix)
+                return cached[1]
+            if now < self._open_until:
+                raise RangeUnavailable("The range API circuit is open.")
+            if self._failures >= self.failure_threshold:
+                # Let this request probe the API; others keep failing fast.
+                self._open_until = now + self.reset_timeout
+        try:
+            response = self.session.get(
+                self.url + prefix, timeout=self.timeout
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self._failed()
+            raise RangeUnavailable(str(e)) from e
+        suffixes = frozenset(self._parse(response.text))
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._ranges[prefix] = (now + self.cache_ttl, suffixes)
+            self._ranges.move_to_end(prefix)
+            while len(self._ranges) > self.cache_size:
+                self._ranges.popitem(last=False)
+        return suffixes
+
+    def _failed(self):
+        """Count a failure and open the circuit at the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.reset_timeout
+
+    @staticmethod
+    def _parse(text):
+        """Yield the suffixes of a range response, skipping padding."""
+        for line in text.splitlines():
+            suffix, _, count = line.strip().partition(':')
+            if suffix and count.strip() != '0':
+                yield suffix.upper()
+
+
+@functools.lru_cache(maxsize=4)
+def _range_client(url, timeout, cache_size, cache_ttl, failure_threshold,
+                  reset_timeout):
+    """Return the shared client for one configuration."""
+    return RangeClient(
+        url, timeout=timeout, cache_size=cache_size, cache_ttl=cache_ttl,
+        failure_threshold=failure_threshold, reset_timeout=reset_timeout,
+    )
+
+
+def range_client():
+    """Return the process-wide RangeClient configured in the settings."""
+    return _range_client(
+        settings.PWNED_PASSWORDS_API_URL,
+        settings.PWNED_PASSWORDS_API_TIMEOUT,
+        settings.PWNED_PASSWORDS_CACHE_SIZE,
+        settings.PWNED_PASSWORDS_CACHE_TTL,
+        settings.PWNED_PASSWORDS_BREAKER_THRESHOLD,
+        settings.PWNED_PASSWORDS_BREAKER_RESET,
+    )
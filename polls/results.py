@@ -0,0 +1,117 @@
+"""
+Aggregated poll results for the KU Polls application.
+
+Every result page and API should read tallies through this module so that
+the number of queries stays constant no matter how many choices a poll has.
+"""
+from dataclasses import dataclass
+
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Choice, Question
+
+
+@dataclass(frozen=True)
+class ChoiceResult:
+    """The tally of a single choice."""
+
+    id: object
+    choice_text: str
+    votes: int
+    percentage: float
+
+
+@dataclass(frozen=True)
+class QuestionResults:
+    """The tallies of every choice of a question and their total."""
+
+    question_id: object
+    choices: tuple
+    total: int
+
+    def as_dict(self):
+        """
+        Return the results as JSON-serializable primitives.
+
+        Returns:
+            dict: The question id, total and one entry per choice.
+        """
+        return {
+            'question': str(self.question_id),
+            'total': self.total,
+            'choices': [
+                {
+                    'id': str(choice.id),
+                    'choice_text': choice.choice_text,
+                    'votes': choice.votes,
+                    'percentage': choice.percentage,
+                }
+                for choice in self.choices
+            ],
+        }
+
+
+def _choices(question_id):
+    """Return the query reading the tallies of a question's choices."""
+    return Choice.objects.filter(question_id=question_id).values_list(
+        'id', 'choice_text', 'vote_count'
+    )
+
+
+def _build_results(question_id, rows):
+    """Derive the total and percentages from (id, text, count) rows."""
+    total = sum(count for _, _, count in rows)
+    choices = tuple(
+        ChoiceResult(
+            id=choice_id,
+            choice_text=text,
+            votes=count,
+            percentage=round(100 * count / total, 1) if total else 0.0,
+        )
+        for choice_id, text, count in rows
+    )
+    return QuestionResults(question_id=question_id, choices=choices, total=total)
+
+
+def get_results(question):
+    """
+    Tally the votes of every choice of a question in one query.
+
+    The counts come from the stored Choice.vote_count counters, so this is
+    a single indexed read of the question's choices; the total and the
+    percentages are derived from those rows.
+
+    Args:
+        question: A Question instance or its primary key.
+
+    Returns:
+        QuestionResults: The per-choice tallies, total and percentages.
+    """
+    question_id = getattr(question, 'pk', question)
+    return _build_results(question_id, list(_choices(question_id)))
+
+
+async def aget_results(question):
+    """Async version of get_results() using async iteration."""
+    question_id = getattr(question, 'pk', question)
+    rows = [row async for row in _choices(question_id)]
+    return _build_results(question_id, rows)
+
+
+def top_questions(limit=5):
+    """
+    Return the published questions with the most votes.
+
+    Args:
+        limit: The maximum number of questions to return.
+
+    Returns:
+        QuerySet: Questions annotated with `total_votes`, most voted first.
+    """
+    return Question.objects.filter(
+        pub_date__lte=timezone.now()
+    ).annotate(
+        total_votes=Coalesce(Sum('choice__vote_count'), 0)
+    ).order_by('-total_votes', '-pub_date')[:limit]
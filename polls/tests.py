@@ -1,12 +1,64 @@
 """Contains test cases for the KU Polls application models and views."""
+import asyncio
+import concurrent.futures
 import datetime
+import gzip
+import hashlib
+import importlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import patch
 
-from django.test import TestCase
-from django.urls import reverse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher, check_password, make_password,
+)
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import (
+    IntegrityError, OperationalError, connection, transaction,
+)
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
+from captcha.models import CaptchaStore
 
+import mysite.urls
+from mysite import hashers, metrics, storage
+from mysite.hashers import PooledPBKDF2PasswordHasher
+from mysite.log import JsonFormatter, QueueFileHandler, SamplingFilter
+from mysite.middleware import ReplicaPinningMiddleware
+from mysite.routers import ReplicaRouter, pin_primary, replica_reads
+from mysite.settings.base import env_bool
+from mysite.testing import QueryBudgetMixin
+from . import cache as results_cache
+from . import captchas
+from . import checks
+from . import export
+from . import ingest
+from . import live
+from . import pagecache
+from . import pwned
+from . import urls as polls_urls
+from .management.commands.import_fixtures import iter_fixture
+from .captchas import CaptchaPool
+from .forms import CustomSignupForm
 from .models import Question, Choice, Vote
+from .results import get_results, top_questions
+from .validators import CustomPasswordValidator
 
 class QuestionModelTests(TestCase):
     """Test The Model."""
@@ -98,6 +150,13 @@ class QuestionModelTests(TestCase):
         self.assertIs(question.can_vote(), True)
 
 
+def reload_urlconf():
+    """Rebuild the URLconf after POLLS_ASYNC_VIEWS changed."""
+    importlib.reload(polls_urls)
+    importlib.reload(mysite.urls)
+    clear_url_caches()
+
+
 def create_question(question_text, days):
     """
     Create a question with the given `question_text` and published the
@@ -108,9 +167,16 @@ def create_question(question_text, days):
     return Question.objects.create(question_text=question_text, pub_date=time)
 
 
-class QuestionIndexViewTests(TestCase):
+class QuestionIndexViewTests(QueryBudgetMixin, TestCase):
     """Test The Index View."""
 
+    def test_query_budget(self):
+        """The index runs a fixed number of queries however many polls exist."""
+        for i in range(10):
+            create_question(question_text=f"Past question {i}.", days=-i - 1)
+        with self.assertMaxQueries(3):
+            self.client.get(reverse('polls:index'))
+
     def test_no_questions(self):
         """If no questions exist, an appropriate message is displayed."""
         response = self.client.get(reverse('polls:index'))
@@ -180,6 +246,26 @@ class QuestionDetailViewTests(TestCase):
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
 
+    def test_detail_query_count(self):
+        """
+        The question, its choices and the caller's vote take two queries.
+
+        With the default per-process session cache, sessions and users are
+        read from the database, one query each.
+        """
+        user = User.objects.create_user(username='testuser', password='12345')
+        question = create_question(question_text='Past Question.', days=-5)
+        choices = [
+            Choice.objects.create(question=question, choice_text=f"Choice {i}")
+            for i in range(5)
+        ]
+        Vote.objects.cast(user, choices[3])
+        self.client.login(username='testuser', password='12345')
+        url = reverse('polls:detail', args=(question.id,))
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['user_choice_id'], choices[3].id)
+
 
 class VoteViewTests(TestCase):
     """Test the voting view for the KU Polls application."""
@@ -199,6 +285,21 @@ class VoteViewTests(TestCase):
         self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(Vote.objects.first().choice, self.choice)
 
+    def test_vote_query_count(self):
+        """
+        A vote reads its choice once and writes with three statements.
+
+        Besides the session and the user, the choice and its question are
+        read in one query; then the results are bumped, the previous vote
+        is read, the vote is upserted and the counters are adjusted, within
+        a savepoint.
+        """
+        self.client.login(username='testuser', password='12345')
+        url = reverse('polls:vote', args=(self.question.id,))
+        with self.assertNumQueries(9):
+            self.client.post(url, {'choice': self.choice.id})
+        self.assertEqual(Vote.objects.get().choice, self.choice)
+
     def test_vote_after_end_date(self):
         """Attempting to vote after the question's end_date should fail."""
         past_question = create_question(question_text="Past Question", days=-10)
@@ -238,3 +339,1833 @@ class VoteViewTests(TestCase):
 
         # Assert that the log contains the expected warning message
         self.assertTrue(any("Choice ID not found in POST data" in message for message in log.output))
+
+
+class VoteCountTests(TestCase):
+    """Test the stored per-choice vote counters."""
+
+    def setUp(self):
+        """Set up a question with two choices and a logged in voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.client.login(username='testuser', password='12345')
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_increments_counter(self):
+        """A first vote increments the counter of the selected choice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+
+    def test_changed_vote_moves_counter(self):
+        """Changing a vote moves one count from the old choice to the new one."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 0)
+        self.assertEqual(self.choice2.votes, 1)
+
+    def test_repeated_vote_keeps_counter(self):
+        """Voting for the same choice twice counts once."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+
+    def test_deleted_vote_releases_counter(self):
+        """Deleting a vote decrements the counter of its choice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        Vote.objects.all().delete()
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 0)
+
+    def test_rebuild_vote_counts_command(self):
+        """rebuild_vote_counts restores counters that drifted from the votes."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        Choice.objects.filter(pk=self.choice1.pk).update(vote_count=7)
+        Choice.objects.filter(pk=self.choice2.pk).update(vote_count=3)
+        call_command('rebuild_vote_counts', stdout=StringIO())
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+        self.assertEqual(self.choice2.votes, 0)
+
+
+class ResultsServiceTests(TestCase):
+    """Test the aggregated results service."""
+
+    def setUp(self):
+        """Set up a question with votes spread over its choices."""
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choices = [
+            Choice.objects.create(question=self.question, choice_text=f"Choice {i}")
+            for i in range(4)
+        ]
+        for i in range(3):
+            user = User.objects.create_user(username=f'voter{i}', password='12345')
+            Vote.objects.cast(user, self.choices[0] if i else self.choices[1])
+
+    def test_get_results_totals_and_percentages(self):
+        """get_results() returns counts, the total and percentages."""
+        results = get_results(self.question)
+        by_text = {choice.choice_text: choice for choice in results.choices}
+        self.assertEqual(results.total, 3)
+        self.assertEqual(by_text['Choice 0'].votes, 2)
+        self.assertEqual(by_text['Choice 0'].percentage, 66.7)
+        self.assertEqual(by_text['Choice 3'].percentage, 0.0)
+
+    def test_get_results_uses_one_query(self):
+        """The number of queries does not depend on the number of choices."""
+        with self.assertNumQueries(1):
+            get_results(self.question)
+
+    def test_results_view_shows_tallies(self):
+        """The results page renders the tallies from the service."""
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['results'].total, 3)
+        self.assertContains(response, "66.7")
+
+    def test_top_questions_ordered_by_votes(self):
+        """top_questions() returns the most voted questions first."""
+        quiet = create_question(question_text="Quiet Question", days=-2)
+        top = list(top_questions(limit=2))
+        self.assertEqual(top, [self.question, quiet])
+        self.assertEqual(top[0].total_votes, 3)
+        self.assertEqual(top[1].total_votes, 0)
+
+
+class VoteUniquenessTests(TestCase):
+    """Test the one-vote-per-question constraint and the upsert write path."""
+
+    def setUp(self):
+        """Set up a question with two choices and a voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+
+    def test_duplicate_vote_rejected(self):
+        """The database rejects a second vote row for the same user and question."""
+        Vote.objects.create(user=self.user, choice=self.choice1, choice_question=self.question)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, choice=self.choice2, choice_question=self.question)
+
+    def test_cast_moves_existing_vote(self):
+        """cast() updates the existing row in place instead of adding one."""
+        self.assertIsNone(Vote.objects.cast(self.user, self.choice1))
+        self.assertEqual(Vote.objects.cast(self.user, self.choice2), self.choice1.id)
+        self.assertEqual(Vote.objects.get().choice, self.choice2)
+
+    def test_cast_reads_previous_vote_after_taking_the_write_lock(self):
+        """cast() bumps the results before it reads the previous vote."""
+        Vote.objects.cast(self.user, self.choice1)
+        with CaptureQueriesContext(connection) as queries:
+            previous_choice_id = Vote.objects.cast(self.user, self.choice2)
+        self.assertEqual(previous_choice_id, self.choice1.id)
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))
+        ]
+        self.assertEqual(
+            [sql.split()[0] for sql in statements],
+            ['UPDATE', 'SELECT', 'INSERT', 'UPDATE'],
+        )
+        self.assertIn('results_version', statements[0])
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+
+    def test_repeated_cast_keeps_results_version(self):
+        """Casting the same vote again leaves the results unchanged."""
+        Vote.objects.cast(self.user, self.choice1)
+        self.question.refresh_from_db()
+        version = self.question.results_version
+        self.assertEqual(
+            Vote.objects.cast(self.user, self.choice1), self.choice1.id
+        )
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, version)
+
+    def test_vote_with_malformed_choice_id(self):
+        """A malformed choice id is reported as an invalid selection."""
+        self.client.login(username='testuser', password='12345')
+        url = reverse('polls:vote', args=(self.question.id,))
+        with self.assertLogs('polls', level='WARNING') as log:
+            response = self.client.post(url, {'choice': 'not-a-uuid'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any("Invalid choice ID" in message for message in log.output))
+        self.assertEqual(Vote.objects.count(), 0)
+
+
+class ResultsCacheTests(TestCase):
+    """Test the versioned results cache."""
+
+    def setUp(self):
+        """Set up a question with a choice and a voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_second_request_is_served_from_cache(self):
+        """A repeated results request does not read the choices again."""
+        self.client.get(self.url)
+        before = results_cache.stats()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        after = results_cache.stats()
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'], before['misses'])
+
+    def test_vote_invalidates_cached_results(self):
+        """A vote bumps the results version so the new tally is shown."""
+        self.client.get(self.url)
+        self.question.refresh_from_db()
+        version = self.question.results_version
+        Vote.objects.cast(self.user, self.choice)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, version + 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['results'].total, 1)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'results': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir() + '/polls-results-test',
+        },
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_file_based_backend(self):
+        """The cache works with the file-based backend."""
+        Vote.objects.cast(self.user, self.choice)
+        self.question.refresh_from_db()
+        first = results_cache.get_results(self.question)
+        with self.assertNumQueries(0):
+            second = results_cache.get_results(self.question)
+        self.assertEqual(first, second)
+
+    def test_cache_stats_requires_staff(self):
+        """The counters are only exposed to staff members."""
+        url = reverse('polls:cache_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user(username='staff', password='12345', is_staff=True)
+        self.client.login(username='staff', password='12345')
+        self.assertIn('hits', self.client.get(url).json())
+
+
+@override_settings(POLLS_VOTE_INGESTION='buffered')
+class VoteBufferTests(TestCase):
+    """Test the write-behind vote ingestion buffer."""
+
+    def setUp(self):
+        """Set up a question, two choices and an empty buffer without a flusher thread."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.buffer = ingest.VoteBuffer(max_batch=10, max_delay=0)
+        patcher = patch.object(ingest, '_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.login(username='testuser', password='12345')
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_is_buffered_until_flush(self):
+        """A buffered vote is not written until the buffer flushes."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+        self.assertEqual(Vote.objects.get().choice, self.choice1)
+
+    def test_last_write_wins(self):
+        """Only the latest buffered vote per user and question is written."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        self.buffer.flush()
+        self.assertEqual(Vote.objects.get().choice, self.choice2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+
+    def test_flush_moves_committed_vote(self):
+        """Flushing a changed vote moves the counters of an existing vote."""
+        Vote.objects.cast(self.user, self.choice1)
+        self.question.refresh_from_db()
+        version = self.question.results_version
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice2.pk)
+        self.buffer.flush()
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.results_version, version + 1)
+
+    def test_size_trigger_flushes(self):
+        """Reaching the batch size writes the batch."""
+        self.buffer.max_batch = 2
+        other = User.objects.create_user(username='other', password='12345')
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.buffer.submit(other.pk, self.question.pk, self.choice1.pk)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_buffered_vote_redirects_to_detail(self):
+        """Voters go to the detail page, as the results lack their vote yet."""
+        response = self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertRedirects(
+            response, reverse('polls:detail', args=(self.question.id,)),
+            fetch_redirect_response=False,
+        )
+        response = self.client.get(response.url)
+        self.assertEqual(response.context['user_choice_id'], self.choice1.id)
+        self.assertContains(response, "Your vote &#x27;Choice 1&#x27; was recorded")
+
+    def test_detail_shows_pending_vote(self):
+        """The voter sees their own pending vote selected on the detail page."""
+        self.client.post(self.url, {'choice': self.choice2.id})
+        response = self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertEqual(response.context['user_choice_id'], self.choice2.id)
+
+    def test_drain_writes_pending_votes(self):
+        """drain() flushes everything still pending."""
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.buffer.drain()
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_submit_after_drain_is_written(self):
+        """Votes submitted after drain() are written immediately."""
+        self.buffer.drain()
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_vote_for_deleted_choice_is_dropped(self):
+        """A vote whose choice was deleted meanwhile is not written."""
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice2.pk)
+        self.choice2.delete()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_integrity_error_drops_only_failing_vote(self):
+        """A batch that breaks a constraint is written vote by vote."""
+        other = User.objects.create_user(username='other', password='12345')
+        write_batch = ingest.write_batch
+
+        def fail_for_other(batch):
+            if (other.pk, self.question.pk) in batch:
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            write_batch(batch)
+
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        self.buffer.submit(other.pk, self.question.pk, self.choice1.pk)
+        with patch.object(ingest, 'write_batch', fail_for_other), \
+                self.assertLogs('polls', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Vote.objects.get().user, self.user)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_failed_flushes_never_drop_votes(self):
+        """A vote is kept through repeated failed flushes until it is stored."""
+        self.buffer.max_retries = 2
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        write_batch = ingest.write_batch
+        attempts = []
+
+        def locked_four_times(batch):
+            attempts.append(batch)
+            if len(attempts) <= 4:
+                raise OperationalError("database is locked")
+            write_batch(batch)
+
+        with patch.object(ingest, 'write_batch', locked_four_times):
+            for _ in range(4):
+                with self.assertRaises(OperationalError):
+                    self.buffer.flush()
+                self.assertEqual(len(self.buffer), 1)
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(len(attempts), 5)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Vote.objects.get().choice, self.choice1)
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+
+    def test_drain_retries_failed_flush(self):
+        """drain() retries a failing flush instead of losing the votes."""
+        self.buffer.submit(self.user.pk, self.question.pk, self.choice1.pk)
+        write_batch = ingest.write_batch
+        attempts = []
+
+        def locked_once(batch):
+            attempts.append(batch)
+            if len(attempts) == 1:
+                raise OperationalError("database is locked")
+            write_batch(batch)
+
+        with patch.object(ingest, 'write_batch', locked_once), \
+                self.assertLogs('polls', 'ERROR'):
+            self.buffer.drain()
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(Vote.objects.get().choice, self.choice1)
+
+    def test_failed_flushes_back_off(self):
+        """Timed flushes wait longer after every failure, up to a cap."""
+        buffer = ingest.VoteBuffer(max_delay=0.5)
+        self.assertEqual(buffer.retry_delay(), 0.5)
+        buffer._failures = 3
+        self.assertEqual(buffer.retry_delay(), 4)
+        buffer._failures = 20
+        self.assertEqual(buffer.retry_delay(), ingest.MAX_RETRY_DELAY)
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica1', 'replica2'])
+class ReplicaRouterTests(TestCase):
+    """Test the read-replica database router and primary pinning."""
+
+    def setUp(self):
+        """Set up a router instance."""
+        self.router = ReplicaRouter()
+
+    def test_poll_reads_go_to_replica_in_replica_block(self):
+        """Poll reads inside replica_reads() use one of the replicas."""
+        with replica_reads():
+            self.assertIn(self.router.db_for_read(Question), ['replica1', 'replica2'])
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_auth_reads_stay_on_primary(self):
+        """Users and sessions are never read from a replica."""
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_pinned_reads_stay_on_primary(self):
+        """Pinned requests read poll data from the primary."""
+        with replica_reads(), pin_primary():
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_writes_go_to_primary(self):
+        """All writes go to the primary."""
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Vote), 'default')
+
+    def test_vote_sets_pin_cookie(self):
+        """A vote pins the voter to the primary for the following requests."""
+        User.objects.create_user(username='testuser', password='12345')
+        question = create_question(question_text="Sample Question", days=-1)
+        choice = Choice.objects.create(question=question, choice_text="Choice 1")
+        self.client.login(username='testuser', password='12345')
+        response = self.client.post(
+            reverse('polls:vote', args=(question.id,)), {'choice': choice.id}
+        )
+        self.assertIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    async def test_async_requests_are_pinned(self):
+        """The middleware runs natively in front of async views and pins them."""
+        reads = []
+
+        async def view(request):
+            with replica_reads():
+                reads.append(self.router.db_for_read(Question))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().post('/'))
+        self.assertEqual(reads, ['default'])
+        self.assertIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'results': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'results-test'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages-test'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions-test'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragments-test'},
+}, POLLS_PAGE_CACHE='pages')
+class AnonymousPageCacheTests(TestCase):
+    """Test the full-page cache for anonymous visitors."""
+
+    def setUp(self):
+        """Set up a question with a choice and an empty page cache."""
+        caches['pages'].clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.results_url = reverse('polls:results', args=(self.question.id,))
+
+    def test_anonymous_index_is_cached(self):
+        """A repeated anonymous index request runs no queries."""
+        self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Sample Question")
+
+    def test_authenticated_users_bypass_cache(self):
+        """Logged in users always get a freshly rendered page."""
+        self.client.get(self.results_url)
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(self.results_url)
+        self.assertContains(response, "Welcome back")
+
+    def test_vote_purges_results_page(self):
+        """A vote purges the cached results page of its question."""
+        self.client.get(self.results_url)
+        self.client.login(username='testuser', password='12345')
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.client.logout()
+        response = self.client.get(self.results_url)
+        self.assertEqual(response.context['results'].total, 1)
+
+    def test_deleted_vote_purges_results_page(self):
+        """Deleting a vote purges the cached results page of its question."""
+        Vote.objects.cast(self.user, self.choice)
+        self.client.get(self.results_url)
+        Vote.objects.get().delete()
+        response = self.client.get(self.results_url)
+        self.assertEqual(response.context['results'].total, 0)
+
+    def test_rebuilt_counts_purge_results_page(self):
+        """Corrected vote counters purge the cached results page."""
+        Vote.objects.cast(self.user, self.choice)
+        Choice.objects.update(vote_count=5)
+        self.client.get(self.results_url)
+        Vote.objects.rebuild_counts()
+        response = self.client.get(self.results_url)
+        self.assertEqual(response.context['results'].total, 1)
+
+    def test_timeout_stops_at_next_publication(self):
+        """Pages expire when the next scheduled poll is published."""
+        future = create_question(question_text="Future question.", days=1)
+        Question.objects.filter(pk=future.pk).update(
+            pub_date=timezone.now() + datetime.timedelta(seconds=30)
+        )
+        self.assertLessEqual(pagecache.page_timeout(), 30)
+
+    @override_settings(DATABASE_REPLICA_ALIASES=['replica1'])
+    def test_missing_pages_are_rendered_from_primary(self):
+        """Pages are not stored from a replica that missed a purge."""
+        with patch('mysite.routers.random.choice') as choice:
+            self.client.get(self.results_url)
+        choice.assert_not_called()
+
+    def test_pages_with_messages_are_not_cached(self):
+        """A page carrying a message is rendered for the visitor."""
+        self.client.get(reverse('polls:index'))
+        missing = reverse('polls:detail', args=(uuid.uuid4(),))
+        response = self.client.get(missing, follow=True)
+        self.assertIsNotNone(response.context)
+        self.assertIn(
+            "The poll you are looking for does not exist.",
+            [str(message) for message in response.context['messages']],
+        )
+
+
+@override_settings(POLLS_ASYNC_VIEWS=True)
+class AsyncViewTests(TestCase):
+    """Test the native async detail, results and vote views."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Route the poll pages to the async views."""
+        super().setUpClass()
+        reload_urlconf()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Route the poll pages back to the sync views."""
+        super().tearDownClass()
+        reload_urlconf()
+
+    def setUp(self):
+        """Set up a question with two choices and a voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+
+    def test_async_views_are_routed(self):
+        """The poll pages resolve to the async views."""
+        match = resolve(reverse('polls:vote', args=(self.question.id,)))
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+
+    async def test_async_vote_records_vote(self):
+        """An async vote is recorded and reported with a message."""
+        await self.async_client.alogin(username='testuser', password='12345')
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await self.async_client.post(url, {'choice': self.choice1.id})
+        self.assertRedirects(
+            response, reverse('polls:results', args=(self.question.id,)),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(await Vote.objects.acount(), 1)
+        results_url = reverse('polls:results', args=(self.question.id,))
+        response = await self.async_client.get(results_url)
+        self.assertContains(response, "Your vote &#x27;Choice 1&#x27; was recorded")
+        self.assertEqual(response.context['results'].total, 1)
+
+    @override_settings(POLLS_VOTE_INGESTION='buffered')
+    async def test_async_buffered_vote_redirects_to_detail(self):
+        """Buffered async votes send the voter to the detail page."""
+        buffer = ingest.VoteBuffer(max_batch=10, max_delay=0)
+        patcher = patch.object(ingest, '_buffer', buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        await self.async_client.alogin(username='testuser', password='12345')
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await self.async_client.post(url, {'choice': self.choice1.id})
+        self.assertRedirects(
+            response, reverse('polls:detail', args=(self.question.id,)),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(
+            buffer.pending_choice(self.user.pk, self.question.pk), self.choice1.id
+        )
+
+    async def test_async_detail_shows_user_vote(self):
+        """The async detail view marks the caller's vote."""
+        await sync_to_async(Vote.objects.cast)(self.user, self.choice2)
+        await self.async_client.alogin(username='testuser', password='12345')
+        response = await self.async_client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertEqual(response.context['user_choice_id'], self.choice2.id)
+        self.assertContains(response, "Welcome back")
+
+    async def test_async_vote_missing_choice(self):
+        """A missing choice re-renders the detail page with an error."""
+        await self.async_client.alogin(username='testuser', password='12345')
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await self.async_client.post(url, {})
+        self.assertContains(response, "You didn&#x27;t select a valid choice.")
+
+    async def test_async_detail_missing_question(self):
+        """A missing question redirects to the index."""
+        response = await self.async_client.get(reverse('polls:detail', args=(uuid.uuid4(),)))
+        self.assertRedirects(response, reverse('polls:index'), fetch_redirect_response=False)
+
+    async def test_async_login_awaits_hasher_pool(self):
+        """The async login page verifies the password with acheck_password()."""
+        url = reverse('login')
+        with patch(
+            'mysite.hashers.acheck_password', wraps=hashers.acheck_password,
+        ) as check:
+            response = await self.async_client.post(url, {
+                'username': 'testuser', 'password': 'wrong',
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.context['form'].is_valid())
+            response = await self.async_client.post(url, {
+                'username': 'testuser', 'password': '12345',
+                'next': reverse('polls:detail', args=(self.question.id,)),
+            })
+        self.assertEqual(check.call_count, 2)
+        self.assertRedirects(
+            response, reverse('polls:detail', args=(self.question.id,)),
+            fetch_redirect_response=False,
+        )
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('_auth_user_id'), str(self.user.pk))
+
+    @patch('polls.validators.CustomPasswordValidator._check_api')
+    @patch('captcha.fields.CaptchaField.clean')
+    async def test_async_signup_awaits_hasher_pool(self, captcha, check_api):
+        """Async signup hashes and verifies the password in the pool."""
+        with patch(
+            'mysite.hashers.apbkdf2', wraps=hashers.apbkdf2,
+        ) as pbkdf2:
+            response = await self.async_client.post(reverse('polls:signup'), {
+                'username': 'newuser',
+                'password1': 'ValidPassword1!',
+                'password2': 'ValidPassword1!',
+                'captcha': 'valid-captcha-response',
+            })
+        self.assertRedirects(
+            response, reverse('polls:index'), fetch_redirect_response=False,
+        )
+        self.assertEqual(pbkdf2.call_count, 2)
+        user = await User.objects.aget(username='newuser')
+        self.assertTrue(await user.acheck_password('ValidPassword1!'))
+
+    @override_settings(POLLS_PAGE_CACHE='results')
+    async def test_async_results_page_cache(self):
+        """Anonymous async results pages are served from the page cache."""
+        url = reverse('polls:results', args=(self.question.id,))
+        await self.async_client.get(url)
+        response = await self.async_client.get(url)
+        self.assertIsNone(response.context)
+        self.assertContains(response, "Sample Question")
+
+
+@override_settings(POLLS_LIVE_MAX_RATE=100, POLLS_LIVE_HEARTBEAT=0.05)
+class LiveResultsTests(TestCase):
+    """Test the live results stream and its pub/sub hub."""
+
+    def setUp(self):
+        """Set up a question with two choices and a voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.url = reverse('polls:results_stream', args=(self.question.id,))
+
+    @staticmethod
+    def parse(chunk):
+        """Return the name and data of the event in a stream chunk."""
+        fields = dict(
+            line.split(': ', 1) for line in chunk.decode().splitlines()
+            if line.startswith(('event: ', 'data: '))
+        )
+        return fields.get('event'), json.loads(fields.get('data', 'null'))
+
+    async def test_stream_pushes_deltas(self):
+        """The stream sends the results, then the choices a vote changed."""
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        first = await anext(stream)
+        self.assertTrue(first.startswith(b'retry: 10\n'))
+        name, data = self.parse(first)
+        self.assertEqual(name, 'results')
+        self.assertEqual(len(data['choices']), 2)
+        self.assertEqual(len(live.hub), 1)
+
+        await sync_to_async(Vote.objects.cast)(self.user, self.choice1)
+        live.publish([self.question.pk])
+        chunk = await anext(stream)
+        while chunk.startswith(b':'):
+            chunk = await anext(stream)
+        name, data = self.parse(chunk)
+        self.assertEqual(name, 'results')
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(
+            {(c['id'], c['votes']) for c in data['choices']},
+            {(str(self.choice1.id), 1)},
+        )
+        # A client disconnect cancels the stream, which unsubscribes it.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(len(live.hub), 0)
+
+    @override_settings(POLLS_LIVE_IDLE_TIMEOUT=0.1)
+    async def test_stream_idle_timeout(self):
+        """A stream sends keepalives and ends once results stay unchanged."""
+        response = await self.async_client.get(self.url)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertIn(b': keepalive\n\n', chunks)
+        self.assertEqual(self.parse(chunks[-1])[0], 'timeout')
+        self.assertEqual(len(live.hub), 0)
+
+    def test_wsgi_stream_sends_results_once(self):
+        """Under WSGI the current results are sent once for polling."""
+        Vote.objects.cast(self.user, self.choice2)
+        response = self.client.get(self.url)
+        self.assertFalse(response.streaming)
+        self.assertTrue(response.content.startswith(b'retry: 50\n'))
+        name, data = self.parse(response.content)
+        self.assertEqual((name, data['total']), ('results', 1))
+
+    async def test_stream_missing_question(self):
+        """Streaming a missing question returns 404."""
+        url = reverse('polls:results_stream', args=(uuid.uuid4(),))
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(POLLS_LIVE_MAX_STREAMS=0)
+    async def test_stream_limit(self):
+        """New streams are refused once the process serves the maximum."""
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+
+    def test_vote_publishes(self):
+        """Casting a vote notifies the hub of its question."""
+        self.client.login(username='testuser', password='12345')
+        with patch.object(live.hub, 'publish') as publish:
+            self.client.post(
+                reverse('polls:vote', args=(self.question.id,)),
+                {'choice': self.choice1.id},
+            )
+        publish.assert_called_once_with([self.question.pk])
+
+
+class ResultsApiTests(TestCase):
+    """Test the JSON results API and its conditional responses."""
+
+    def setUp(self):
+        """Set up a question with two choices and a voter."""
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.url = reverse('polls:results_api', args=(self.question.id,))
+
+    def test_results_json(self):
+        """The API returns the tallies with an ETag and Last-Modified."""
+        Vote.objects.cast(self.user, self.choice1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(
+            {c['choice_text']: c['votes'] for c in data['choices']},
+            {'Choice 1': 1, 'Choice 2': 0},
+        )
+        self.assertTrue(response['ETag'].startswith(f'"{self.question.id}-'))
+        self.assertIn('Last-Modified', response)
+
+    def test_current_etag_returns_304_with_one_query(self):
+        """A current If-None-Match is answered from the question row alone."""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_vote_changes_etag(self):
+        """A vote changes the ETag so pollers fetch the new tallies."""
+        etag = self.client.get(self.url)['ETag']
+        Vote.objects.cast(self.user, self.choice2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_choice_edit_changes_etag(self):
+        """Editing a choice changes the ETag as well."""
+        etag = self.client.get(self.url)['ETag']
+        self.choice1.choice_text = "Renamed"
+        self.choice1.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Renamed")
+
+    def test_unpublished_question(self):
+        """Questions that are not published yet are not exposed."""
+        future = create_question(question_text="Future", days=5)
+        response = self.client.get(reverse('polls:results_api', args=(future.id,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class ImportFixturesTests(TestCase):
+    """Test the streaming fixture importer."""
+
+    fixtures_dir = settings.BASE_DIR / 'data'
+
+    def import_fixtures(self, *paths, **options):
+        """Run the import_fixtures command and return its output."""
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'import_fixtures', *map(str, paths),
+            stdout=stdout, stderr=stderr, **options
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_iter_fixture_across_reads(self):
+        """Objects split across reads are decoded one at a time."""
+        objects = [{'model': 'polls.question', 'pk': str(uuid.uuid4()),
+                    'fields': {'question_text': 'Q' * 50}} for _ in range(5)]
+        stream = StringIO(json.dumps(objects, indent=2))
+        self.assertEqual(list(iter_fixture(stream, read_size=7)), objects)
+
+    def test_iter_fixture_rejects_non_array(self):
+        """A fixture that is not an array is rejected."""
+        with self.assertRaises(ValueError):
+            list(iter_fixture(StringIO('{"model": "polls.question"}')))
+
+    def test_import_project_fixtures(self):
+        """The shipped fixtures are imported with their vote counters."""
+        stdout, _ = self.import_fixtures(
+            self.fixtures_dir / 'users.json',
+            self.fixtures_dir / 'polls-v4.json',
+            self.fixtures_dir / 'votes-v4.json',
+            batch_size=2, transaction_size=3,
+        )
+        self.assertIn("rows/s", stdout)
+        self.assertEqual(Question.objects.count(), 4)
+        self.assertEqual(User.objects.count(), 5)
+        votes = Vote.objects.count()
+        self.assertEqual(votes, 4)
+        self.assertEqual(
+            sum(Choice.objects.values_list('vote_count', flat=True)), votes
+        )
+
+    def test_import_is_idempotent(self):
+        """Importing the same fixtures twice updates rather than duplicates."""
+        paths = [self.fixtures_dir / 'users.json',
+                 self.fixtures_dir / 'polls-v4.json']
+        self.import_fixtures(*paths)
+        self.import_fixtures(*paths)
+        self.assertEqual(Question.objects.count(), 4)
+        self.assertEqual(Choice.objects.count(), 21)
+
+    def test_votes_with_unknown_references_are_skipped(self):
+        """Votes for missing users or choices are skipped and reported."""
+        _, stderr = self.import_fixtures(
+            self.fixtures_dir / 'polls-v4.json',
+            self.fixtures_dir / 'votes-v4.json',
+        )
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertIn("Skipped 4 polls.Vote rows", stderr)
+
+    def test_duplicate_votes_keep_the_last(self):
+        """Votes for a question the user already voted on replace that vote."""
+        user = User.objects.create_user(username='voter', password='12345')
+        question = create_question(question_text="Sample Question", days=-1)
+        choice1 = Choice.objects.create(question=question, choice_text="Choice 1")
+        choice2 = Choice.objects.create(question=question, choice_text="Choice 2")
+        Vote.objects.cast(user, choice1)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = f'{tmp.name}/votes.json'
+        with open(path, 'w') as f:
+            json.dump([
+                {'model': 'polls.vote', 'pk': str(uuid.uuid4()),
+                 'fields': {'user': user.pk, 'choice': str(choice.pk)}}
+                for choice in (choice1, choice2)
+            ], f)
+        self.import_fixtures(path)
+        self.assertEqual(Vote.objects.get().choice, choice2)
+        self.assertEqual(
+            list(question.choice_set.order_by('choice_text')
+                 .values_list('vote_count', flat=True)),
+            [0, 1],
+        )
+
+    def test_failed_import_recounts_committed_rows(self):
+        """Votes committed before a failing fixture still get counted."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        broken = f'{tmp.name}/broken.json'
+        with open(broken, 'w') as f:
+            f.write('[{"model": "polls.question"')
+        with self.assertRaises(CommandError):
+            self.import_fixtures(
+                self.fixtures_dir / 'users.json',
+                self.fixtures_dir / 'polls-v4.json',
+                self.fixtures_dir / 'votes-v4.json',
+                broken,
+            )
+        self.assertEqual(Vote.objects.count(), 4)
+        self.assertEqual(
+            sum(Choice.objects.values_list('vote_count', flat=True)), 4
+        )
+
+
+class ExportTests(TestCase):
+    """Test the streaming vote and results exports."""
+
+    def setUp(self):
+        """Set up two questions with votes and a staff user."""
+        self.staff = User.objects.create_user(
+            username='staff', password='12345', is_staff=True
+        )
+        self.question = create_question(question_text="Sample Question", days=-1)
+        self.other = create_question(question_text="Other Question", days=-2)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        other_choice = Choice.objects.create(question=self.other, choice_text="Other")
+        for i in range(3):
+            voter = User.objects.create_user(username=f'voter{i}', password='12345')
+            Vote.objects.cast(voter, self.choice)
+        Vote.objects.cast(self.staff, other_choice)
+        Vote.objects.filter(user=self.staff).update(
+            voted_at=timezone.now() - datetime.timedelta(days=10)
+        )
+
+    def export(self, kind, **params):
+        """Request an export as the staff user and return the response."""
+        self.client.login(username='staff', password='12345')
+        return self.client.get(reverse('polls:export', args=(kind,)), params)
+
+    def test_votes_csv(self):
+        """All votes are streamed as CSV with a header row."""
+        response = self.export('votes')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(export.VOTE_COLUMNS))
+        self.assertEqual(len(lines), 5)
+
+    def test_votes_ndjson_filtered(self):
+        """Votes can be filtered by question and date range."""
+        response = self.export(
+            'votes', format='ndjson', question=str(self.question.id),
+            since=(timezone.now() - datetime.timedelta(days=1)).date().isoformat(),
+        )
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row['choice_text'] for row in rows}, {'Choice 1'})
+
+    def test_votes_until(self):
+        """`until` excludes votes cast from that moment on."""
+        until = (timezone.now() - datetime.timedelta(days=5)).isoformat()
+        response = self.export('votes', format='ndjson', until=until)
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 1)
+
+    def test_results_gzip(self):
+        """Results can be downloaded gzip-compressed."""
+        response = self.export('results', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('results.csv.gz', response['Content-Disposition'])
+        text = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('Sample Question,', text)
+        self.assertIn(f'{self.choice.id},Choice 1,3', text)
+
+    def test_invalid_filters(self):
+        """Invalid formats, ids and dates are rejected."""
+        self.assertEqual(self.export('votes', format='xml').status_code, 400)
+        self.assertEqual(self.export('votes', question='nope').status_code, 400)
+        self.assertEqual(self.export('votes', since='yesterday').status_code, 400)
+        self.assertEqual(self.export('everything').status_code, 404)
+
+    def test_export_requires_staff(self):
+        """Non-staff users are sent to the admin login."""
+        self.client.login(username='voter0', password='12345')
+        response = self.client.get(reverse('polls:export', args=('votes',)))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command(self):
+        """The export_data command writes the same rows to a file."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/votes.ndjson.gz'
+            call_command(
+                'export_data', 'votes', '--format', 'ndjson', '--gzip',
+                '--question', str(self.other.id), '-o', path,
+            )
+            with gzip.open(path, 'rt') as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual([row['username'] for row in rows], ['staff'])
+
+
+@override_settings(
+    REQUEST_METRICS_SLOW_MS=60000, REQUEST_METRICS_MAX_QUERIES=30,
+    REQUEST_METRICS_LOG_SQL=5,
+)
+class RequestMetricsTests(QueryBudgetMixin, TestCase):
+    """Test the per-request metrics middleware and the query budget helper."""
+
+    def setUp(self):
+        """Set up a question and empty request totals."""
+        metrics.reset()
+        self.question = create_question(question_text="Sample Question", days=-1)
+        Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.results_url = reverse('polls:results', args=(self.question.id,))
+
+    def test_requests_are_aggregated_per_url_name(self):
+        """Queries, cache lookups and bytes are totalled per URL name."""
+        results_cache._cache().clear()
+        self.client.get(self.results_url)
+        self.client.get(self.results_url)
+        stats = metrics.summary()['polls:results']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries_mean'], 0)
+        self.assertGreater(stats['cache_hits'], 0)
+        self.assertGreater(stats['cache_misses'], 0)
+        self.assertGreater(stats['bytes_mean'], 0)
+
+    def test_unresolved_requests(self):
+        """Requests that match no URL are grouped together."""
+        self.client.get('/no/such/page/')
+        self.assertEqual(metrics.summary()['unresolved']['requests'], 1)
+
+    def test_chatty_requests_are_logged_with_sql(self):
+        """Requests over the query threshold are logged with their SQL."""
+        with override_settings(REQUEST_METRICS_MAX_QUERIES=0):
+            with self.assertLogs('polls', 'WARNING') as logs:
+                self.client.get(self.results_url)
+        self.assertIn('polls:results', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_fast_requests_are_not_logged(self):
+        """Requests within the thresholds are not logged."""
+        with self.assertNoLogs('polls', 'WARNING'):
+            self.client.get(self.results_url)
+
+    def test_queries_outside_requests_are_not_recorded(self):
+        """Only queries run while serving a request are attributed."""
+        self.assertIsNone(metrics.current())
+        Question.objects.count()
+        self.assertEqual(metrics.summary(), {})
+
+    def test_query_budget_failure_lists_queries(self):
+        """Going over a query budget fails with the SQL that ran."""
+        with self.assertRaises(AssertionError) as raised:
+            with self.assertMaxQueries(1):
+                list(Question.objects.all())
+                list(Choice.objects.all())
+        self.assertIn('2 queries executed, budget is 1', str(raised.exception))
+        self.assertIn('polls_choice', str(raised.exception))
+
+    def test_request_stats_requires_staff(self):
+        """The request stats are only shown to staff."""
+        self.client.get(self.results_url)
+        url = reverse('polls:request_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user(username='staff', password='12345', is_staff=True)
+        self.client.login(username='staff', password='12345')
+        self.assertIn('polls:results', self.client.get(url).json())
+
+
+class PwnedCorpusTests(TestCase):
+    """Test the offline compromised password corpus."""
+
+    passwords = ['Password123!', 'Summer2024?', 'Qwerty!12345', 'Letmein#2000']
+
+    def setUp(self):
+        """Write a hash list of the compromised passwords."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        lines = [
+            hashlib.sha1(password.encode()).hexdigest().upper() + f':{i + 1}'
+            for i, password in enumerate(self.passwords)
+        ]
+        self.source = f'{self.tmp.name}/hashes.txt'
+        with open(self.source, 'w') as f:
+            # Unordered, with a duplicate, as from several downloads.
+            f.write('\n'.join(reversed(lines + lines[:1])) + '\n')
+        self.corpus = f'{self.tmp.name}/pwned.bin'
+
+    def test_build_and_lookup(self):
+        """Built corpora are sorted, deduplicated and searchable."""
+        call_command(
+            'build_pwned_corpus', self.source, '-o', self.corpus,
+            '--run-size', '2', stdout=StringIO(),
+        )
+        corpus = pwned.PwnedCorpus(self.corpus)
+        self.assertEqual(len(corpus), len(self.passwords))
+        digests = [corpus._digests[i] for i in range(len(corpus))]
+        self.assertEqual(digests, sorted(digests))
+        for password in self.passwords:
+            self.assertTrue(corpus.contains_password(password))
+        self.assertFalse(corpus.contains_password('Not-Pwned-42!'))
+
+    def test_min_count_and_range_files(self):
+        """Rare hashes can be skipped and range files take their prefix."""
+        digest = hashlib.sha1(b'Summer2024?').hexdigest().upper()
+        ranges = f'{self.tmp.name}/ranges'
+        os.mkdir(ranges)
+        with open(f'{ranges}/{digest[:5]}', 'w') as f:
+            f.write(f'{digest[5:]}:7\n')
+        call_command(
+            'build_pwned_corpus', self.source, ranges, '-o', self.corpus,
+            '--min-count', '3', stdout=StringIO(),
+        )
+        corpus = pwned.PwnedCorpus(self.corpus)
+        self.assertEqual(len(corpus), 3)
+        self.assertTrue(corpus.contains_password('Summer2024?'))
+        self.assertFalse(corpus.contains_password('Password123!'))
+
+    def test_validator_offline_mode(self):
+        """The validator rejects compromised passwords without the API."""
+        pwned.build([hashlib.sha1(b'Password123!').digest()], self.corpus)
+        validator = CustomPasswordValidator(mode='offline', corpus=self.corpus)
+        with patch('polls.pwned.range_client') as range_client:
+            validator.validate('Unseen!Pass42')
+            with self.assertRaisesMessage(ValidationError, 'compromised'):
+                validator.validate('Password123!')
+        range_client.assert_not_called()
+
+    def test_missing_corpus(self):
+        """A missing corpus fails validation instead of the request."""
+        validator = CustomPasswordValidator(mode='offline', corpus=self.corpus)
+        with self.assertLogs('polls.validators', 'ERROR'):
+            with self.assertRaisesMessage(ValidationError, 'try again later'):
+                validator.validate('Unseen!Pass42')
+
+
+class RangeStubHandler(BaseHTTPRequestHandler):
+    """Stub of the range API serving the ranges in `server.ranges`."""
+
+    def do_GET(self):
+        """Serve a range, or fail with the status in `server.fail_with`."""
+        self.server.requests.append(self.path)
+        status = self.server.fail_with or 200
+        body = self.server.ranges.get(self.path.rsplit('/', 1)[-1], '')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        """Keep the test output quiet."""
+
+
+class RangeClientTests(TestCase):
+    """Test the pooled, cached range API client against a local stub."""
+
+    password = 'Password123!'
+
+    @classmethod
+    def setUpClass(cls):
+        """Start the stub range API."""
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeStubHandler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/range/'
+        thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        thread.start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        """Serve the range of the compromised password, with padding."""
+        sha1 = hashlib.sha1(self.password.encode()).hexdigest().upper()
+        self.server.ranges = {
+            sha1[:5]: f'{sha1[5:]}:42\r\n{"0" * 35}:0\r\n',
+        }
+        self.server.requests = []
+        self.server.fail_with = None
+        self.client = pwned.RangeClient(
+            self.url, timeout=1, failure_threshold=2, reset_timeout=60,
+        )
+
+    def test_ranges_are_cached(self):
+        """Repeated lookups of a prefix fetch its range once."""
+        self.assertTrue(self.client.is_compromised(self.password))
+        self.assertTrue(self.client.is_compromised(self.password))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_suffixes_match_exactly(self):
+        """Suffixes are compared whole and padding entries are ignored."""
+        sha1 = hashlib.sha1(self.password.encode()).hexdigest().upper()
+        suffixes = self.client.suffixes(sha1[:5])
+        self.assertEqual(suffixes, {sha1[5:]})
+
+    def test_cache_is_bounded(self):
+        """The least recently used ranges are evicted first."""
+        self.client.cache_size = 2
+        for prefix in ('AAAAA', 'BBBBB', 'AAAAA', 'CCCCC'):
+            self.client.suffixes(prefix)
+        self.assertEqual(list(self.client._ranges), ['AAAAA', 'CCCCC'])
+
+    def test_circuit_opens_after_failures(self):
+        """Once the API keeps failing, lookups fail without requests."""
+        self.server.fail_with = 503
+        for _ in range(3):
+            with self.assertRaises(pwned.RangeUnavailable):
+                self.client.suffixes('AAAAA')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_validator_uses_configured_api(self):
+        """The validator looks passwords up at PWNED_PASSWORDS_API_URL."""
+        validator = CustomPasswordValidator(mode='api')
+        with override_settings(PWNED_PASSWORDS_API_URL=self.url):
+            with self.assertRaisesMessage(ValidationError, 'compromised'):
+                validator.validate(self.password)
+            validator.validate('Unseen!Pass42')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class StructuredLoggingTests(TestCase):
+    """Test the queued JSON log handler and the sampling filter."""
+
+    def setUp(self):
+        """Set up a logger writing through a QueueFileHandler."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = f'{self.tmp.name}/polls.log'
+        self.handler = QueueFileHandler(self.path, max_bytes=2000, backup_count=2)
+        self.handler.setFormatter(JsonFormatter())
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger('polls.tests.structured')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def read_lines(self):
+        """Wait for the listener, then return the logged JSON objects."""
+        self.handler.listener.stop()
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_records_are_json_lines(self):
+        """Messages are formatted lazily and extra fields are kept."""
+        self.logger.info("User %s voted", 'alice', extra={'question': 7})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.logger.exception("Failed")
+        first, second = self.read_lines()
+        self.assertEqual(first['msg'], 'User alice voted')
+        self.assertEqual(first['question'], 7)
+        self.assertEqual(first['logger'], 'polls.tests.structured')
+        self.assertIn('ZeroDivisionError', second['exc'])
+
+    def test_rotated_files_are_compressed(self):
+        """Files are rotated at max_bytes and kept gzip-compressed."""
+        for i in range(100):
+            self.logger.info("Line %d", i)
+        self.read_lines()
+        with gzip.open(f'{self.path}.1.gz', 'rt') as f:
+            self.assertIn('"msg":"Line', f.readline())
+        self.assertFalse(os.path.exists(f'{self.path}.3.gz'))
+
+    def test_log_files_are_private(self):
+        """The log file and its rotated copies are readable by the owner."""
+        for i in range(100):
+            self.logger.info("Line %d", i)
+        self.read_lines()
+        for path in (self.path, f'{self.path}.1.gz'):
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_full_queue_drops_records(self):
+        """Records are dropped rather than blocking when the queue is full."""
+        self.handler.listener.stop()
+        self.handler.queue.maxsize = 1
+        self.logger.info("Kept")
+        self.logger.info("Dropped")
+        self.assertEqual(self.handler.dropped, 1)
+
+    def test_sampling(self):
+        """Sampled loggers keep a fraction of their records below WARNING."""
+        sampler = SamplingFilter({'polls.votes': 0})
+        record = logging.LogRecord(
+            'polls.votes', logging.INFO, '', 0, 'vote', None, None
+        )
+        self.assertFalse(sampler.filter(record))
+        record.levelno = logging.WARNING
+        self.assertTrue(sampler.filter(record))
+        record.name, record.levelno = 'polls', logging.INFO
+        self.assertTrue(sampler.filter(record))
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=[
+        'axes.backends.AxesBackend', 'mysite.auth.CachedModelBackend',
+    ],
+)
+class SessionUserCacheTests(TestCase):
+    """Test the cached sessions and the per-session user cache."""
+
+    def setUp(self):
+        """Log a user in and warm the session and user caches."""
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.url = reverse('polls:user_manage')
+        self.client.get(self.url)
+
+    def test_authenticated_requests_run_no_auth_queries(self):
+        """Warm sessions and users are served from the cache."""
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_change_username_refreshes_user(self):
+        """A changed username is seen on the next request."""
+        self.client.post(reverse('polls:change_username'), {
+            'new_username': 'renamed', 'password': '12345',
+        })
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'].username, 'renamed')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """Other sessions are logged out as soon as the password changes."""
+        other = self.client_class()
+        other.login(username='testuser', password='12345')
+        other.get(self.url)
+        self.user.set_password('Another-Secret-42')
+        self.user.save()
+        response = other.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_forgets_user(self):
+        """Logging out drops the cached user."""
+        key = f'auth:user:{self.user.pk}'
+        cache = caches[settings.SESSION_CACHE_ALIAS]
+        self.assertIsNotNone(cache.get(key))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=hashers.MIN_ITERATIONS)
+class PooledHasherTests(TestCase):
+    """Test the process pool PBKDF2 hasher."""
+
+    def test_hashes_match_django(self):
+        """Pooled hashes are ordinary pbkdf2_sha256 hashes."""
+        encoded = PooledPBKDF2PasswordHasher().encode('Secret!123', 'salt1234')
+        expected = PBKDF2PasswordHasher().encode(
+            'Secret!123', 'salt1234', hashers.MIN_ITERATIONS
+        )
+        self.assertEqual(encoded, expected)
+        self.assertTrue(check_password('Secret!123', expected))
+        self.assertFalse(check_password('Wrong!123', expected))
+
+    def test_inline_without_workers(self):
+        """With no workers, keys are derived without a pool."""
+        with override_settings(PASSWORD_HASHER_WORKERS=0):
+            with patch('mysite.hashers.ProcessPoolExecutor') as pool:
+                encoded = make_password('Secret!123')
+        pool.assert_not_called()
+        self.assertTrue(check_password('Secret!123', encoded))
+
+    def test_async_check(self):
+        """acheck_password() verifies and upgrades stored hashes."""
+        old = PBKDF2PasswordHasher().encode('Secret!123', 'salt1234', 500)
+        upgraded = []
+
+        async def setter(password):
+            upgraded.append(password)
+
+        self.assertTrue(asyncio.run(
+            hashers.acheck_password('Secret!123', old, setter)
+        ))
+        self.assertFalse(asyncio.run(hashers.acheck_password('Wrong!1', old)))
+        self.assertEqual(upgraded, ['Secret!123'])
+
+    @override_settings(PASSWORD_HASHER_WORKERS=1, PASSWORD_HASHER_QUEUE=1)
+    def test_async_admission_waits_on_the_loop(self):
+        """Async callers beyond the workers and queue await a free slot."""
+        submitted = []
+
+        class Pool:
+            def submit(self, fn, *args):
+                submitted.append(concurrent.futures.Future())
+                return submitted[-1]
+
+        async def storm():
+            tasks = [
+                asyncio.create_task(hashers.apbkdf2('pw', 'salt', 1))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0)
+            self.assertEqual(len(submitted), 2)
+            submitted[0].set_result(b'key')
+            self.assertEqual(await tasks[0], b'key')
+            await asyncio.sleep(0)
+            self.assertEqual(len(submitted), 3)
+            for future in submitted[1:]:
+                future.set_result(b'key')
+            await asyncio.gather(*tasks)
+
+        with patch.object(hashers, '_get_pool', return_value=(Pool(), None)):
+            asyncio.run(storm())
+
+    def test_async_make_password(self):
+        """amake_password() hashes with the pooled hasher."""
+        encoded = asyncio.run(hashers.amake_password('Secret!123'))
+        self.assertTrue(encoded.startswith(
+            f'pbkdf2_sha256${hashers.MIN_ITERATIONS}$'
+        ))
+        self.assertTrue(check_password('Secret!123', encoded))
+
+    def test_iteration_floor(self):
+        """Iteration counts below the minimum are raised to it."""
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            self.assertEqual(
+                PooledPBKDF2PasswordHasher().iterations, hashers.MIN_ITERATIONS
+            )
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000000):
+            self.assertEqual(PooledPBKDF2PasswordHasher().iterations, 1000000)
+
+    def test_must_update_never_lowers_iterations(self):
+        """Only hashes with fewer iterations than configured are upgraded."""
+        hasher = PooledPBKDF2PasswordHasher()
+        self.assertFalse(hasher.must_update('pbkdf2_sha256$870000$salt$hash'))
+        self.assertTrue(hasher.must_update('pbkdf2_sha256$500$salt$hash'))
+
+    def test_calibration(self):
+        """The calibration command never suggests fewer than the minimum."""
+        out, err = StringIO(), StringIO()
+        call_command(
+            'calibrate_password_hasher', '--target-ms', '1', '--samples', '1',
+            '--probe-iterations', '1000', stdout=out, stderr=err,
+        )
+        self.assertIn(
+            f'PASSWORD_PBKDF2_ITERATIONS={hashers.MIN_ITERATIONS}',
+            out.getvalue(),
+        )
+        self.assertIn('below the minimum', err.getvalue())
+
+
+@override_settings(CAPTCHA_POOL_SIZE=4)
+class CaptchaPoolTests(TestCase):
+    """Test the pool of pre-generated signup CAPTCHAs."""
+
+    def setUp(self):
+        """Install a pool without a refill thread."""
+        self.pool = CaptchaPool(4, interval=None)
+        patcher = patch.object(captchas, '_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches[settings.CAPTCHA_IMAGE_CACHE].clear()
+
+    def test_refill_inserts_in_one_query(self):
+        """A refill deletes expired rows and inserts the batch at once."""
+        CaptchaStore.objects.create(
+            challenge='OLD', response='old',
+            expiration=timezone.now() - datetime.timedelta(minutes=1),
+        )
+        with self.assertNumQueries(2):
+            self.assertEqual(self.pool.refill(), 4)
+        self.assertEqual(CaptchaStore.objects.count(), 4)
+        self.assertEqual(self.pool.refill(), 0)
+
+    def test_take_hands_out_each_key_once(self):
+        """Taken keys are distinct and the pool runs dry."""
+        self.pool.refill()
+        keys = [self.pool.take() for _ in range(4)]
+        self.assertEqual(len(set(keys)), 4)
+        self.assertIsNone(self.pool.take())
+
+    def test_skips_challenges_close_to_expiry(self):
+        """Challenges about to expire are not handed out."""
+        self.pool.refill()
+        self.assertEqual(len(self.pool), 4)
+        with patch('polls.captchas.timezone.now', return_value=(
+            timezone.now() + datetime.timedelta(minutes=11)
+        )):
+            self.assertIsNone(self.pool.take())
+
+    def test_signup_page_uses_pool(self):
+        """Rendering the form takes a ready challenge without an INSERT."""
+        self.pool.refill()
+        with self.assertNumQueries(0):
+            html = CustomSignupForm().as_p()
+        self.assertEqual(len(self.pool), 3)
+        key = CaptchaStore.objects.exclude(
+            hashkey__in=[key for key, _ in self.pool._entries]
+        ).get().hashkey
+        self.assertIn(key, html)
+
+    def test_image_served_from_cache(self):
+        """Images of pooled challenges are not drawn on request."""
+        self.pool.refill()
+        key = self.pool.take()
+        with patch('polls.captchas.render_image') as render:
+            response = self.client.get(f'/captcha/image/{key}/')
+            response_2x = self.client.get(f'/captcha/image/{key}@2/')
+        render.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertNotEqual(response.content, response_2x.content)
+
+    def test_pooled_challenge_validates_once(self):
+        """A pooled challenge is accepted once with its answer."""
+        self.pool.refill()
+        key = self.pool.take()
+        store = CaptchaStore.objects.get(hashkey=key)
+        field = CustomSignupForm.base_fields['captcha']
+        field.clean([key, store.response.upper()])
+        with self.assertRaises(ValidationError):
+            field.clean([key, store.response])
+
+    def test_empty_pool_falls_back(self):
+        """With nothing pooled a challenge is created on demand."""
+        with self.assertLogs('polls', 'WARNING'):
+            key = captchas.pick()
+        self.assertTrue(CaptchaStore.objects.filter(hashkey=key).exists())
+
+
+class StaticPipelineTests(TestCase):
+    """Test the precompressed, content-hashed static files."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Collect the static files into a temporary STATIC_ROOT."""
+        super().setUpClass()
+        cls.root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.root.cleanup)
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=cls.root.name,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND':
+                    'mysite.storage.CompressedManifestStaticFilesStorage',
+            }},
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def setUp(self):
+        """Use a client whose middleware indexes the collected files."""
+        self.client = self.client_class()
+        self.name = 'vendor/bootstrap/css/bootstrap.min.css'
+        self.url = staticfiles_storage.url(self.name)
+
+    def test_hashed_names_and_variants(self):
+        """Collected files get hashed names and compressed variants."""
+        self.assertRegex(self.url, r'bootstrap\.min\.[0-9a-f]{12}\.css$')
+        path = staticfiles_storage.path(
+            staticfiles_storage.stored_name(self.name)
+        )
+        with open(path, 'rb') as f:
+            original = f.read()
+        with open(path + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+        if storage.brotli:
+            self.assertTrue(os.path.exists(path + '.br'))
+        woff2 = staticfiles_storage.stored_name(
+            'vendor/fontawesome/webfonts/fa-solid-900.woff2'
+        )
+        self.assertFalse(
+            os.path.exists(staticfiles_storage.path(woff2) + '.gz')
+        )
+
+    def test_serves_gzip_immutable(self):
+        """Hashed files are sent compressed and cached for a year."""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertTrue(body.startswith(b'@charset'))
+
+    def test_identity_and_revalidation(self):
+        """Clients without gzip get the file; a known ETag gets a 304."""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(
+            int(response['Content-Length']),
+            len(b''.join(response.streaming_content)),
+        )
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_ACCEPT_ENCODING='gzip;q=0',
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_unhashed_names_are_not_immutable(self):
+        """Files requested by their plain name are cached briefly."""
+        response = self.client.get(settings.STATIC_URL + self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_missing_manifest_falls_back_to_plain_names(self):
+        """Before collectstatic, pages link plain names instead of failing."""
+        with tempfile.TemporaryDirectory() as root:
+            with self.settings(STATIC_ROOT=root, DEBUG=False):
+                self.assertEqual(
+                    staticfiles_storage.url(self.name),
+                    settings.STATIC_URL + self.name,
+                )
+                self.assertIn(
+                    'polls.W010',
+                    [m.id for m in checks.check_static_files(None)],
+                )
+
+    def test_pages_use_local_assets(self):
+        """Pages link the hashed local copies instead of a CDN."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, self.url)
+        self.assertNotContains(response, 'cdn')
+
+
+class SettingsProfileTests(TestCase):
+    """Test the environment parsing and the performance checks."""
+
+    def test_env_bool(self):
+        """Booleans are parsed strictly; anything unknown is an error."""
+        with patch.dict(os.environ, {'FLAG': 'False'}):
+            self.assertIs(env_bool('FLAG', True), False)
+        with patch.dict(os.environ, {'FLAG': ' yes '}):
+            self.assertIs(env_bool('FLAG', False), True)
+        with patch.dict(os.environ, {'FLAG': ''}):
+            self.assertIs(env_bool('FLAG', True), True)
+        with patch.dict(os.environ, {'FLAG': 'maybe'}):
+            with self.assertRaises(ImproperlyConfigured):
+                env_bool('FLAG', False)
+
+    @override_settings(DEBUG='False')
+    def test_string_debug_is_an_error(self):
+        """A DEBUG string is reported before it turns debug mode on."""
+        self.assertEqual(
+            [message.id for message in checks.check_debug(None)],
+            ['polls.E001'],
+        )
+
+    @override_settings(DEBUG=True, DJANGO_ENV='production')
+    def test_debug_in_production(self):
+        """DEBUG is only expected in the development profile."""
+        self.assertEqual(
+            [message.id for message in checks.check_debug(None)],
+            ['polls.W001'],
+        )
+        with self.settings(DJANGO_ENV='development'):
+            self.assertEqual(checks.check_debug(None), [])
+
+    @override_settings(DJANGO_ENV='production')
+    def test_uncached_templates_and_connections(self):
+        """Uncached loaders and per-request connections are reported."""
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {'loaders': [
+                'django.template.loaders.app_directories.Loader',
+            ]},
+        }]
+        with self.settings(TEMPLATES=templates), patch.dict(
+            settings.DATABASES['default'], CONN_MAX_AGE=0
+        ):
+            self.assertEqual(
+                [m.id for m in checks.check_template_loaders(None)],
+                ['polls.W002'],
+            )
+            self.assertIn(
+                'polls.W003',
+                [m.id for m in checks.check_persistent_connections(None)],
+            )
+
+    def test_slow_caches_and_sessions(self):
+        """Dummy caches and database-backed sessions are reported."""
+        caches_setting = {**settings.CACHES, 'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }}
+        with self.settings(CACHES=caches_setting):
+            self.assertEqual(
+                [m.id for m in checks.check_caches(None)], ['polls.W004']
+            )
+        with self.settings(
+            SESSION_ENGINE='django.contrib.sessions.backends.db'
+        ):
+            self.assertEqual(
+                [m.id for m in checks.check_sessions(None)], ['polls.W005']
+            )
+
+    @override_settings(
+        DEBUG=False,
+        SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    )
+    def test_per_process_session_cache_is_an_error(self):
+        """Cached sessions in a per-process cache are reported."""
+        cache = settings.CACHES[settings.SESSION_CACHE_ALIAS]
+        shared = {**settings.CACHES, settings.SESSION_CACHE_ALIAS: {
+            **cache,
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        }}
+        with self.settings(CACHES=shared):
+            self.assertEqual(checks.check_session_cache(None), [])
+        with patch.dict(cache, {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }):
+            self.assertEqual(
+                [m.id for m in checks.check_session_cache(None)],
+                ['polls.E002'],
+            )
+
+    @override_settings(DEBUG=False, POLLS_PAGE_CACHE='pages')
+    def test_per_process_page_cache_is_an_error(self):
+        """A page cache that is not shared by all processes is reported."""
+        shared = {**settings.CACHES, 'pages': {
+            **settings.CACHES['pages'],
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        }}
+        with self.settings(CACHES=shared):
+            self.assertEqual(checks.check_page_cache(None), [])
+        with patch.dict(settings.CACHES['pages'], {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }):
+            self.assertEqual(
+                [m.id for m in checks.check_page_cache(None)], ['polls.E003']
+            )
+        with self.settings(POLLS_PAGE_CACHE=None):
+            self.assertEqual(checks.check_page_cache(None), [])
+
+    @override_settings(
+        CAPTCHA_POOL_SIZE=10, CAPTCHA_TIMEOUT=5,
+        CAPTCHA_GET_FROM_POOL_TIMEOUT=5,
+    )
+    def test_captcha_timeout(self):
+        """Pooled CAPTCHAs must outlive the hand-out margin."""
+        self.assertEqual(
+            [m.id for m in checks.check_captcha_pool(None)], ['polls.W009']
+        )
+
+    @override_settings(CAPTCHA_POOL_SIZE=10)
+    def test_per_process_captcha_images_are_reported(self):
+        """Pooled CAPTCHA images should be cached for all processes."""
+        with patch.dict(settings.CACHES['captchas'], {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }):
+            self.assertEqual(
+                [m.id for m in checks.check_captcha_cache(None)],
+                ['polls.W011'],
+            )
+        with patch.dict(settings.CACHES['captchas'], {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        }):
+            self.assertEqual(checks.check_captcha_cache(None), [])
+        with self.settings(CAPTCHA_POOL_SIZE=0):
+            self.assertEqual(checks.check_captcha_cache(None), [])
+
+    @override_settings(DEBUG=True, DJANGO_ENV='production')
+    def test_report_logs_messages(self):
+        """Startup logs every unsilenced performance message."""
+        with self.assertLogs('polls', 'WARNING') as logs:
+            messages = checks.report()
+        self.assertIn('polls.W001', [message.id for message in messages])
+        self.assertTrue(any('polls.W001' in line for line in logs.output))
+        with self.settings(SILENCED_SYSTEM_CHECKS=['polls.W001']):
+            self.assertNotIn(
+                'polls.W001', [message.id for message in checks.report()]
+            )
+
+
+class TemplateFragmentTests(TestCase):
+    """Test the shared layout and its cached navigation fragment."""
+
+    def setUp(self):
+        """Set up a user, a staff member and an empty fragment cache."""
+        caches['fragments'].clear()
+        self.user = User.objects.create_user(username='alice', password='x')
+        self.staff = User.objects.create_user(
+            username='bob', password='x', is_staff=True
+        )
+        self.url = reverse('polls:index')
+
+    def test_navigation_per_user(self):
+        """Each visitor sees their own name and only staff see Admin."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Login')
+        self.assertNotContains(response, 'logout-form')
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Welcome back')
+        self.assertContains(response, 'alice')
+        self.assertNotContains(response, reverse('admin:index'))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'bob')
+        self.assertNotContains(response, 'alice')
+        self.assertContains(response, reverse('admin:index'))
+
+    def test_navigation_is_cached(self):
+        """The fragment is stored once and follows username changes."""
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        key = make_template_fragment_key('nav', [True, False, 'alice'])
+        self.assertIn('alice', caches['fragments'].get(key))
+        with patch.object(caches['fragments'], 'set') as cache_set:
+            self.client.get(self.url)
+        cache_set.assert_not_called()
+        User.objects.filter(pk=self.user.pk).update(username='carol')
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        self.assertContains(self.client.get(self.url), 'carol')
+
+    def test_pages_share_the_layout(self):
+        """Poll and account pages all render through the base template."""
+        question = create_question(question_text="Layout", days=-1)
+        self.client.force_login(self.user)
+        urls = [
+            self.url,
+            reverse('polls:detail', args=(question.id,)),
+            reverse('polls:results', args=(question.id,)),
+            reverse('polls:user_manage'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTemplateUsed(response, 'base.html')
+        self.client.logout()
+        response = self.client.get(reverse('login'))
+        self.assertTemplateUsed(response, 'base.html')
+        self.assertNotContains(response, 'Welcome back')
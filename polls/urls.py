@@ -1,16 +1,26 @@
 """Defines URL patterns for the KU Polls application."""
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# The hot poll pages and signup are served by native async views under ASGI
+poll_views = async_views if settings.POLLS_ASYNC_VIEWS else views
 
 app_name = 'polls'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
-    path('<uuid:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<uuid:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<uuid:question_id>/vote/', views.vote, name='vote'),
-    path('signup/', views.signup, name='signup'),
+    path('<uuid:pk>/', poll_views.DetailView.as_view(), name='detail'),
+    path('<uuid:pk>/results/', poll_views.ResultsView.as_view(), name='results'),
+    path('<uuid:pk>/results/stream/', async_views.results_stream,
+         name='results_stream'),
+    path('<uuid:question_id>/vote/', poll_views.vote, name='vote'),
+    path('signup/', poll_views.signup, name='signup'),
     path('change_username/', views.change_username, name='change_username'),
     path('change_password/', views.change_password, name='change_password'),
     path('user_manage/', views.user_manage, name='user_manage'),
+    path('api/<uuid:pk>/results/', views.results_api, name='results_api'),
+    path('export/<slug:kind>/', views.export_data, name='export'),
+    path('cache_stats/', views.cache_stats, name='cache_stats'),
+    path('request_stats/', views.request_stats, name='request_stats'),
 ]
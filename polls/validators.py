@@ -5,11 +5,12 @@ Prevent compromised use.
 """
 
 import re
-import hashlib
-import requests
 import logging
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
+from . import pwned
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
@@ -19,8 +20,23 @@ class CustomPasswordValidator:
     Validator for enforcing strong password policies.
 
     Avoiding compromises.
+
+    Compromised passwords are looked up according to `mode`: 'api' asks
+    the Have I Been Pwned range API, 'offline' searches the local corpus
+    at `corpus` (see polls.pwned) and 'off' skips the check. Both default
+    to the PWNED_PASSWORDS_CHECK and PWNED_PASSWORDS_FILE settings and can
+    be set through the validator's OPTIONS.
     """
 
+    modes = ('api', 'offline', 'off')
+
+    def __init__(self, mode=None, corpus=None):
+        """Init the validator."""
+        self.mode = mode or settings.PWNED_PASSWORDS_CHECK
+        if self.mode not in self.modes:
+            raise ValueError(f"Unknown password check mode: {self.mode}")
+        self.corpus = corpus or settings.PWNED_PASSWORDS_FILE
+
     def validate(self, password, user=None):
         """
         Validate strong password.
@@ -56,31 +72,53 @@ class CustomPasswordValidator:
                 )
 
         # Check for compromised password
+        if self.mode == 'offline':
+            self._check_corpus(password)
+        elif self.mode == 'api':
+            self._check_api(password)
+
+        logger.info("Password successfully validated.")
+
+    def _check_corpus(self, password):
+        """Look the password up in the local compromised password corpus."""
+        logger.debug("Checking password against the local corpus.")
+        try:
+            corpus = pwned.open_corpus(self.corpus)
+        except (OSError, ValueError):
+            logger.error(
+                "Could not open the compromised password corpus %s.",
+                self.corpus, exc_info=True,
+            )
+            raise ValidationError(
+                "Could not validate the password against compromised "
+                "databases. Please try again later."
+            )
+        if corpus.contains_password(password):
+            logger.warning("Password found in compromised password database.")
+            raise ValidationError(
+                "This password has been compromised and cannot be used."
+                )
+
+    def _check_api(self, password):
+        """Look the password up with the Have I Been Pwned range API."""
         logger.debug(
             "Checking password against the Have I Been Pwned database."
             )
-        sha1_password = hashlib.sha1(
-            password.encode('utf-8')
-            ).hexdigest().upper()
-        prefix, suffix = sha1_password[:5], sha1_password[5:]
-        url = f"https://api.pwnedpasswords.com/range/{prefix}"
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            logger.error("Failed to connect to the Have I Been Pwned API.")
+        try:
+            compromised = pwned.range_client().is_compromised(password)
+        except pwned.RangeUnavailable as e:
+            logger.error("Failed to query the Have I Been Pwned API: %s", e)
             raise ValidationError(
-                "Could not validate the password against compromised"
+                "Could not validate the password against compromised "
                 "databases. Please try again later."
             )
 
-        if suffix in response.text:
+        if compromised:
             logger.warning("Password found in compromised password database.")
             raise ValidationError(
                 "This password has been compromised and cannot be used."
                 )
 
-        logger.info("Password successfully validated.")
-
     def get_help_text(self):
         """Return password requirement details."""
         return (
@@ -1,17 +1,32 @@
 """Handles poll display, voting, and admin functions in the KU Polls app."""
 from typing import Any
+from django.core.handlers.asgi import ASGIRequest
 from django.http import (
     HttpRequest,
+    HttpResponseBadRequest,
     HttpResponseRedirect,
     Http404,
     JsonResponse,
+    StreamingHttpResponse,
+)
+from django.core.exceptions import ValidationError
+from django.db.models import (
+    OuterRef,
+    Subquery,
+    UUIDField,
+    prefetch_related_objects,
 )
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views import generic
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 import logging
@@ -22,11 +37,56 @@ from .forms import UsernameChangeForm
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from .forms import CustomSignupForm
+from mysite import metrics
+from mysite.routers import replica_reads
 
 from .models import Choice, Question, Vote
+from . import cache as results_cache
+from . import export
+from . import ingest
+from . import live
+from . import pagecache
+from .pagecache import cache_anonymous_page
+from .results import top_questions
+
+
+def published_questions(user):
+    """
+    Return the published questions, annotated with the vote of `user`.
+
+    For authenticated users each question carries `user_choice_id`, the id
+    of the choice they voted for, so no separate Vote lookup is needed.
+    """
+    queryset = Question.objects.filter(pub_date__lte=timezone.now())
+    if user.is_authenticated:
+        queryset = queryset.annotate(user_choice_id=Subquery(
+            Vote.objects.filter(
+                user=user, choice_question=OuterRef('pk')
+                ).values('choice_id')[:1],
+            output_field=UUIDField(),
+            ))
+    return queryset
+
+
+class ReplicaReadMixin:
+    """
+    Serve the poll reads of a view from a read replica.
 
+    The response is rendered inside the replica block so that querysets
+    evaluated lazily by the template are routed the same way.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """Dispatch and render the request with replica reads enabled."""
+        with replica_reads():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
 
-class IndexView(generic.ListView):
+
+@method_decorator(cache_anonymous_page, name='dispatch')
+class IndexView(ReplicaReadMixin, generic.ListView):
     """Determine the view of the index page."""
 
     template_name = 'polls/index.html'
@@ -42,8 +102,14 @@ class IndexView(generic.ListView):
             pub_date__lte=timezone.now()
         ).order_by('-pub_date')[:5]
 
+    def get_context_data(self, **kwargs):
+        """Add the most voted questions to the context."""
+        context = super().get_context_data(**kwargs)
+        context['top_question_list'] = top_questions()
+        return context
+
 
-class DetailView(generic.DetailView):
+class DetailView(ReplicaReadMixin, generic.DetailView):
     """
     Determine the view of the question page.
 
@@ -55,7 +121,7 @@ class DetailView(generic.DetailView):
 
     def get_queryset(self):
         """Excludes any questions that aren't published yet."""
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return published_questions(self.request.user)
 
     def get_object(self, queryset=None):
         """
@@ -67,7 +133,7 @@ class DetailView(generic.DetailView):
         try:
             return super().get_object(queryset)
         except Http404 as e:
-            logger.error(f"Question not found: {e}")
+            logger.error("Question not found: %s", e)
             messages.error(
                 self.request, "The poll you are looking for does not exist."
                 )
@@ -85,23 +151,26 @@ class DetailView(generic.DetailView):
             messages.error(request, "This poll is not allowed for voting.")
             return redirect('polls:index')
 
-        # Get the user's vote for this question if it exists
-        user_vote = None
-        if request.user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(
-                    user=request.user, choice_question=self.object
-                    )
-            except Vote.DoesNotExist:
-                user_vote = None
+        # Load the choices only once the question is known to be votable
+        prefetch_related_objects([self.object], 'choice_set')
+
+        # The id of the choice the user voted for, if any
+        user_choice_id = getattr(self.object, 'user_choice_id', None)
+        if request.user.is_authenticated and ingest.is_enabled():
+            pending_choice_id = ingest.get_buffer().pending_choice(
+                request.user.pk, self.object.pk
+                )
+            if pending_choice_id is not None:
+                user_choice_id = pending_choice_id
 
         context = self.get_context_data(
-            object=self.object, user_vote=user_vote
+            object=self.object, user_choice_id=user_choice_id
             )
         return self.render_to_response(context)
 
 
-class ResultsView(generic.DetailView):
+@method_decorator(cache_anonymous_page, name='dispatch')
+class ResultsView(ReplicaReadMixin, generic.DetailView):
     """Determine the view of the result page."""
 
     model = Question
@@ -117,7 +186,7 @@ class ResultsView(generic.DetailView):
         try:
             return super().get_object(queryset)
         except Http404 as e:
-            logger.error(f"Question not found: {e}")
+            logger.error("Question not found: %s", e)
             messages.error(
                 self.request, "The poll you are looking for does not exist."
                 )
@@ -129,12 +198,23 @@ class ResultsView(generic.DetailView):
         if self.object is None:
             return redirect('polls:index')
 
-        context = self.get_context_data(object=self.object)
+        results = results_cache.get_results(self.object)
+        results_table = results_cache.get_fragment(
+            self.object, 'table',
+            lambda: render_to_string(
+                'polls/results_table.html', {'results': results}
+                )
+            )
+        context = self.get_context_data(
+            object=self.object, results=results, results_table=results_table
+            )
         return self.render_to_response(context)
 
 
 # Get a logger instance
 logger = logging.getLogger('polls')
+# One line per vote; sampled by LOG_VOTE_SAMPLE_RATE
+vote_logger = logging.getLogger('polls.votes')
 
 
 @login_required
@@ -143,62 +223,173 @@ def vote(request, question_id):
     user = request.user
     ip_addr = get_client_ip(request)
 
-    logger.info(
-        f"User {user.username} voted from"
-        f" IP {ip_addr} on question {question_id}"
+    vote_logger.info(
+        "User %s voted from IP %s on question %s",
+        user.username, ip_addr, question_id,
+        extra={'user': user.username, 'ip': ip_addr, 'question': question_id},
     )
 
-    question = get_object_or_404(Question, pk=question_id)
+    # Load the choice together with its question in one query; the question
+    # is only looked up on its own when the choice is missing or invalid.
+    choice_id = request.POST.get('choice')
+    selected_choice = None
+    if choice_id:
+        try:
+            selected_choice = Choice.objects.select_related('question').filter(
+                pk=choice_id, question_id=question_id
+            ).first()
+        except ValidationError:
+            selected_choice = None
+    if selected_choice is not None:
+        question = selected_choice.question
+    else:
+        question = get_object_or_404(Question, pk=question_id)
 
     if not question.can_vote():
-        logger.warning(
-            f"User {user.username} tried to vote on a closed poll "
-            f"{question_id}"
+        vote_logger.warning(
+            "User %s tried to vote on a closed poll %s",
+            user.username, question_id,
         )
         messages.error(request, "This poll is not allowed for voting.")
         return render(request, 'polls/detail.html', {'question': question})
 
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except KeyError:
-        logger.warning(
-            f"Choice ID not found in POST data for user {user.username}"
+    if choice_id is None:
+        vote_logger.warning(
+            "Choice ID not found in POST data for user %s", user.username
             )
         messages.error(request, "You didn't select a valid choice.")
         return render(request, 'polls/detail.html', {'question': question})
-    except Choice.DoesNotExist:
-        logger.warning(
-            f"Invalid choice ID for question {question_id} "
-            f"by user {user.username}"
+    if selected_choice is None:
+        vote_logger.warning(
+            "Invalid choice ID for question %s by user %s",
+            question_id, user.username,
         )
         messages.error(request, "Invalid choice selection.")
         return render(request, 'polls/detail.html', {'question': question})
 
-    try:
-        vote = Vote.objects.get(user=user, choice_question=question)
-        vote.choice = selected_choice
-        vote.save()
+    # Buffered votes are not in the tallies yet, so their voters are sent
+    # to the detail page, which shows their pending choice, instead of
+    # results that would not include the vote.
+    next_page = 'polls:results'
+    if ingest.is_enabled():
+        previous_choice_id = ingest.queue_vote(user, selected_choice)
+        next_page = 'polls:detail'
+    else:
+        previous_choice_id = Vote.objects.cast(user, selected_choice)
+        pagecache.purge([question.pk])
+        live.publish([question.pk])
+    if previous_choice_id is not None:
         messages.success(
             request,
             f"Your vote was changed to '{selected_choice.choice_text}'"
         )
-        logger.info(
-            f"User {user.username} changed their vote for question "
-            f"{question_id} to '{selected_choice.choice_text}'"
-        )
-    except Vote.DoesNotExist:
-        Vote.objects.create(
-            user=user, choice=selected_choice, choice_question=question
+        vote_logger.info(
+            "User %s changed their vote for question %s to '%s'",
+            user.username, question_id, selected_choice.choice_text,
         )
+    else:
         messages.success(
             request, f"Your vote '{selected_choice.choice_text}' was recorded"
         )
-        logger.info(
-            f"User {user.username} voted for the first time on question "
-            f"{question_id} with '{selected_choice.choice_text}'"
+        vote_logger.info(
+            "User %s voted for the first time on question %s with '%s'",
+            user.username, question_id, selected_choice.choice_text,
+        )
+
+    return HttpResponseRedirect(reverse(next_page, args=(question.id,)))
+
+
+@staff_member_required
+def cache_stats(request):
+    """Return the results cache hit and miss counters as JSON."""
+    return JsonResponse(results_cache.stats())
+
+
+@staff_member_required
+def request_stats(request):
+    """Return the request metrics of this process per URL name as JSON."""
+    return JsonResponse(metrics.summary())
+
+
+@staff_member_required
+def export_data(request, kind):
+    """
+    Stream all votes or results as CSV or NDJSON.
+
+    Query parameters: `format` (csv or ndjson), `question` (repeatable),
+    `since` and `until` (ISO dates or datetimes) and `gzip=1`.
+    """
+    if kind not in export.EXPORTS:
+        raise Http404("Unknown export")
+    columns, rows = export.EXPORTS[kind]
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return HttpResponseBadRequest(f"Unknown format: {fmt}")
+    try:
+        filters = export.parse_filters(
+            request.GET.getlist('question'),
+            request.GET.get('since'), request.GET.get('until'),
+            )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    compress = request.GET.get('gzip') == '1'
+
+    chunks = export.encode(columns, rows(**filters), fmt, compress)
+    if isinstance(request, ASGIRequest):
+        chunks = export.aiterate(chunks)
+    filename = f"{kind}.{fmt}" + (".gz" if compress else "")
+    response = StreamingHttpResponse(
+        chunks,
+        content_type='application/gzip' if compress else export.FORMATS[fmt],
         )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _api_question(request, pk):
+    """
+    Return the published question of a results API request, or None.
+
+    The row is read once per request and shared by the conditional
+    checks and the view, so a 304 costs a single query.
+    """
+    if not hasattr(request, '_api_question'):
+        request._api_question = Question.objects.only(
+            'pub_date', 'results_version', 'results_updated'
+            ).filter(pk=pk, pub_date__lte=timezone.now()).first()
+    return request._api_question
+
+
+def _results_etag(request, pk):
+    """Return the ETag of a question's results: its id and version."""
+    question = _api_question(request, pk)
+    if question is not None:
+        return f"{question.pk}-{question.results_version}"
+    return None
+
+
+def _results_last_modified(request, pk):
+    """Return when the results of a question last changed."""
+    question = _api_question(request, pk)
+    if question is not None:
+        return question.results_updated or question.pub_date
+    return None
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=_results_etag, last_modified_func=_results_last_modified)
+def results_api(request, pk):
+    """
+    Return the results of a published question as JSON.
 
-    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+    Responses carry a strong ETag derived from the question's results
+    version and a Last-Modified header. Clients whose copy is current get
+    a 304 without the choices or votes being read.
+    """
+    question = _api_question(request, pk)
+    if question is None:
+        return JsonResponse({'detail': "Question not found."}, status=404)
+    return JsonResponse(results_cache.get_results(question).as_dict())
 
 
 def consent_submission(request):
@@ -236,7 +427,7 @@ def signup(request):
                     request,
                     f"Account created successfully! Welcome, {user.username}!"
                 )
-                logger.info(f"User {user.username} login.")
+                logger.info("User %s login.", user.username)
                 return redirect('polls:index')
 
             # Handle edge cases (e.g., backend misconfiguration)
@@ -292,7 +483,10 @@ def log_user_logged_in(sender, request, user, **kwargs):
         **kwargs: Additional keyword arguments.
     """
     ip_addr = get_client_ip(request)
-    logger.info(f"User {user.username} logged in from {ip_addr}")
+    logger.info(
+        "User %s logged in from %s", user.username, ip_addr,
+        extra={'user': user.username, 'ip': ip_addr},
+    )
 
 
 @receiver(user_logged_out)
@@ -307,7 +501,10 @@ def log_user_logged_out(sender, request, user, **kwargs):
         **kwargs: Additional keyword arguments.
     """
     ip_addr = get_client_ip(request)
-    logger.info(f"User {user.username} logged out from {ip_addr}")
+    logger.info(
+        "User %s logged out from %s", user.username, ip_addr,
+        extra={'user': user.username, 'ip': ip_addr},
+    )
 
 
 @receiver(user_login_failed)
@@ -323,7 +520,10 @@ def log_user_login_failed(sender, credentials, request, **kwargs):
     """
     ip_addr = get_client_ip(request)
     username = credentials.get('username', 'unknown')
-    logger.warning(f"Failed login attempt for {username} from {ip_addr}")
+    logger.warning(
+        "Failed login attempt for %s from %s", username, ip_addr,
+        extra={'user': username, 'ip': ip_addr},
+    )
 
 
 def get_client_ip(request):